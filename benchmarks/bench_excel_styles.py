@@ -0,0 +1,157 @@
+# benchmarks/bench_excel_styles.py
+"""
+Benchmark of excel_writer.apply_styles_to_sheet (merged cells + highlights) on a large synthetic schema.
+Compares the vectorized run-length implementation with the previous per-cell df.iloc implementation,
+checks that both emit the same worksheet calls, and prints the timings.
+
+Usage: python benchmarks/bench_excel_styles.py [--properties 20000] [--depth 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+import excel_writer # noqa: E402
+import schema_parser # noqa: E402
+
+SENSITIVITY_CYCLE = ["NOT_PERSONAL_DATA", "PERSONAL_DATA_HIGH_SENSITIVITY", "NOT_PERSONAL_DATA", "PERSONAL_DATA_MEDIUM_SENSITIVITY"]
+
+
+def _build_synthetic_schema(num_properties, depth):
+    """Nested 'properties' objects, with num_properties leaf properties spread over `depth` levels."""
+    def _build_level(level, budget):
+        properties = {}
+        if level == depth:
+            for idx in range(budget):
+                properties[f"field_{level}_{idx}"] = {"type": "string", "description": f"Synthetic field {idx} at level {level}."}
+            return properties
+        fan_out = max(2, int(round(budget ** (1.0 / (depth - level + 1)))))
+        per_child = max(1, budget // fan_out)
+        for idx in range(fan_out):
+            properties[f"group_{level}_{idx}"] = {"type": "object", "description": f"Group {idx}.", "properties": _build_level(level + 1, per_child)}
+        return properties
+    return {"type": "object", "properties": _build_level(1, num_properties)}
+
+
+def _legacy_apply_data_styles(worksheet, df, highlights_map, highlight_formats, data_format_default):
+    """Previous implementation (per-cell df.iloc lookups and forward scans), kept for comparison."""
+    for col_idx in range(len(df.columns)):
+        current_row_on_worksheet = 1
+        while current_row_on_worksheet <= len(df):
+            value_to_check = df.iloc[current_row_on_worksheet - 1, col_idx]
+            cell_format_to_use = data_format_default
+            highlight_key = (current_row_on_worksheet, col_idx)
+            if highlight_key in highlights_map and highlights_map[highlight_key] in highlight_formats:
+                cell_format_to_use = highlight_formats[highlights_map[highlight_key]]
+            if pd.isna(value_to_check):
+                worksheet.write(current_row_on_worksheet, col_idx, None, cell_format_to_use)
+                current_row_on_worksheet += 1; continue
+            count_identical = 1
+            for next_df_row_idx in range(current_row_on_worksheet, len(df)):
+                if df.iloc[next_df_row_idx, col_idx] == value_to_check:
+                    next_cell_format = data_format_default
+                    next_highlight_key = (next_df_row_idx + 1, col_idx)
+                    if next_highlight_key in highlights_map and highlights_map[next_highlight_key] in highlight_formats:
+                        next_cell_format = highlight_formats[highlights_map[next_highlight_key]]
+                    if cell_format_to_use != next_cell_format: break
+                    count_identical += 1
+                else: break
+            if count_identical > 1:
+                worksheet.merge_range(current_row_on_worksheet, col_idx, current_row_on_worksheet + count_identical - 1, col_idx, value_to_check, cell_format_to_use)
+            else:
+                worksheet.write(current_row_on_worksheet, col_idx, value_to_check, cell_format_to_use)
+            current_row_on_worksheet += count_identical
+    for col_idx, column_title in enumerate(df.columns):
+        max_len = len(str(column_title))
+        col_series = df[column_title].dropna()
+        if not col_series.empty:
+            current_col_max_len = col_series.astype(str).map(len).max()
+            if pd.notna(current_col_max_len): max_len = max(max_len, int(current_col_max_len))
+        worksheet.set_column(col_idx, col_idx, min(max(max_len + 5, 15), 70))
+
+
+class _RecordingWorksheet:
+    """Records write/merge_range/set_column calls, with formats reduced to their fill color."""
+    def __init__(self):
+        self.calls = []
+
+    def write(self, row, col, value, cell_format=None):
+        self.calls.append(("write", row, col, None if pd.isna(value) else value, str(getattr(cell_format, "fg_color", None))))
+
+    def merge_range(self, first_row, first_col, last_row, last_col, value, cell_format=None):
+        self.calls.append(("merge_range", first_row, first_col, last_row, last_col, value, str(getattr(cell_format, "fg_color", None))))
+
+    def set_column(self, first_col, last_col, width):
+        self.calls.append(("set_column", first_col, last_col, width))
+
+
+class _RecordingWriter:
+    """Minimal stand-in for pd.ExcelWriter exposing .book and .sheets."""
+    def __init__(self, workbook, sheet_name):
+        self.book = workbook
+        self.sheets = {sheet_name: _RecordingWorksheet()}
+
+
+def _prepare_sheet(num_properties, depth):
+    schema_data = _build_synthetic_schema(num_properties, depth)
+    collected_rows = schema_parser.flatten_schema_for_excel(schema_data)
+    field_registry = schema_parser.FieldRegistry()
+    field_ids = field_registry.add_file(
+        "Synthetic.json", schema_parser.extract_all_properties_with_descriptions(schema_data, filename_context="Synthetic.json")
+    )
+    analysis_results = {
+        field_id: {"pii_sensitivity_assessment": SENSITIVITY_CYCLE[idx % len(SENSITIVITY_CYCLE)]}
+        for idx, field_id in enumerate(field_ids)
+    }
+    max_cols_overall = max(len(row['keys']) for row in collected_rows) + 1
+    excel_df_data, cell_highlights = excel_writer._prepare_excel_sheet_data_and_highlights(
+        collected_rows, excel_writer._build_analyzed_path_index(analysis_results, field_registry).get("Synthetic.json"), max_cols_overall
+    )
+    column_names = [f"Level {i+1}" for i in range(max_cols_overall - 1)] + ["Schema Attribute Value"]
+    return pd.DataFrame(excel_df_data, columns=column_names), cell_highlights
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--properties", type=int, default=20000)
+    parser.add_argument("--depth", type=int, default=4)
+    args = parser.parse_args()
+
+    df, cell_highlights = _prepare_sheet(args.properties, args.depth)
+    print(f"Synthetic sheet: {df.shape[0]} rows x {df.shape[1]} columns, {len(cell_highlights)} highlighted cells.")
+
+    import xlsxwriter
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workbook = xlsxwriter.Workbook(os.path.join(tmp_dir, "bench.xlsx"))
+        data_format_default = workbook.add_format({'border': 1, 'valign': 'vcenter'})
+        highlight_formats = {color: workbook.add_format({'border': 1, 'valign': 'vcenter', 'fg_color': color})
+                             for color in set(cell_highlights.values())}
+
+        legacy_worksheet = _RecordingWorksheet()
+        started_at = time.perf_counter()
+        _legacy_apply_data_styles(legacy_worksheet, df, cell_highlights, highlight_formats, data_format_default)
+        legacy_seconds = time.perf_counter() - started_at
+
+        recording_writer = _RecordingWriter(workbook, "Synthetic")
+        started_at = time.perf_counter()
+        excel_writer.apply_styles_to_sheet(recording_writer, df, "Synthetic", cell_highlights)
+        vectorized_seconds = time.perf_counter() - started_at
+        workbook.close()
+
+    # The current implementation also writes the header row and sets each column width right after the
+    # column's cells (call order does not change the file); compare only data cells and widths, as multisets
+    vectorized_calls = [call for call in recording_writer.sheets["Synthetic"].calls if not (call[0] == "write" and call[1] == 0)]
+    identical = sorted(map(repr, vectorized_calls)) == sorted(map(repr, legacy_worksheet.calls))
+    print(f"Legacy per-cell implementation: {legacy_seconds:.3f}s")
+    print(f"Vectorized run-length implementation: {vectorized_seconds:.3f}s")
+    print(f"Speedup: {legacy_seconds / max(vectorized_seconds, 1e-9):.1f}x | identical worksheet calls: {identical}")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# benchmarks/bench_field_registry.py
+"""
+Memory and time benchmark of the field registry (schema_parser.FieldRegistry) on a synthetic schema corpus.
+Compares the previous string-keyed representation ('filename::path' keys in the merged properties, fragments and
+$ref alias maps) with the registry (integer field ids, interned path segments and descriptions), measuring the
+memory retained after Phase 1 (tracemalloc), the build time, the grouping time and a writer-style path index pass,
+and checks that both produce the same equivalence classes.
+
+Usage: python benchmarks/bench_field_registry.py [--properties 100000] [--files 50]
+"""
+import argparse
+import gc
+import os
+import pickle
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "src"))
+sys.path.insert(0, BENCH_DIR)
+import schema_parser # noqa: E402
+import synthetic_schemas # noqa: E402
+
+
+def _ingest_corpus(schema_paths):
+    """Phase 1 extraction of every file, pickled as the process pool returns it (fresh strings per file)."""
+    ingested = []
+    for schema_path in schema_paths:
+        filename, file_data, file_properties_with_desc, _ = schema_parser.ingest_schema_file(schema_path, streaming_mode=True)
+        ingested.append((filename, file_properties_with_desc, file_data['property_fragments'], file_data['ref_aliases']))
+    return pickle.dumps(ingested)
+
+
+def _build_legacy(ingested):
+    all_properties, all_fragments, all_ref_aliases = {}, {}, {}
+    for _, file_properties_with_desc, property_fragments, ref_aliases in ingested:
+        all_properties.update(file_properties_with_desc)
+        all_fragments.update(property_fragments)
+        all_ref_aliases.update(ref_aliases)
+    return all_properties, all_fragments, all_ref_aliases
+
+
+def _build_registry(ingested):
+    field_registry = schema_parser.FieldRegistry()
+    for filename, file_properties_with_desc, property_fragments, ref_aliases in ingested:
+        field_registry.add_file(filename, file_properties_with_desc, property_fragments, ref_aliases)
+    return field_registry
+
+
+def _legacy_group(all_properties, all_fragments, all_ref_aliases):
+    """Previous group_equivalent_properties: the field name is split out of every 'filename::path' key."""
+    canonical_keys = set(all_ref_aliases.values())
+    classes_by_signature = {}
+    for unique_key, description_text in all_properties.items():
+        canonical_key = all_ref_aliases.get(unique_key, unique_key if unique_key in canonical_keys else None)
+        if canonical_key is not None:
+            classes_by_signature.setdefault(("$ref", canonical_key), []).append(unique_key)
+            continue
+        field_name = unique_key.split("::", 1)[1].split('.')[-1]
+        signature = (schema_parser._normalize_field_name(field_name), schema_parser._normalize_description(description_text),
+                     all_fragments.get(unique_key))
+        classes_by_signature.setdefault(signature, []).append(unique_key)
+    return list(classes_by_signature.values())
+
+
+def _legacy_path_index(all_properties):
+    """Previous writer path index: {filename: set of path prefixes}, from split keys."""
+    analyzed_paths_by_file = {}
+    for unique_key in all_properties:
+        filename, path_string = unique_key.split("::", 1)
+        path_parts = path_string.split('.')
+        file_paths = analyzed_paths_by_file.setdefault(filename, set())
+        for depth in range(1, len(path_parts) + 1):
+            file_paths.add(tuple(path_parts[:depth]))
+    return analyzed_paths_by_file
+
+
+def _registry_path_index(field_registry):
+    analyzed_paths_by_file = {}
+    for field_id in field_registry.field_ids():
+        field_record = field_registry.record(field_id)
+        file_paths = analyzed_paths_by_file.setdefault(field_registry.file_name(field_id), set())
+        for depth in range(1, len(field_record.path) + 1):
+            file_paths.add(field_record.path[:depth])
+    return analyzed_paths_by_file
+
+
+def _measure_build(pickled_corpus, build):
+    """
+    (structure, retained bytes, build seconds). The memory is traced on a first build, after the ingested results
+    are dropped (only the built structure is kept); the time is taken on a second, untraced build.
+    """
+    gc.collect()
+    tracemalloc.start()
+    ingested = pickle.loads(pickled_corpus)
+    structure = build(ingested)
+    del ingested
+    gc.collect()
+    retained_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del structure
+    ingested = pickle.loads(pickled_corpus)
+    started_at = time.perf_counter()
+    structure = build(ingested)
+    return structure, retained_bytes, time.perf_counter() - started_at
+
+
+def _timed(function, *args):
+    schema_parser._normalize_field_name.cache_clear()
+    started_at = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started_at
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--properties", type=int, default=100000)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--width", type=int, default=8)
+    parser.add_argument("--depth", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        schema_paths = synthetic_schemas.generate_schema_set(corpus_dir, args.properties, args.files, args.width, args.depth)
+        pickled_corpus = _ingest_corpus(schema_paths)
+
+    legacy_maps, legacy_bytes, legacy_build_seconds = _measure_build(pickled_corpus, _build_legacy)
+    field_registry, registry_bytes, registry_build_seconds = _measure_build(pickled_corpus, _build_registry)
+
+    legacy_classes, legacy_group_seconds = _timed(_legacy_group, *legacy_maps)
+    registry_classes, registry_group_seconds = _timed(schema_parser.group_equivalent_properties, field_registry)
+    legacy_paths, legacy_index_seconds = _timed(_legacy_path_index, legacy_maps[0])
+    registry_paths, registry_index_seconds = _timed(_registry_path_index, field_registry)
+
+    identical_classes = [[field_registry.unique_key(field_id) for field_id in property_class] for property_class in registry_classes] == legacy_classes
+    identical_paths = registry_paths == legacy_paths
+    print(f"{len(field_registry)} properties in {len(schema_paths)} files, {len(registry_classes)} equivalence classes.")
+    print(f"{'':<28}{'string keys':>14}{'field registry':>16}")
+    print(f"{'Retained after Phase 1 (MB)':<28}{legacy_bytes / 2**20:>14.1f}{registry_bytes / 2**20:>16.1f}")
+    print(f"{'Build (s)':<28}{legacy_build_seconds:>14.3f}{registry_build_seconds:>16.3f}")
+    print(f"{'Grouping (s)':<28}{legacy_group_seconds:>14.3f}{registry_group_seconds:>16.3f}")
+    print(f"{'Writer path index (s)':<28}{legacy_index_seconds:>14.3f}{registry_index_seconds:>16.3f}")
+    print(f"Memory ratio: {legacy_bytes / max(registry_bytes, 1):.2f}x | identical classes: {identical_classes} | identical path index: {identical_paths}")
+    if not (identical_classes and identical_paths):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
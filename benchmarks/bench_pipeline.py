@@ -0,0 +1,279 @@
+# benchmarks/bench_pipeline.py
+"""
+End-to-end pipeline benchmark on synthetic schemas against the local stub Ollama server.
+Times Phase 1 (parsing), grouping, Phase 2 (dispatch) and Phase 3 (Excel generation) separately and writes
+a machine-readable JSON report (default: benchmarks/results/pipeline_<timestamp>.json).
+
+Usage: python benchmarks/bench_pipeline.py [--properties 1000] [--files 10] [--width 8] [--depth 3]
+           [--latency 0.02] [--jitter 0.01] [--error-rate 0.0] [--malformed-rate 0.0]
+           [--batch-size 5] [--max-in-flight 4] [--no-pre-classifier] [--streaming-flatten] [--pipelined]
+           [--endpoints 1] [--endpoint-latency-step 0.0] [--outage-at SECONDS] [--outage-seconds 3.0]
+           [--time-budget SECONDS] [--request-budget N] [--schema-order] [--similarity-threshold 0.95] [--report PATH]
+With --endpoints N, N stub servers share the run through ollama_analyzer's endpoint pool (the i-th one is
+slower by i x --endpoint-latency-step); --outage-at stops the last one that many seconds after the stub servers
+start and starts it again on the same port --outage-seconds later, to exercise re-dispatch and re-admission.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, os.path.join(PROJECT_ROOT_DIR, "src"))
+import cache_store # noqa: E402
+import excel_writer # noqa: E402
+import main as pipeline # noqa: E402
+import ollama_analyzer # noqa: E402
+import run_metrics # noqa: E402
+import schema_parser # noqa: E402
+from stub_ollama_server import StubOllamaServer # noqa: E402
+from synthetic_schemas import generate_schema_set # noqa: E402
+
+DEFAULT_RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError: # Not available on Windows
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _run_phases(args, schema_dir, work_dir, report_path):
+    """Phase 1, grouping, Phase 2 and Phase 3 one after the other; returns (phase_seconds, properties, class count, phase2_stats, results)."""
+    pre_classifier_threshold = None if args.no_pre_classifier else pipeline.PRE_CLASSIFIER_CONFIDENCE_THRESHOLD
+    phase_seconds = {}
+    phase2_stats = {}
+    metrics = run_metrics.start_run_metrics("bench")
+    started_at = time.perf_counter()
+    field_registry, parsed_files_data = pipeline._collect_properties_for_analysis(schema_dir)
+    phase_seconds["phase1_parse"] = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    property_classes = pipeline._group_properties_for_analysis(field_registry)
+    phase_seconds["grouping"] = time.perf_counter() - started_at
+
+    analysis_cache = cache_store.SqliteCacheBackend(db_path=os.path.join(work_dir, "cache.sqlite3"))
+    started_at = time.perf_counter()
+    try:
+        analysis_results = pipeline._run_ollama_analysis_phase(
+            field_registry, analysis_cache, False, property_classes, pre_classifier_threshold, phase2_stats=phase2_stats
+        )
+    finally:
+        analysis_cache.close()
+    phase_seconds["phase2_dispatch"] = time.perf_counter() - started_at
+    phase2_stats["similarity_reused"] = metrics.counters.get("similarity_reused", 0) + metrics.counters.get("similarity_followers", 0)
+
+    property_class_sizes = {field_id: len(members) for members in property_classes for field_id in members}
+    started_at = time.perf_counter()
+    excel_writer.generate_excel_report(report_path, parsed_files_data, analysis_results, field_registry, property_class_sizes)
+    phase_seconds["phase3_excel"] = time.perf_counter() - started_at
+    phase_seconds["total"] = sum(phase_seconds.values())
+    return phase_seconds, field_registry, len(property_classes), phase2_stats, analysis_results
+
+
+def _run_pipelined_phases(args, schema_dir, work_dir, report_path):
+    """
+    Same run through main's PIPELINED_MODE. Phase times come from the run metrics and overlap (phase1_parse and
+    phase2_dispatch start together); "total" is the end-to-end wall time. Equivalence classes are not counted.
+    """
+    pipeline.JSON_FILES_DIR_CONFIG = schema_dir
+    pipeline.PRE_CLASSIFIER_ENABLED = not args.no_pre_classifier
+    pipeline.PIPELINED_PARTIAL_RESULTS = False
+    pipeline.RUN_METRICS_ENABLED = False # Collected in memory only, not written to the project's run_metrics/
+    cache_path = os.path.join(work_dir, "cache.sqlite3")
+    cache_store.open_cache_backend = lambda backend_name: cache_store.SqliteCacheBackend(db_path=cache_path)
+    metrics = run_metrics.start_run_metrics("bench_pipelined")
+    started_at = time.perf_counter()
+    analysis_results = pipeline._run_pipelined(False, "bench", report_path, metrics)
+    bench_phase_names = {"phase1_collect": "phase1_parse", "phase2_analysis": "phase2_dispatch"}
+    phase_seconds = {bench_phase_names.get(record["name"], record["name"]): record["seconds"] for record in metrics.records if record["type"] == "phase"}
+    phase_seconds["total"] = time.perf_counter() - started_at
+    phase2_stats = {
+        "llm_fields_analyzed": metrics.counters.get("llm_fields_analyzed", 0), "llm_errors": metrics.counters.get("llm_errors", 0),
+        "retries": metrics.counters.get("retried_requests", 0), "unresolved_transient_failures": metrics.counters.get("unresolved_transient_failures", 0),
+        "pending_fields": metrics.counters.get("budget_pending_fields", 0),
+        "similarity_reused": metrics.counters.get("similarity_reused", 0) + metrics.counters.get("similarity_followers", 0)
+    }
+    return phase_seconds, analysis_results, None, phase2_stats, analysis_results
+
+
+def run_benchmark(args, work_dir):
+    schema_dir = os.path.join(work_dir, "schemas")
+    schema_paths = generate_schema_set(schema_dir, args.properties, args.files, args.width, args.depth, args.seed)
+
+    pipeline.FIELD_BATCH_SIZE = args.batch_size
+    pipeline.PHASE2_MAX_IN_FLIGHT_REQUESTS = args.max_in_flight
+    pipeline.STREAMING_FLATTEN_MODE = args.streaming_flatten
+    pipeline.PHASE2_PRIORITY_ORDER = not args.schema_order
+    pipeline.PHASE2_TIME_BUDGET_SECONDS = args.time_budget
+    pipeline.PHASE2_REQUEST_BUDGET = args.request_budget
+    pipeline.SIMILARITY_REUSE_ENABLED = args.similarity_threshold is not None
+    pipeline.SIMILARITY_THRESHOLD = args.similarity_threshold
+    pipeline.SIMILARITY_INDEX_DIR = os.path.join(work_dir, "similarity_index") # Empty: only same-run near-duplicates are reused
+
+    stub_servers = [
+        StubOllamaServer(latency=args.latency + endpoint_index * args.endpoint_latency_step, jitter=args.jitter, error_rate=args.error_rate,
+                         malformed_rate=args.malformed_rate, seed=args.seed + endpoint_index).start()
+        for endpoint_index in range(args.endpoints)
+    ]
+    stopped_stub_stats = []
+    outage_timers = []
+
+    def _stop_last_endpoint():
+        stopped_server = stub_servers[-1]
+        stopped_server.stop()
+        stopped_stub_stats.append(dict(stopped_server.stats))
+        restart_timer = threading.Timer(args.outage_seconds, _restart_last_endpoint, args=(stopped_server.port,))
+        restart_timer.daemon = True
+        outage_timers.append(restart_timer)
+        restart_timer.start()
+
+    def _restart_last_endpoint(port):
+        stub_servers[-1] = StubOllamaServer(port=port, latency=args.latency + (args.endpoints - 1) * args.endpoint_latency_step,
+                                            jitter=args.jitter, error_rate=args.error_rate, malformed_rate=args.malformed_rate).start()
+
+    try:
+        chat_endpoints = [stub_server.chat_endpoint for stub_server in stub_servers]
+        ollama_analyzer.OLLAMA_CHAT_ENDPOINT = chat_endpoints[0]
+        ollama_analyzer.OLLAMA_CHAT_ENDPOINTS = chat_endpoints
+        ollama_analyzer.OLLAMA_HEALTH_CHECK_INTERVAL_SECONDS = args.health_check_interval
+        ollama_analyzer._default_client = None # Rebuilt on first use with the stub endpoint(s)
+        if args.outage_at is not None:
+            outage_timer = threading.Timer(args.outage_at, _stop_last_endpoint)
+            outage_timer.daemon = True
+            outage_timers.append(outage_timer)
+            outage_timer.start()
+
+        log_path = os.path.join(work_dir, "pipeline.log")
+        report_path = os.path.join(work_dir, "report.xlsx")
+        with open(log_path, 'w', encoding='utf-8') as log_file, contextlib.redirect_stdout(sys.stdout if args.verbose else log_file):
+            run_phases = _run_pipelined_phases if args.pipelined else _run_phases
+            phase_seconds, properties_map, class_count, phase2_stats, analysis_results = run_phases(args, schema_dir, work_dir, report_path)
+    finally:
+        for outage_timer in outage_timers:
+            outage_timer.cancel()
+        for stub_server in stub_servers:
+            with contextlib.suppress(Exception): # Already stopped by an outage that was not restarted
+                stub_server.stop()
+    stub_stats = [dict(stub_server.stats) for stub_server in stub_servers]
+    if stopped_stub_stats: # Requests served before the outage
+        for stat_name, stat_value in stopped_stub_stats[0].items():
+            stub_stats[-1][stat_name] = max(stub_stats[-1][stat_name], stat_value) if stat_name == "max_in_flight" else stub_stats[-1][stat_name] + stat_value
+    ollama_client = ollama_analyzer.get_ollama_client()
+    connection_stats = ollama_client.get_connection_stats()
+    ollama_client.close()
+
+    return {
+        "benchmark": "pipeline",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": _git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "json_decoder": "orjson" if schema_parser.orjson else "json",
+            "ijson_available": schema_parser.ijson is not None
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("report", "verbose", "keep_work_dir")},
+        "counts": {
+            "schema_files": len(schema_paths),
+            "properties": len(properties_map),
+            "equivalence_classes": class_count,
+            "llm_fields_analyzed": phase2_stats.get("llm_fields_analyzed", 0),
+            "llm_errors": phase2_stats.get("llm_errors", 0),
+            "retried_requests": phase2_stats.get("retries", 0) + phase2_stats.get("final_pass_items", 0),
+            "unresolved_transient_failures": phase2_stats.get("unresolved_transient_failures", 0),
+            "pending_fields": phase2_stats.get("pending_fields", 0),
+            "similarity_reused": phase2_stats.get("similarity_reused", 0),
+            "properties_with_results": len(analysis_results)
+        },
+        "phase_seconds": {phase: round(seconds, 4) for phase, seconds in phase_seconds.items()},
+        "throughput": {
+            "phase1_properties_per_second": round(len(properties_map) / phase_seconds["phase1_parse"], 1) if phase_seconds["phase1_parse"] else None,
+            "phase2_fields_per_second": round(phase2_stats.get("llm_fields_analyzed", 0) / phase_seconds["phase2_dispatch"], 1) if phase_seconds["phase2_dispatch"] else None,
+            "phase3_properties_per_second": round(len(properties_map) / phase_seconds["phase3_excel"], 1) if phase_seconds["phase3_excel"] else None
+        },
+        "ollama_client": connection_stats,
+        "stub_server": stub_stats[0] if len(stub_stats) == 1 else stub_stats,
+        "report_size_bytes": os.path.getsize(report_path),
+        "peak_rss_mb": _peak_rss_mb()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--properties", type=int, default=1000, help="Total properties over all synthetic schemas (100 to 100000).")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--width", type=int, default=8, help="Properties per nested object.")
+    parser.add_argument("--depth", type=int, default=3, help="Maximum nesting depth.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.02, help="Stub seconds per chat request.")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--batch-size", type=int, default=pipeline.FIELD_BATCH_SIZE)
+    parser.add_argument("--max-in-flight", type=int, default=pipeline.PHASE2_MAX_IN_FLIGHT_REQUESTS)
+    parser.add_argument("--no-pre-classifier", action="store_true", help="Send every field to the (stub) model.")
+    parser.add_argument("--streaming-flatten", action="store_true")
+    parser.add_argument("--pipelined", action="store_true", help="Overlap parsing, dispatch and sheet writing (main.PIPELINED_MODE).")
+    parser.add_argument("--endpoints", type=int, default=1, help="Stub servers behind the Ollama endpoint pool.")
+    parser.add_argument("--endpoint-latency-step", type=float, default=0.0, help="Extra stub latency per endpoint index (uneven endpoints).")
+    parser.add_argument("--outage-at", type=float, help="Seconds after start at which the last endpoint goes down.")
+    parser.add_argument("--outage-seconds", type=float, default=3.0, help="Downtime of the last endpoint before it is restarted.")
+    parser.add_argument("--health-check-interval", type=float, default=1.0, help="Endpoint pool health-check period (seconds).")
+    parser.add_argument("--time-budget", type=float, help="Phase 2 wall-clock budget in seconds (main.PHASE2_TIME_BUDGET_SECONDS).")
+    parser.add_argument("--request-budget", type=int, help="Phase 2 chat request budget (main.PHASE2_REQUEST_BUDGET).")
+    parser.add_argument("--schema-order", action="store_true", help="Dispatch in schema order instead of PII likelihood.")
+    parser.add_argument("--similarity-threshold", type=float, help="Enable the similarity tier (stub embeddings) with this threshold.")
+    parser.add_argument("--report", help="JSON report path (default: benchmarks/results/pipeline_<timestamp>.json).")
+    parser.add_argument("--keep-work-dir", action="store_true", help="Keep the generated schemas, cache, log and workbook.")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline output instead of logging it to the work dir.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    try:
+        benchmark_report = run_benchmark(args, work_dir)
+    finally:
+        if not args.keep_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if args.keep_work_dir:
+        benchmark_report["work_dir"] = work_dir
+
+    report_path = args.report or os.path.join(DEFAULT_RESULTS_DIR, f"pipeline_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(benchmark_report, f, indent=2)
+
+    class_count = benchmark_report['counts']['equivalence_classes']
+    pending_fields = benchmark_report['counts']['pending_fields']
+    print(f"Properties: {benchmark_report['counts']['properties']} in {benchmark_report['counts']['schema_files']} files, "
+          f"{f'{class_count} classes, ' if class_count is not None else ''}{benchmark_report['counts']['llm_fields_analyzed']} LLM fields"
+          f"{f', {pending_fields} pending (budget)' if pending_fields else ''}.")
+    for phase, seconds in benchmark_report["phase_seconds"].items():
+        print(f"  {phase:<18} {seconds:9.3f}s")
+    for endpoint_stats in benchmark_report["ollama_client"].get("endpoints", []):
+        print(f"  {endpoint_stats['endpoint']}: {endpoint_stats['requests_completed']} requests, {endpoint_stats['requests_per_second']} req/s, "
+              f"mean latency {endpoint_stats['mean_latency_s']}s, dropped {endpoint_stats['times_dropped']}x, re-admitted {endpoint_stats['times_readmitted']}x")
+    print(f"Report written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# benchmarks/stub_ollama_server.py
+"""
+Local stand-in for the Ollama /api/chat endpoint, for benchmarks without a real model.
+Answers single-field and batched prompts (streamed or not) with keyword-based verdicts, after a configurable
+latency with jitter, and injects HTTP 503 errors and malformed JSON at configurable rates.
+/api/embed returns hashed bag-of-words vectors, so texts sharing most words are close (cosine similarity).
+
+Usage: python benchmarks/stub_ollama_server.py [--port 11434] [--latency 0.05] [--jitter 0.02] [--error-rate 0.0] [--malformed-rate 0.0]
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PERSONAL_FIELD_KEYWORDS = ["email", "name", "phone", "address", "birth", "user", "person", "ip"]
+STREAM_CHUNK_CHARS = 8 # Characters of content per streamed chunk (a real server streams one token per chunk)
+EMBEDDING_DIMENSIONS = 256
+_FIELD_NAME_PATTERN = re.compile(r"^Final Key Name: (.*)$", re.MULTILINE)
+_WORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+
+def _verdict_for_field(field_name):
+    is_personal = any(keyword in field_name.lower() for keyword in PERSONAL_FIELD_KEYWORDS)
+    return {
+        "pii_sensitivity_assessment": "PERSONAL_DATA_MEDIUM_SENSITIVITY" if is_personal else "NOT_PERSONAL_DATA",
+        "gdpr_justification": f"Stub verdict for '{field_name}'."
+    }
+
+
+def build_stub_embedding(text):
+    """Hashed bag-of-words vector of a text (one dimension per word hash, counts as values)."""
+    embedding = [0.0] * EMBEDDING_DIMENSIONS
+    for word in _WORD_PATTERN.findall(text):
+        embedding[zlib.crc32(word.lower().encode()) % EMBEDDING_DIMENSIONS] += 1.0
+    return embedding
+
+
+class _QuietThreadingHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return # Client closed a pooled connection (or stopped reading a stream early)
+        super().handle_error(request, client_address)
+
+
+def build_stub_answer(user_message_content):
+    """Verdict JSON text for a prompt: a "verdicts" array for batched prompts, a single verdict otherwise."""
+    batch_fields = []
+    for line in user_message_content.splitlines():
+        if line.startswith("{"):
+            try:
+                field_line = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(field_line, dict) and "field_id" in field_line and "field_name" in field_line:
+                batch_fields.append(field_line)
+    if batch_fields:
+        return json.dumps({"verdicts": [
+            dict(_verdict_for_field(field_line["field_name"]), field_id=field_line["field_id"]) for field_line in batch_fields
+        ]})
+    field_name_match = _FIELD_NAME_PATTERN.search(user_message_content)
+    return json.dumps(_verdict_for_field(field_name_match.group(1) if field_name_match else ""))
+
+
+class StubOllamaServer:
+    """Threaded stub server; use as a context manager or call start()/stop(). Counters are in .stats."""
+
+    def __init__(self, port=0, latency=0.05, jitter=0.0, error_rate=0.0, malformed_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.random = random.Random(seed)
+        self.stats = {"chat_requests": 0, "embed_requests": 0, "errors_sent": 0, "malformed_sent": 0, "max_in_flight": 0}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._server = _QuietThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def chat_endpoint(self):
+        return f"http://127.0.0.1:{self.port}/api/chat"
+
+    def _draw(self):
+        """(delay, send_error, send_malformed) for one request."""
+        with self._lock:
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            return delay, self.random.random() < self.error_rate, self.random.random() < self.malformed_rate
+
+    def _make_handler(self):
+        stub = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status_code, body_obj):
+                body = json.dumps(body_obj).encode()
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._send_json(200, {"models": []})
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.endswith("/api/embed"):
+                    embed_inputs = payload.get("input") or []
+                    with stub._lock:
+                        stub.stats["embed_requests"] += 1
+                    self._send_json(200, {"model": payload.get("model"), "embeddings": [
+                        build_stub_embedding(text) for text in ([embed_inputs] if isinstance(embed_inputs, str) else embed_inputs)
+                    ]})
+                    return
+                messages = payload.get("messages") or []
+                if not messages: # Warm-up / unload request
+                    self._send_json(200, {"model": payload.get("model"), "done": True})
+                    return
+
+                delay, send_error, send_malformed = stub._draw()
+                with stub._lock:
+                    stub.stats["chat_requests"] += 1
+                    stub._in_flight += 1
+                    stub.stats["max_in_flight"] = max(stub.stats["max_in_flight"], stub._in_flight)
+                try:
+                    time.sleep(delay)
+                finally:
+                    with stub._lock:
+                        stub._in_flight -= 1
+                if send_error:
+                    with stub._lock:
+                        stub.stats["errors_sent"] += 1
+                    self._send_json(503, {"error": "stub overloaded"})
+                    return
+
+                answer = build_stub_answer(messages[-1].get("content", ""))
+                if send_malformed:
+                    with stub._lock:
+                        stub.stats["malformed_sent"] += 1
+                    answer = answer[:len(answer) // 2] # Truncated JSON
+                completion_tokens = max(1, len(answer) // 4)
+                prompt_tokens = max(1, sum(len(message.get("content", "")) for message in messages) // 4)
+                final_fields = { # Server-side counts and durations (nanoseconds), as reported by Ollama
+                    "done": True, "prompt_eval_count": prompt_tokens, "eval_count": completion_tokens,
+                    "load_duration": 0, "prompt_eval_duration": int(delay * 0.2e9), "eval_duration": int(delay * 0.8e9), "total_duration": int(delay * 1e9)
+                }
+                if not payload.get("stream"):
+                    self._send_json(200, dict(final_fields, message={"role": "assistant", "content": answer}))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for start_index in range(0, len(answer), STREAM_CHUNK_CHARS):
+                        self._write_chunk({"message": {"role": "assistant", "content": answer[start_index:start_index + STREAM_CHUNK_CHARS]}, "done": False})
+                    self._write_chunk(dict(final_fields, message={"role": "assistant", "content": ""}))
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass # The client stopped reading once it had a complete verdict
+
+            def _write_chunk(self, chunk_obj):
+                chunk_bytes = (json.dumps(chunk_obj) + "\n").encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk_bytes), chunk_bytes))
+                self.wfile.flush()
+
+        return _Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per chat request.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- jitter in seconds.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 503.")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of answers with truncated JSON.")
+    args = parser.parse_args()
+    stub_server = StubOllamaServer(args.port, args.latency, args.jitter, args.error_rate, args.malformed_rate)
+    print(f"Stub Ollama server listening on {stub_server.chat_endpoint}")
+    try:
+        stub_server._server.serve_forever()
+    except KeyboardInterrupt:
+        stub_server.stop()
+
+
+if __name__ == "__main__":
+    main()
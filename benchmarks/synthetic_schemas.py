@@ -0,0 +1,99 @@
+# benchmarks/synthetic_schemas.py
+"""
+Generator of synthetic Smart-Data-Models-like JSON schemas (allOf + properties, nested objects and arrays,
+descriptions on every property) for benchmarks, from a hundred to hundreds of thousands of properties.
+
+Usage: python benchmarks/synthetic_schemas.py OUTPUT_DIR [--properties 1000] [--files 10] [--width 8] [--depth 3] [--seed 0]
+"""
+import argparse
+import json
+import os
+import random
+
+FIELD_WORDS = [
+    "temperature", "status", "category", "dateObserved", "speed", "serialNumber", "owner", "email", "name",
+    "address", "phone", "deviceId", "location", "refDevice", "batteryLevel", "firmwareVersion", "userId",
+    "description", "alertSource", "severity", "routeColor", "stopName", "birthDate", "ipAddress", "value"
+]
+LEAF_TYPES = ["string", "number", "integer", "boolean"]
+NESTED_OBJECT_PROBABILITY = 0.2
+ARRAY_OF_OBJECTS_PROBABILITY = 0.1
+
+
+def _build_properties(rng, level, depth, width, budget):
+    """Builds a 'properties' object of at most `width` entries (and at most budget[0] properties in total)."""
+    properties = {}
+    for index in range(width):
+        if budget[0] <= 0:
+            break
+        field_name = f"{rng.choice(FIELD_WORDS)}{level}_{index}"
+        budget[0] -= 1
+        draw = rng.random()
+        if level < depth and budget[0] > 1 and draw < NESTED_OBJECT_PROBABILITY + ARRAY_OF_OBJECTS_PROBABILITY:
+            nested = {"type": "object", "properties": _build_properties(rng, level + 1, depth, width, budget)}
+            if draw < NESTED_OBJECT_PROBABILITY:
+                properties[field_name] = dict(nested, description=f"Property. Structured value of {field_name}.")
+            else:
+                properties[field_name] = {"type": "array", "description": f"Property. List of {field_name} entries.", "items": nested}
+        else:
+            properties[field_name] = {"type": rng.choice(LEAF_TYPES), "description": f"Property. Observed {field_name} at level {level}."}
+    return properties
+
+
+def generate_schema(entity_type, num_properties, width=8, depth=3, seed=0):
+    """One schema with num_properties properties (including 'id' and 'type'), nested up to `depth` levels."""
+    rng = random.Random(f"{seed}-{entity_type}")
+    budget = [max(0, num_properties - 2)]
+    model_properties = {}
+    block_index = 0
+    while budget[0] > 0: # Top level keeps growing until the property budget is spent
+        for field_name, field_schema in _build_properties(rng, 1, depth, width, budget).items():
+            model_properties[f"{field_name}_{block_index}"] = field_schema
+        block_index += 1
+    return {
+        "$schema": "http://json-schema.org/schema#",
+        "$id": f"https://example.org/synthetic/{entity_type}/schema.json",
+        "title": f"Synthetic - {entity_type}",
+        "description": f"Synthetic data model {entity_type} generated for benchmarks.",
+        "type": "object",
+        "allOf": [
+            {"properties": {
+                "id": {"type": "string", "description": "Property. Unique identifier of the entity."},
+                "type": {"type": "string", "enum": [entity_type], "description": f"Property. NGSI Entity type. It has to be {entity_type}."}
+            }},
+            {"properties": model_properties}
+        ],
+        "required": ["id", "type"]
+    }
+
+
+def generate_schema_set(output_dir, total_properties, num_files=10, width=8, depth=3, seed=0):
+    """Writes num_files schemas sharing total_properties properties into output_dir. Returns the file paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    num_files = max(1, min(num_files, total_properties // 3 or 1))
+    schema_paths = []
+    for file_index in range(num_files):
+        file_properties = total_properties // num_files + (1 if file_index < total_properties % num_files else 0)
+        entity_type = f"Synthetic{file_index:04d}"
+        schema_path = os.path.join(output_dir, f"{entity_type}.json")
+        with open(schema_path, 'w', encoding='utf-8') as f:
+            json.dump(generate_schema(entity_type, file_properties, width, depth, seed), f, indent=2)
+        schema_paths.append(schema_path)
+    return schema_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output_dir")
+    parser.add_argument("--properties", type=int, default=1000)
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--width", type=int, default=8)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    schema_paths = generate_schema_set(args.output_dir, args.properties, args.files, args.width, args.depth, args.seed)
+    print(f"{len(schema_paths)} schemas with {args.properties} properties written to {args.output_dir}.")
+
+
+if __name__ == "__main__":
+    main()
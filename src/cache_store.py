@@ -0,0 +1,254 @@
+# src/cache_store.py
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import dispatcher
+import run_metrics
+import utils
+
+SQLITE_CACHE_FILE = "ollama_analysis_cache.sqlite3"
+CACHE_BACKENDS = ["json", "sqlite"]
+
+
+def _source_file_of(unique_key):
+    return unique_key.split("::", 1)[0] if unique_key and "::" in unique_key else None
+
+
+class JsonCacheBackend:
+    """
+    Original whole-file JSON cache (ollama_analysis_cache.json).
+    Entries are kept in memory and the whole file is rewritten on flush().
+    """
+    name = "json"
+    requires_periodic_flush = True
+
+    def __init__(self):
+        self.entries = utils.load_ollama_cache()
+        self.failed_entries = {}
+        self._lock = threading.Lock() # put() from request threads while flush() writes the file (service mode)
+
+    def __contains__(self, cache_key):
+        return cache_key in self.entries
+
+    def __getitem__(self, cache_key):
+        return self.entries[cache_key]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, cache_key, default=None):
+        return self.entries.get(cache_key, default)
+
+    def items(self):
+        return self.entries.items()
+
+    def put(self, cache_key, analysis_result, unique_key=None):
+        with self._lock:
+            self.entries[cache_key] = analysis_result
+            if dispatcher.is_failed_result(analysis_result):
+                self.failed_entries[cache_key] = unique_key
+            else:
+                self.failed_entries.pop(cache_key, None)
+
+    def record_failure(self, cache_key, analysis_result, unique_key=None):
+        """Logs a failure that is not cached (a transient error to be retried on the next run)."""
+        with self._lock:
+            self.failed_entries[cache_key] = unique_key
+
+    def flush(self):
+        with self._lock:
+            utils.save_ollama_cache(self.entries)
+
+    def close(self):
+        self.flush()
+
+
+class SqliteCacheBackend:
+    """
+    SQLite (WAL mode) analysis cache with one upsert per entry, so a crash never loses committed results
+    and a new run resumes where the previous one stopped.
+    Tables: analysis_cache (indexed by cache_key and source_file) and failed_entries.
+    """
+    name = "sqlite"
+    requires_periodic_flush = False
+
+    def __init__(self, db_path=None):
+        # Only the project database imports the project JSON cache (a custom db_path starts empty)
+        is_project_database = db_path is None
+        self.db_path = db_path or os.path.join(utils.PROJECT_ROOT_DIR, SQLITE_CACHE_FILE)
+        is_new_database = not os.path.exists(self.db_path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                cache_key TEXT PRIMARY KEY,
+                source_file TEXT,
+                unique_key TEXT,
+                result_json TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_analysis_cache_source_file ON analysis_cache (source_file);
+            CREATE TABLE IF NOT EXISTS failed_entries (
+                cache_key TEXT PRIMARY KEY,
+                source_file TEXT,
+                unique_key TEXT,
+                error_label TEXT,
+                details TEXT,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                last_failed_at REAL NOT NULL
+            );
+        """)
+        self._connection.commit()
+        print(f"[CACHE INFO] Cache SQLite ({self.db_path}) aberto com {len(self)} entradas.")
+
+        json_cache_path = os.path.join(utils.PROJECT_ROOT_DIR, utils.OLLAMA_ANALYSIS_CACHE_FILE)
+        if is_new_database and is_project_database and os.path.exists(json_cache_path):
+            try:
+                self.import_json(json_cache_path)
+            except Exception as e:
+                print(f"[CACHE ERRO] Erro ao importar cache JSON de {json_cache_path}: {e}")
+
+    def __contains__(self, cache_key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM analysis_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+        return row is not None
+
+    def __getitem__(self, cache_key):
+        analysis_result = self.get(cache_key)
+        if analysis_result is None:
+            raise KeyError(cache_key)
+        return analysis_result
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+
+    def get(self, cache_key, default=None):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT result_json FROM analysis_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def items(self):
+        with self._lock:
+            rows = self._connection.execute("SELECT cache_key, result_json FROM analysis_cache").fetchall()
+        return [(cache_key, json.loads(result_json)) for cache_key, result_json in rows]
+
+    def get_entries_for_source_file(self, source_file):
+        """Returns {unique_key: analysis_result} for the entries last produced by source_file."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT unique_key, result_json FROM analysis_cache WHERE source_file = ?", (source_file,)
+            ).fetchall()
+        return {unique_key: json.loads(result_json) for unique_key, result_json in rows}
+
+    @run_metrics.instrument("sqlite_cache_put")
+    def put(self, cache_key, analysis_result, unique_key=None):
+        source_file = _source_file_of(unique_key)
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO analysis_cache (cache_key, source_file, unique_key, result_json, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(cache_key) DO UPDATE SET source_file = excluded.source_file, "
+                "unique_key = excluded.unique_key, result_json = excluded.result_json, updated_at = excluded.updated_at",
+                (cache_key, source_file, unique_key, json.dumps(analysis_result, ensure_ascii=False), now)
+            )
+            if dispatcher.is_failed_result(analysis_result):
+                self._upsert_failed_entry(cache_key, source_file, unique_key, analysis_result, now)
+            else:
+                self._connection.execute("DELETE FROM failed_entries WHERE cache_key = ?", (cache_key,))
+
+    def _upsert_failed_entry(self, cache_key, source_file, unique_key, analysis_result, now):
+        self._connection.execute(
+            "INSERT INTO failed_entries (cache_key, source_file, unique_key, error_label, details, last_failed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(cache_key) DO UPDATE SET attempts = attempts + 1, error_label = excluded.error_label, "
+            "details = excluded.details, last_failed_at = excluded.last_failed_at",
+            (cache_key, source_file, unique_key, analysis_result.get("pii_sensitivity_assessment"),
+             str(analysis_result.get("gdpr_justification", ""))[:1000], now)
+        )
+
+    def record_failure(self, cache_key, analysis_result, unique_key=None):
+        """Logs a failure in failed_entries without caching it (a transient error to be retried on the next run)."""
+        with self._lock, self._connection:
+            self._upsert_failed_entry(cache_key, _source_file_of(unique_key), unique_key, analysis_result, time.time())
+
+    def get_failed_entries(self):
+        """Returns the failures recorded so far as a list of dicts."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT cache_key, source_file, unique_key, error_label, details, attempts, last_failed_at FROM failed_entries"
+            ).fetchall()
+        columns = ["cache_key", "source_file", "unique_key", "error_label", "details", "attempts", "last_failed_at"]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def flush(self):
+        pass # Every put() is committed
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def import_json(self, json_path):
+        """
+        Imports a JSON cache file ({cache_key: analysis_result}) in a single transaction, with the same split as put():
+        failed results are recorded in failed_entries, and transient failures are not cached.
+        Legacy 'filename::path' keys (caches written before the content-addressed keys) can never be looked up
+        again, and lack the description needed to re-key them, so they are skipped.
+        """
+        with open(json_path, 'r', encoding='utf-8') as f:
+            json_entries = json.load(f)
+        now = time.time()
+        imported_entries = {cache_key: analysis_result for cache_key, analysis_result in json_entries.items() if "::" not in cache_key}
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO analysis_cache (cache_key, source_file, unique_key, result_json, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(cache_key, None, None, json.dumps(analysis_result, ensure_ascii=False), now)
+                 for cache_key, analysis_result in imported_entries.items()
+                 if dispatcher.classify_failure(analysis_result) != dispatcher.FAILURE_TRANSIENT]
+            )
+            for cache_key, analysis_result in imported_entries.items():
+                if dispatcher.is_failed_result(analysis_result):
+                    self._upsert_failed_entry(cache_key, None, None, analysis_result, now)
+        skipped_count = len(json_entries) - len(imported_entries)
+        print(f"[CACHE INFO] {len(imported_entries)} entradas importadas de '{json_path}' para o cache SQLite"
+              f"{f' ({skipped_count} entradas com chaves antigas filename::path ignoradas)' if skipped_count else ''}.")
+
+    def export_json(self, json_path):
+        """Exports the cache in the original JSON format."""
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.items()), f, indent=2, ensure_ascii=False)
+        print(f"[CACHE INFO] Cache SQLite exportado para '{json_path}'.")
+
+
+def open_cache_backend(backend_name="sqlite"):
+    """Opens the analysis cache backend named backend_name ('json' or 'sqlite')."""
+    if backend_name == "json":
+        return JsonCacheBackend()
+    if backend_name == "sqlite":
+        return SqliteCacheBackend()
+    raise ValueError(f"Unknown cache backend '{backend_name}'. Expected one of {CACHE_BACKENDS}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import/export the SQLite analysis cache as JSON.")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("json_path", nargs="?", default=os.path.join(utils.PROJECT_ROOT_DIR, utils.OLLAMA_ANALYSIS_CACHE_FILE))
+    args = parser.parse_args()
+    store = SqliteCacheBackend()
+    if args.action == "import":
+        store.import_json(args.json_path)
+    else:
+        store.export_json(args.json_path)
+    store.close()
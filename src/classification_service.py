@@ -0,0 +1,360 @@
+# src/classification_service.py
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import dispatcher
+import ollama_analyzer
+import pre_classifier
+import report_exporters
+import schema_parser
+
+MAX_REQUEST_BODY_BYTES = 32 * 1024 * 1024
+DEFAULT_REQUEST_FILENAME = "request.json" # Source file name of posted fields and schemas without a "filename"
+
+# Where a verdict of the classification API came from
+SERVED_FROM_RULES = "rules"
+SERVED_FROM_CACHE = "cache"
+SERVED_FROM_COALESCED = "coalesced" # Another request was already analyzing the same field
+SERVED_FROM_LLM = "llm"
+SERVED_FROM_SOURCES = [SERVED_FROM_RULES, SERVED_FROM_CACHE, SERVED_FROM_COALESCED, SERVED_FROM_LLM]
+
+
+class ClassificationService:
+    """
+    Resident classifier of the service mode, shared by the HTTP request threads: posted fields are decided by the rule
+    tier, then the analysis cache, then Ollama (FIELD_BATCH_SIZE fields per request, under one concurrency limiter for
+    every client). A field already being analyzed for another request is not sent again: the request waits for that
+    verdict (dispatcher.RequestCoalescer). New verdicts go to the cache shared with the service's incremental runs.
+    """
+
+    def __init__(self, ollama_cache, model_name=None, pre_classifier_threshold=None, batch_size=1, limiter=None,
+                 retry_policy=None, schema_dir=None):
+        self.ollama_cache = ollama_cache
+        self.model_name = model_name or ollama_analyzer.OLLAMA_MODEL
+        self.pre_classifier_threshold = pre_classifier_threshold
+        self.batch_size = max(1, batch_size)
+        self.limiter = limiter or dispatcher.AdaptiveConcurrencyLimiter(max_limit=1)
+        self.retry_policy = retry_policy
+        self.schema_dir = schema_dir # Sibling documents of posted schemas' '$ref's
+        self.coalescer = dispatcher.RequestCoalescer()
+        self.stats = {"requests": 0, "fields": 0, "request_seconds": 0.0, **{source: 0 for source in SERVED_FROM_SOURCES}}
+        self._stats_lock = threading.Lock()
+        self._unflushed_puts = 0
+
+    def warm_up(self):
+        """Loads the prompt components and the model (and pins it again for OLLAMA_KEEP_ALIVE). Returns the load time."""
+        ollama_analyzer.get_prompt_fingerprint()
+        return ollama_analyzer.get_ollama_client().warm_up(self.model_name)
+
+    def flush_cache(self):
+        """Writes the cache if verdicts were added since the last flush (only the JSON backend needs it)."""
+        with self._stats_lock:
+            unflushed_puts, self._unflushed_puts = self._unflushed_puts, 0
+        if unflushed_puts and self.ollama_cache.requires_periodic_flush:
+            self.ollama_cache.flush()
+
+    def get_status(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {
+            "model": self.model_name,
+            "cache_backend": self.ollama_cache.name,
+            "cache_entries": len(self.ollama_cache),
+            "concurrency_limit": self.limiter.current_limit,
+            "coalesced_joins": self.coalescer.coalesced_joins,
+            **stats
+        }
+
+    def classify(self, field_registry, field_ids):
+        """
+        Verdicts of field_ids (ids of field_registry, a schema_parser.FieldRegistry), grouped into equivalence classes
+        first so that each class is decided once. Returns (analysis_results, served_from, property_class_sizes), the
+        first two keyed by field id (served_from: one of SERVED_FROM_SOURCES).
+        """
+        started_at = time.perf_counter()
+        analysis_results, served_from, property_class_sizes = {}, {}, {}
+        owned_classes = [] # (representative cache_key, class members, member cache keys): analyzed by this request
+        waiting_classes = [] # (class members, future of the request analyzing them)
+
+        def _set_results(class_members, analysis_result, source):
+            for field_id in class_members:
+                analysis_results[field_id] = analysis_result
+                served_from[field_id] = source
+
+        for class_members in schema_parser.group_equivalent_properties(field_registry, field_ids):
+            for field_id in class_members:
+                property_class_sizes[field_id] = len(class_members)
+            representative_record = field_registry.record(class_members[0])
+            if self.pre_classifier_threshold is not None:
+                rule_verdict = pre_classifier.classify_field(representative_record.path, representative_record.description)
+                if rule_verdict is not None and rule_verdict["confidence"] >= self.pre_classifier_threshold:
+                    _set_results(class_members, rule_verdict, SERVED_FROM_RULES)
+                    continue
+            member_cache_keys = [
+                ollama_analyzer.build_analysis_cache_key(field_registry.record(field_id), self.model_name) for field_id in class_members
+            ]
+            cached_result = next(
+                (result for result in (self.ollama_cache.get(cache_key) for cache_key in member_cache_keys)
+                 if result is not None and dispatcher.classify_failure(result) != dispatcher.FAILURE_TRANSIENT), None
+            )
+            if cached_result is not None:
+                _set_results(class_members, cached_result, SERVED_FROM_CACHE)
+                continue
+            future, is_owner = self.coalescer.join(member_cache_keys[0])
+            if is_owner:
+                owned_classes.append((member_cache_keys[0], class_members, member_cache_keys))
+            else:
+                waiting_classes.append((class_members, future))
+
+        if owned_classes:
+            try:
+                self._analyze_owned_classes(field_registry, owned_classes, _set_results)
+            finally:
+                for representative_cache_key, _, _ in owned_classes: # No-op for the classes resolved above
+                    self.coalescer.fail(representative_cache_key, RuntimeError("The analysis of this field did not complete."))
+        for class_members, future in waiting_classes:
+            _set_results(class_members, future.result(), SERVED_FROM_COALESCED)
+
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["fields"] += len(served_from)
+            self.stats["request_seconds"] = round(self.stats["request_seconds"] + time.perf_counter() - started_at, 6)
+            for source in served_from.values():
+                self.stats[source] += 1
+        return dict(sorted(analysis_results.items())), served_from, property_class_sizes
+
+    def _analyze_owned_classes(self, field_registry, owned_classes, set_results):
+        """Sends the representatives of owned_classes to Ollama in batches of the same file, through the shared limiter."""
+        classes_by_file = {}
+        for owned_class in owned_classes:
+            classes_by_file.setdefault(field_registry.record(owned_class[1][0]).file_index, []).append(owned_class)
+        work_items = [
+            file_classes[batch_start:batch_start + self.batch_size]
+            for file_classes in classes_by_file.values()
+            for batch_start in range(0, len(file_classes), self.batch_size)
+        ]
+
+        def _analyze(batch):
+            batch_results = ollama_analyzer.analyze_field_batch_ollama(
+                field_registry, [class_members[0] for _, class_members, _ in batch], model_name=self.model_name
+            )
+            return {representative_cache_key: batch_results[class_members[0]] for representative_cache_key, class_members, _ in batch}
+
+        def _store_result(batch, results_by_cache_key, can_retry):
+            retry_classes = []
+            for representative_cache_key, class_members, member_cache_keys in batch:
+                analysis_result = results_by_cache_key[representative_cache_key]
+                failure_class = dispatcher.classify_failure(analysis_result)
+                if failure_class == dispatcher.FAILURE_TRANSIENT and can_retry:
+                    retry_classes.append((representative_cache_key, class_members, member_cache_keys))
+                    continue
+                analysis_result["analysis_tier"] = pre_classifier.TIER_LLM
+                for field_id, cache_key in zip(class_members, member_cache_keys):
+                    if failure_class == dispatcher.FAILURE_TRANSIENT: # Returned to the client, but not cached
+                        self.ollama_cache.record_failure(cache_key, analysis_result, unique_key=field_registry.unique_key(field_id))
+                    else:
+                        self.ollama_cache.put(cache_key, analysis_result, unique_key=field_registry.unique_key(field_id))
+                with self._stats_lock:
+                    self._unflushed_puts += len(class_members)
+                set_results(class_members, analysis_result, SERVED_FROM_LLM)
+                self.coalescer.resolve(representative_cache_key, analysis_result) # After the cache put: later requests hit the cache
+            # Verdicts missing from a batch answer are retried one field per request; other transient failures as a batch
+            missing_classes = [retry_class for retry_class in retry_classes if results_by_cache_key[retry_class[0]].get(
+                "pii_sensitivity_assessment") == ollama_analyzer.BATCH_VERDICT_MISSING_ASSESSMENT]
+            batch_retry_classes = [retry_class for retry_class in retry_classes if retry_class not in missing_classes]
+            return [[retry_class] for retry_class in missing_classes] + ([batch_retry_classes] if batch_retry_classes else [])
+
+        dispatcher.run_concurrent_analysis(
+            work_items, _analyze, _store_result, self.limiter, overload_check=dispatcher.is_overload_batch_result,
+            retry_policy=self.retry_policy
+        )
+
+    def classify_schema(self, schema_data, filename=None):
+        """Verdicts of every property of a posted schema (its '$ref's to sibling files resolve against schema_dir)."""
+        filename = filename or DEFAULT_REQUEST_FILENAME
+        property_fragments, ref_aliases = {}, {}
+        properties_map = schema_parser.extract_all_properties_with_descriptions(
+            schema_data, filename_context=filename, fragments_map=property_fragments, ref_aliases=ref_aliases,
+            resolver=schema_parser.SchemaRefResolver(self.schema_dir) # Per request: posted documents never reach the shared resolvers
+        )
+        field_registry = schema_parser.FieldRegistry()
+        field_registry.add_file(filename, properties_map, property_fragments, ref_aliases)
+        return field_registry, self.classify(field_registry, field_registry.field_ids())
+
+    def classify_single_field(self, field_path, field_description=None, filename=None):
+        """Verdict of one field; field_path is its key path in the schema ('properties.address.properties.city' or a list of segments)."""
+        filename = filename or DEFAULT_REQUEST_FILENAME
+        path_string = ".".join(map(str, field_path)) if isinstance(field_path, (list, tuple)) else str(field_path or "")
+        if not path_string or "" in path_string.split("."):
+            raise ValueError(f"Invalid field path '{path_string}'.")
+        field_registry = schema_parser.FieldRegistry()
+        field_registry.add_file(filename, {f"{filename}::{path_string}": field_description or ""})
+        return field_registry, self.classify(field_registry, field_registry.field_ids())
+
+
+def _optional_string(payload, key):
+    """payload[key] if it is a string, None if absent or null; any other type is a client error (ValueError: 400)."""
+    value = payload.get(key)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"'{key}' must be a string.")
+    return value
+
+
+def _build_verdict_records(field_registry, classification):
+    analysis_results, served_from, property_class_sizes = classification
+    return [
+        dict(verdict_record, served_from=served_from[field_id])
+        for field_id, verdict_record in zip(
+            analysis_results, report_exporters.iter_verdict_records(analysis_results, field_registry, property_class_sizes)
+        )
+    ]
+
+
+class _QuietThreadingHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class ClassificationServer:
+    """
+    Local HTTP API of the service mode (JSON in and out):
+    - GET /health: service status (model, cache, counters by SERVED_FROM source, plus status_fn()'s fields);
+    - POST /classify/field {"path", "description", "filename"}: verdict of one field;
+    - POST /classify/schema: a JSON schema, or {"schema": ..., "filename": ...}: verdicts of all of its properties.
+    Verdicts are the records of the verdict exports (report_exporters.VERDICT_FIELDS) plus "served_from".
+    """
+
+    def __init__(self, service, host="127.0.0.1", port=0, status_fn=None):
+        self.service = service
+        self.status_fn = status_fn
+        self._server = _QuietThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        classification_server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status_code, body_obj):
+                body = json.dumps(body_obj, ensure_ascii=False, default=str).encode()
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/health"):
+                    self._send_json(404, {"error": f"Unknown path '{self.path}'."})
+                    return
+                status = dict(classification_server.service.get_status(), status="ok")
+                if classification_server.status_fn is not None:
+                    status.update(classification_server.status_fn())
+                self._send_json(200, status)
+
+            def do_POST(self):
+                started_at = time.perf_counter()
+                route = self.path.rstrip("/")
+                content_length = self.headers.get("Content-Length", "0").strip()
+                if not (content_length.isascii() and content_length.isdigit()): # Also rejects negative lengths, which would block rfile.read
+                    self.close_connection = True # The body is not read
+                    self._send_json(400, {"error": f"Invalid Content-Length '{content_length}'."})
+                    return
+                body_length = int(content_length)
+                if body_length > MAX_REQUEST_BODY_BYTES:
+                    self.close_connection = True
+                    self._send_json(413, {"error": f"Request body larger than {MAX_REQUEST_BODY_BYTES} bytes."})
+                    return
+                try:
+                    payload = json.loads(self.rfile.read(body_length) or b"null")
+                    if not isinstance(payload, dict):
+                        raise ValueError("The request body must be a JSON object.")
+                    if route == "/classify/field":
+                        field_registry, classification = classification_server.service.classify_single_field(
+                            payload.get("path") or payload.get("name"), _optional_string(payload, "description"),
+                            _optional_string(payload, "filename")
+                        )
+                        response = _build_verdict_records(field_registry, classification)[0]
+                    elif route == "/classify/schema":
+                        is_wrapped = isinstance(payload.get("schema"), dict)
+                        field_registry, classification = classification_server.service.classify_schema(
+                            payload["schema"] if is_wrapped else payload, _optional_string(payload, "filename") if is_wrapped else None
+                        )
+                        verdict_records = _build_verdict_records(field_registry, classification)
+                        response = {
+                            "source_file": field_registry.file_name(0) if len(field_registry) else None,
+                            "fields": verdict_records,
+                            "served_from": {source: sum(record["served_from"] == source for record in verdict_records) for source in SERVED_FROM_SOURCES}
+                        }
+                    else:
+                        self._send_json(404, {"error": f"Unknown path '{self.path}'."})
+                        return
+                except ValueError as e: # Includes json.JSONDecodeError
+                    self._send_json(400, {"error": str(e)})
+                    return
+                except Exception as e:
+                    print(f"[SERVICE ERROR] {route}: {type(e).__name__}: {e}")
+                    self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+                    return
+                response["model"] = classification_server.service.model_name
+                response["elapsed_s"] = round(time.perf_counter() - started_at, 6)
+                self._send_json(200, response)
+
+        return _Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="classification-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class SchemaDirectoryWatcher:
+    """
+    Polls a schema directory for added, changed (modification time or size) and removed .json files.
+    A change is reported once the directory has stayed the same for one more poll, so files still being
+    written are not picked up half-way. The first report lists every file present as added.
+    """
+
+    def __init__(self, schema_dir):
+        self.schema_dir = schema_dir
+        self._last_scan = None
+        self._reported_scan = {}
+
+    def _scan(self):
+        if not os.path.isdir(self.schema_dir):
+            return {}
+        with os.scandir(self.schema_dir) as directory_entries:
+            return {
+                entry.name: (entry.stat().st_mtime_ns, entry.stat().st_size)
+                for entry in directory_entries if entry.name.endswith(".json") and entry.is_file()
+            }
+
+    def poll(self):
+        """{"added", "changed", "removed"} lists of file names, or None when nothing (settled) changed since the last report."""
+        current_scan = self._scan()
+        if current_scan != self._last_scan:
+            self._last_scan = current_scan
+            return None
+        if current_scan == self._reported_scan:
+            return None
+        previous_scan, self._reported_scan = self._reported_scan, current_scan
+        return {
+            "added": sorted(set(current_scan) - set(previous_scan)),
+            "changed": sorted(filename for filename in current_scan if filename in previous_scan and current_scan[filename] != previous_scan[filename]),
+            "removed": sorted(set(previous_scan) - set(current_scan))
+        }
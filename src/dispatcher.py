@@ -0,0 +1,449 @@
+# src/dispatcher.py
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Assessment labels that indicate the Ollama server is overloaded (not a model answer)
+OVERLOAD_ERROR_LABELS = ["ERROR_OLLAMA_TIMEOUT", "ERROR_OLLAMA_REQUESTS"]
+# HTTP status codes that indicate the server cannot keep up with the current load
+OVERLOAD_HTTP_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# Failure classes of an analysis result: transient failures are retried and never cached,
+# permanent failures are cached like an answer (retrying them would fail the same way)
+FAILURE_TRANSIENT = "transient"
+FAILURE_PERMANENT = "permanent"
+# Transport errors, and malformed model output (generation is not deterministic, so a new attempt may parse)
+TRANSIENT_ERROR_LABELS = [
+    "ERROR_OLLAMA_TIMEOUT", "ERROR_OLLAMA_REQUESTS", "ERROR_OLLAMA_CALL_GENERIC", "ERROR_OLLAMA_JSON_DECODE_MAIN_RESPONSE",
+    "ERROR_MODEL_JSON_DECODE", "ERROR_MODEL_JSON_FORMAT", "ERROR_OLLAMA_UNAVAILABLE", "ERROR_MODEL_BATCH_VERDICT_MISSING"
+]
+TRANSIENT_HTTP_STATUS_CODES = [408, 429, 500, 502, 503, 504]
+# Assessment of the fields left unsent when a DispatchBudget runs out (reported, never cached or reused)
+PENDING_ASSESSMENT = "PENDING"
+
+
+def is_failed_result(analysis_result):
+    """True for an error result (ERROR_*) or a field left unsent by a budget (PENDING_ASSESSMENT): not a verdict."""
+    assessment = str(analysis_result.get("pii_sensitivity_assessment", ""))
+    return assessment.startswith("ERROR_") or assessment == PENDING_ASSESSMENT
+
+
+def _extract_http_status(analysis_result):
+    """Returns the HTTP status code recorded in an error result, or None."""
+    for status_key in ("status_code", "http_status_code_captured"):
+        status_code = analysis_result.get(status_key)
+        if isinstance(status_code, int):
+            return status_code
+    return None
+
+
+def is_overload_result(analysis_result):
+    """True if an analysis result signals that the server is overloaded (timeout, connection error, 503...)."""
+    if not isinstance(analysis_result, dict):
+        return False
+    assessment = analysis_result.get("pii_sensitivity_assessment", "")
+    if assessment in OVERLOAD_ERROR_LABELS:
+        return True
+    if assessment == "ERROR_OLLAMA_HTTP":
+        return _extract_http_status(analysis_result) in OVERLOAD_HTTP_STATUS_CODES
+    return False
+
+
+def classify_failure(analysis_result):
+    """
+    None for a model answer, FAILURE_TRANSIENT for failures worth retrying (timeouts, connection errors,
+    HTTP 408/429/5xx, malformed model JSON) and FAILURE_PERMANENT for the other errors (HTTP 4xx,
+    error objects returned by the API such as an unknown model, prompt files that cannot be loaded).
+    """
+    if not isinstance(analysis_result, dict):
+        return None
+    assessment = str(analysis_result.get("pii_sensitivity_assessment", ""))
+    if not assessment.startswith("ERROR_"):
+        return None
+    if assessment in TRANSIENT_ERROR_LABELS:
+        return FAILURE_TRANSIENT
+    if assessment == "ERROR_OLLAMA_HTTP":
+        return FAILURE_TRANSIENT if _extract_http_status(analysis_result) in TRANSIENT_HTTP_STATUS_CODES else FAILURE_PERMANENT
+    return FAILURE_PERMANENT
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with jitter for re-queued work items: the n-th retry waits
+    min(max_delay_s, base_delay_s * 2^(n-1)), shortened by a random fraction of up to `jitter`.
+    final_pass: items still failing after max_attempts get one more attempt once the rest of the queue has drained.
+    """
+
+    def __init__(self, max_attempts=3, base_delay_s=2.0, max_delay_s=30.0, jitter=0.5, final_pass=True, final_pass_delay_s=5.0, seed=None):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.final_pass = final_pass
+        self.final_pass_delay_s = final_pass_delay_s
+        self._random = random.Random(seed)
+
+    def backoff_delay(self, failed_attempts):
+        delay_s = min(self.max_delay_s, self.base_delay_s * (2 ** (failed_attempts - 1)))
+        return delay_s * (1.0 - self.jitter * self._random.random())
+
+
+class CircuitBreaker:
+    """
+    Pauses dispatch while the server is clearly down. After failure_threshold consecutive server failures
+    (timeouts, connection errors, 5xx...) the circuit opens and no request is sent for cooldown_s; then a single
+    probe request is let through (half-open). A success closes the circuit; a failure re-opens it with a doubled
+    cooldown (up to max_cooldown_s). After max_failed_probes failed probes in a row the breaker gives up: the server
+    is considered unavailable for the rest of the run and no further request is allowed.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, cooldown_s=15.0, max_cooldown_s=120.0, max_failed_probes=6):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown_s = cooldown_s
+        self.max_cooldown_s = max(cooldown_s, max_cooldown_s)
+        self.max_failed_probes = max_failed_probes
+        self.state = self.CLOSED
+        self.gave_up = False
+        self.failed_probes = 0
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self._current_cooldown_s = cooldown_s
+        self._opened_at = None
+        self._condition = threading.Condition()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+        print(f"  [DISPATCHER] Circuit open after {self.consecutive_failures} consecutive server failures: pausing dispatch for {self._current_cooldown_s:.1f}s.")
+
+    def wait_until_request_allowed(self):
+        """Blocks while the circuit is open, and while the half-open probe is in flight. False once the breaker has given up."""
+        with self._condition:
+            while self.state != self.CLOSED:
+                if self.gave_up:
+                    return False
+                if self.state == self.OPEN:
+                    remaining_s = self._opened_at + self._current_cooldown_s - time.monotonic()
+                    if remaining_s <= 0:
+                        self.state = self.HALF_OPEN
+                        print("  [DISPATCHER] Circuit half-open: sending a probe request.")
+                        return True
+                    self._condition.wait(remaining_s)
+                else:
+                    self._condition.wait()
+            return True
+
+    def record_result(self, server_failure):
+        with self._condition:
+            if server_failure:
+                self.consecutive_failures += 1
+                if self.state == self.HALF_OPEN:
+                    self.failed_probes += 1
+                    if self.max_failed_probes and self.failed_probes >= self.max_failed_probes:
+                        self.state = self.OPEN
+                        self.gave_up = True
+                        print(f"  [DISPATCHER] Server still failing after {self.failed_probes} probe requests: giving up on the remaining requests.")
+                    else:
+                        self._current_cooldown_s = min(self.max_cooldown_s, self._current_cooldown_s * 2)
+                        self._open()
+                elif self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold:
+                    self._open()
+            else:
+                self.consecutive_failures = 0
+                self.failed_probes = 0
+                if self.state != self.CLOSED and not self.gave_up:
+                    print("  [DISPATCHER] Circuit closed: the server is answering again.")
+                if not self.gave_up:
+                    self.state = self.CLOSED
+                    self._current_cooldown_s = self.cooldown_s
+            self._condition.notify_all()
+
+
+class DispatchBudget:
+    """
+    Wall-clock and/or request-count limit of a dispatch run (None = unlimited). The clock starts with the run;
+    every request sent, retries included, uses one call. Once either limit is reached no further request is sent:
+    requests already in flight finish, and the work items left are returned as "budget_exhausted_items".
+    """
+
+    def __init__(self, max_seconds=None, max_requests=None):
+        self.max_seconds = max_seconds
+        self.max_requests = max_requests
+        self.requests_sent = 0
+        self.exhausted_reason = None
+        self._deadline = None
+
+    def start(self):
+        if self.max_seconds is not None:
+            self._deadline = time.monotonic() + self.max_seconds
+
+    def seconds_left(self):
+        """Time until the wall-clock limit (None without one)."""
+        return None if self._deadline is None else max(0.0, self._deadline - time.monotonic())
+
+    def try_consume(self):
+        """True (and counts the request) if one more request fits in the budget."""
+        if self.exhausted_reason is None:
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                self.exhausted_reason = f"time budget of {self.max_seconds}s"
+            elif self.max_requests is not None and self.requests_sent >= self.max_requests:
+                self.exhausted_reason = f"budget of {self.max_requests} requests"
+            if self.exhausted_reason is not None:
+                print(f"  [DISPATCHER] Phase 2 {self.exhausted_reason} used up after {self.requests_sent} requests: the fields left are reported as pending.")
+        if self.exhausted_reason is not None:
+            return False
+        self.requests_sent += 1
+        return True
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on the number of in-flight Ollama requests.
+    The limit grows by ~1 per window of fast successful calls, shrinks slowly when latency
+    drifts above the observed baseline and is halved on overload errors (timeouts, 503...).
+    """
+
+    def __init__(self, max_limit, min_limit=1, initial_limit=None, latency_tolerance=2.0, adaptive=True):
+        self.max_limit = max(1, int(max_limit))
+        self.min_limit = max(1, min(int(min_limit), self.max_limit))
+        start_limit = initial_limit if initial_limit is not None else self.min_limit
+        self.limit = float(min(max(start_limit, self.min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.adaptive = adaptive
+        self.baseline_latency = None
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    @property
+    def current_limit(self):
+        return int(self.limit)
+
+    def acquire(self):
+        """Blocks until a new request may be sent."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency_s, overloaded=False):
+        """Registers the outcome of a finished request and adjusts the limit."""
+        with self._condition:
+            self.in_flight -= 1
+            if self.adaptive:
+                self._adjust_limit(latency_s, overloaded)
+            self._condition.notify_all()
+
+    def _adjust_limit(self, latency_s, overloaded):
+        if overloaded:
+            self.limit = max(self.min_limit, self.limit / 2)
+            return
+
+        # Baseline follows the fastest observed latencies, slowly forgetting old minima
+        if self.baseline_latency is None or latency_s < self.baseline_latency:
+            self.baseline_latency = latency_s
+        else:
+            self.baseline_latency = 0.95 * self.baseline_latency + 0.05 * latency_s
+
+        if latency_s > self.baseline_latency * self.latency_tolerance:
+            self.limit = max(self.min_limit, self.limit * 0.9)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+
+def is_overload_batch_result(batch_results):
+    """True if any result of a batch ({unique_key: analysis_result}) signals server overload."""
+    return isinstance(batch_results, dict) and any(is_overload_result(result) for result in batch_results.values())
+
+
+class WorkItemFeed:
+    """
+    Work items produced while dispatch is already running (pipelined mode): pass the feed to run_concurrent_analysis
+    instead of a list, put() items as they become known and close() the feed when there are no more.
+    Queued items are dispatched highest priority first (in arrival order among equal priorities).
+    The dispatcher shares `condition` (reentrant), so a producer can update state that on_result also reads
+    (e.g. pending fan-out lists) atomically with `with feed.condition:`.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.closed = False
+        self._items = [] # Heap of (-priority, sequence, work_item)
+        self._sequence = itertools.count()
+
+    def put(self, work_item, priority=0):
+        with self.condition:
+            heapq.heappush(self._items, (-priority, next(self._sequence), work_item))
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def _pop(self):
+        return heapq.heappop(self._items)[2] if self._items else None
+
+
+class RequestCoalescer:
+    """
+    Single-flight table of in-flight analyses (service mode): the first caller of join(key) owns the analysis and the
+    callers that join the same key meanwhile wait on its Future, so a field submitted by several clients at once is sent
+    to Ollama once. The owner resolves (or fails) the key; it then leaves the table, so the owner must store the result
+    (e.g. in the cache) before resolving it.
+    """
+
+    def __init__(self):
+        self.coalesced_joins = 0
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """(future, is_owner): is_owner is True for the one caller that must analyze key and resolve() it."""
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                self.coalesced_joins += 1
+                return future, False
+            future = self._futures[key] = Future()
+            return future, True
+
+    def resolve(self, key, result):
+        with self._lock:
+            future = self._futures.pop(key, None)
+        if future is not None:
+            future.set_result(result)
+
+    def fail(self, key, error):
+        """Wakes the waiters of key with error (no-op if key was already resolved)."""
+        with self._lock:
+            future = self._futures.pop(key, None)
+        if future is not None:
+            future.set_exception(error)
+
+
+def run_concurrent_analysis(work_items, analyze_fn, on_result, limiter, overload_check=is_overload_result,
+                            retry_policy=None, circuit_breaker=None, budget=None):
+    """
+    Runs analyze_fn(work_item) for every work item with at most limiter.current_limit calls in flight.
+    work_items is a list/iterable, or a WorkItemFeed whose items are dispatched as they arrive until it is closed.
+    on_result(work_item, result, can_retry) is called under a lock, so callers can update shared state (cache, counters) safely.
+    When can_retry is True it may return a list of work items to run again (e.g. the fields of a batch that failed
+    transiently, or single-field items for the verdicts missing from a batch answer): each is re-queued after retry_policy.backoff_delay() until retry_policy.max_attempts, then (retry_policy.final_pass)
+    held for a final pass once everything else is done. Without a retry_policy can_retry is always False.
+    overload_check(result) tells the limiter (and circuit_breaker, which pauses dispatch while the server is down)
+    whether a result signals server overload. If the breaker gives up, the work items left are not sent.
+    budget (DispatchBudget): once used up, the work items left (queued, re-queued or still arriving) are not sent either.
+    Returns {"retries": re-queued items, "final_pass_items": items of the final pass, "abandoned_items": [work items never completed
+    because the breaker gave up], "budget_exhausted_items": [work items not sent because the budget ran out]}.
+    """
+    work_feed = work_items if isinstance(work_items, WorkItemFeed) else None
+    state = work_feed.condition if work_feed is not None else threading.Condition()
+    pending_items = iter(work_items) if work_feed is None else None
+    retry_heap = [] # (ready_at, sequence, work_item, attempt, is_final_pass)
+    final_pass_items = []
+    dispatch_stats = {"retries": 0, "final_pass_items": 0, "abandoned_items": [], "budget_exhausted_items": []}
+    in_flight = [0]
+    sequence = itertools.count() # Tie-breaker of the retry heap (work items are not comparable)
+    max_attempts = retry_policy.max_attempts if retry_policy is not None else 1
+
+    def _can_retry(attempt, is_final_pass):
+        if retry_policy is None or is_final_pass:
+            return False
+        return attempt < max_attempts or retry_policy.final_pass
+
+    def _run_one(work_item, attempt, is_final_pass):
+        try:
+            started_at = time.perf_counter()
+            analysis_result = None
+            try:
+                analysis_result = analyze_fn(work_item)
+            finally:
+                overloaded = overload_check(analysis_result)
+                limiter.release(time.perf_counter() - started_at, overloaded=overloaded)
+                if circuit_breaker is not None:
+                    circuit_breaker.record_result(overloaded)
+            with state:
+                can_retry = _can_retry(attempt, is_final_pass)
+                retry_items = on_result(work_item, analysis_result, can_retry)
+                for retry_item in (retry_items or []) if can_retry else []:
+                    if attempt < max_attempts:
+                        heapq.heappush(retry_heap, (time.monotonic() + retry_policy.backoff_delay(attempt), next(sequence), retry_item, attempt + 1, False))
+                        dispatch_stats["retries"] += 1
+                    else:
+                        final_pass_items.append(retry_item)
+        finally:
+            with state:
+                in_flight[0] -= 1
+                state.notify_all()
+
+    def _next_to_dispatch():
+        """Next (work_item, attempt, is_final_pass) to send, waiting for backoffs and in-flight retries; None when all is done."""
+        nonlocal pending_items
+        with state:
+            while True:
+                now = time.monotonic()
+                draining = dispatch_stats["abandoned_items"] or dispatch_stats["budget_exhausted_items"] # Left items are not sent: no backoff
+                if retry_heap and (retry_heap[0][0] <= now or draining):
+                    _, _, work_item, attempt, is_final_pass = heapq.heappop(retry_heap)
+                    return work_item, attempt, is_final_pass
+                if pending_items is not None:
+                    work_item = next(pending_items, None)
+                    if work_item is not None:
+                        return work_item, 1, False
+                    pending_items = None
+                    continue
+                if work_feed is not None:
+                    work_item = work_feed._pop()
+                    if work_item is not None:
+                        return work_item, 1, False
+                    if not work_feed.closed: # More work may still arrive
+                        state.wait(retry_heap[0][0] - now if retry_heap else None)
+                        continue
+                if retry_heap or in_flight[0]:
+                    wait_seconds = retry_heap[0][0] - now if retry_heap else None
+                    if retry_heap and budget is not None and budget.seconds_left() is not None:
+                        wait_seconds = min(wait_seconds, budget.seconds_left()) # Do not wait for a backoff past the deadline
+                    state.wait(wait_seconds)
+                    if budget is not None and retry_heap and budget.seconds_left() == 0 and not draining:
+                        _, _, work_item, attempt, is_final_pass = heapq.heappop(retry_heap)
+                        return work_item, attempt, is_final_pass # Rejected by the budget in the dispatch loop
+                    continue
+                if final_pass_items:
+                    if not draining:
+                        print(f"  [DISPATCHER] Final retry pass for {len(final_pass_items)} work item(s) in {retry_policy.final_pass_delay_s:.1f}s...")
+                    for work_item in final_pass_items:
+                        heapq.heappush(retry_heap, (now + retry_policy.final_pass_delay_s, next(sequence), work_item, max_attempts + 1, True))
+                    dispatch_stats["final_pass_items"] += len(final_pass_items)
+                    final_pass_items.clear()
+                    continue
+                return None
+
+    if budget is not None:
+        budget.start()
+    with ThreadPoolExecutor(max_workers=limiter.max_limit) as executor:
+        futures = []
+        while True:
+            next_dispatch = _next_to_dispatch()
+            if next_dispatch is None:
+                break
+            if budget is not None and not budget.try_consume():
+                with state:
+                    dispatch_stats["budget_exhausted_items"].append(next_dispatch[0])
+                continue
+            if circuit_breaker is not None and not circuit_breaker.wait_until_request_allowed():
+                dispatch_stats["abandoned_items"].append(next_dispatch[0]) # Drained without sending, including later re-queues
+                continue
+            limiter.acquire()
+            with state:
+                in_flight[0] += 1
+            futures.append(executor.submit(_run_one, *next_dispatch))
+        for future in futures:
+            future.result() # Propagates unexpected worker exceptions
+    return dispatch_stats
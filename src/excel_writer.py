@@ -1,7 +1,10 @@
 # src/excel_writer.py
+import numpy as np
 import pandas as pd
 import os # Adicionado para os.path.splitext
 
+import run_metrics
+
 def _determine_cell_highlight_color(sensitivity_label):
     # English sensitivity labels
     if sensitivity_label in ["PERSONAL_DATA_HIGH_SENSITIVITY", "SPECIFIC_HEALTH_DATA", "SENSITIVE_LOCATION_DATA"]: 
@@ -10,8 +13,40 @@ def _determine_cell_highlight_color(sensitivity_label):
         return '#FFEB9C' # Light Yellow
     return None
 
-# ... (_prepare_excel_sheet_data_and_highlights como antes, mas usando "pii_sensitivity_assessment") ...
-def _prepare_excel_sheet_data_and_highlights(filename, collected_rows, ollama_cache, max_cols_overall):
+class _PathIndexNode:
+    """Node of the per-file prefix index of analyzed property paths (one node per path segment)."""
+    __slots__ = ("children", "is_analyzed", "highlight_color")
+
+    def __init__(self):
+        self.children = {}
+        self.is_analyzed = False
+        self.highlight_color = None
+
+
+def _build_analyzed_path_index(analysis_results, field_registry):
+    """
+    Builds, once per report, a prefix tree of analyzed property paths for every file:
+    {filename: root _PathIndexNode}. Highlight colors are precomputed on the analyzed nodes.
+    analysis_results is keyed by field id; paths come as segment tuples from field_registry (schema_parser.FieldRegistry).
+    """
+    path_index = {}
+    for field_id, analysis_data in analysis_results.items():
+        if not analysis_data:
+            continue
+        node = path_index.setdefault(field_registry.file_name(field_id), _PathIndexNode())
+        for path_part in field_registry.record(field_id).path:
+            node = node.children.setdefault(path_part, _PathIndexNode())
+        node.is_analyzed = True
+        node.highlight_color = _determine_cell_highlight_color(analysis_data.get("pii_sensitivity_assessment")) # CHAVE EM INGLÊS
+    return path_index
+
+
+def _prepare_excel_sheet_data_and_highlights(collected_rows, index_root, max_cols_overall):
+    """
+    Builds the sheet rows and the cell highlight map of one file.
+    Each row resolves its deepest analyzed ancestor in a single walk of the file's prefix index
+    (index_root: the file's node of _build_analyzed_path_index, None when nothing in the file was analyzed).
+    """
     excel_df_data = []
     cell_highlights = {} 
 
@@ -21,37 +56,130 @@ def _prepare_excel_sheet_data_and_highlights(filename, collected_rows, ollama_ca
         excel_row_list.extend([None] * (max_cols_overall - len(excel_row_list)))
         excel_df_data.append(excel_row_list)
 
-        current_row_path_parts = row_dict['keys']
-        analysis_for_this_excel_row = None
-        property_path_that_matched_excel_row = None
+        if index_root is None:
+            continue
 
-        for i in range(len(current_row_path_parts), 0, -1):
-            potential_schema_prop_path = ".".join(current_row_path_parts[:i])
-            unique_key_for_cache_lookup = f"{filename}::{potential_schema_prop_path}"
-            
-            if unique_key_for_cache_lookup in ollama_cache:
-                analysis_for_this_excel_row = ollama_cache[unique_key_for_cache_lookup]
-                property_path_that_matched_excel_row = potential_schema_prop_path
-                break
-        
-        if analysis_for_this_excel_row:
-            sensibilidade = analysis_for_this_excel_row.get("pii_sensitivity_assessment") # CHAVE EM INGLÊS
-            color_to_apply = _determine_cell_highlight_color(sensibilidade)
-
-            if color_to_apply and property_path_that_matched_excel_row:
-                num_parts_in_matched_prop_path = len(property_path_that_matched_excel_row.split('.'))
-                for col_idx_excel in range(num_parts_in_matched_prop_path):
-                    if col_idx_excel < len(excel_row_list) and \
-                       excel_row_list[col_idx_excel] == property_path_that_matched_excel_row.split('.')[col_idx_excel]:
-                        cell_highlights[(df_row_idx + 1, col_idx_excel)] = color_to_apply
-                if ".".join(current_row_path_parts) == property_path_that_matched_excel_row:
-                    value_col_idx = len(current_row_path_parts)
-                    if value_col_idx < max_cols_overall:
-                        cell_highlights[(df_row_idx + 1, value_col_idx)] = color_to_apply
+        color_to_apply, highlighted_cols = _resolve_row_highlight(row_dict['keys'], index_root, max_cols_overall)
+        for col_idx_excel in highlighted_cols:
+            cell_highlights[(df_row_idx + 1, col_idx_excel)] = color_to_apply
     return excel_df_data, cell_highlights
 
 
-# ... (apply_styles_to_sheet e apply_styles_to_summary_sheet como antes, mas os nomes das colunas no DataFrame do sumário serão em inglês) ...
+def _resolve_row_highlight(row_keys, index_root, max_cols_overall):
+    """
+    Walks the prefix index once for a flattened row and returns (color, highlighted column indexes):
+    the key columns of the deepest analyzed ancestor, plus the value column on an exact match.
+    """
+    matched_node = None
+    matched_depth = 0
+    node = index_root
+    for depth, path_part in enumerate(row_keys, start=1):
+        node = node.children.get(path_part)
+        if node is None:
+            break
+        if node.is_analyzed:
+            matched_node, matched_depth = node, depth
+
+    if matched_node is None or not matched_node.highlight_color:
+        return None, ()
+    highlighted_cols = list(range(matched_depth))
+    if matched_depth == len(row_keys) and len(row_keys) < max_cols_overall:
+        highlighted_cols.append(len(row_keys))
+    return matched_node.highlight_color, highlighted_cols
+
+
+@run_metrics.instrument("write_sheet_streaming")
+def _write_sheet_streaming(writer, sheet_name, flattened_rows, index_root, column_names, constant_memory=False):
+    """
+    Writes a schema sheet directly from an iterator of flattened rows (keys, value), without a DataFrame.
+    Runs of identical cells are tracked per column while rows arrive and merged as soon as they end,
+    so the output matches the DataFrame path (to_excel + apply_styles_to_sheet).
+    With constant_memory (xlsxwriter flushes every row as soon as a later row is written), cells are written
+    strictly in row order and a repeated cell is left as a formatted blank instead of being merged.
+    """
+    print(f"  [EXCEL_WRITER SHEET] Streaming rows, merges and highlights for sheet '{sheet_name}'...")
+    workbook = writer.book
+    worksheet = workbook.get_worksheet_by_name(sheet_name) or workbook.add_worksheet(sheet_name) # Pre-created by IncrementalExcelReport
+    header_format = workbook.add_format({'bold': True, 'text_wrap': False, 'valign': 'vcenter', 'align': 'center', 'fg_color': '#4F81BD', 'font_color': 'white', 'border': 1})
+    data_format_default = workbook.add_format({'border': 1, 'valign': 'vcenter'})
+    highlight_formats = {}
+    for col_num, column_title in enumerate(column_names):
+        worksheet.write(0, col_num, column_title, header_format)
+
+    num_cols = len(column_names)
+    column_max_lens = [len(str(column_title)) for column_title in column_names]
+    open_runs = [None] * num_cols # per column: [first_row, value, cell_format, is_empty, length]
+
+    def _close_run(col_idx, run):
+        first_row, value, cell_format, _, run_length = run
+        if run_length > 1:
+            worksheet.merge_range(first_row, col_idx, first_row + run_length - 1, col_idx, value, cell_format)
+        else:
+            worksheet.write(first_row, col_idx, value, cell_format)
+
+    def _add_row(worksheet_row, row_cells, color_to_apply, highlighted_cols):
+        highlight_format = None
+        if color_to_apply:
+            if color_to_apply not in highlight_formats:
+                highlight_formats[color_to_apply] = workbook.add_format({'border': 1, 'valign': 'vcenter', 'fg_color': color_to_apply})
+            highlight_format = highlight_formats[color_to_apply]
+        for col_idx in range(num_cols):
+            value = row_cells[col_idx] if col_idx < len(row_cells) else None
+            is_empty = value is None or value != value # None or NaN
+            cell_format = highlight_format if highlight_format is not None and col_idx in highlighted_cols else data_format_default
+            if not is_empty:
+                column_max_lens[col_idx] = max(column_max_lens[col_idx], len(str(value)))
+            run = open_runs[col_idx]
+            if run is not None and not run[3] and not is_empty and run[2] is cell_format and run[1] == value:
+                run[4] += 1
+                if constant_memory:
+                    worksheet.write_blank(worksheet_row, col_idx, None, cell_format)
+                continue
+            if run is not None and not constant_memory:
+                _close_run(col_idx, run)
+            open_runs[col_idx] = [worksheet_row, None if is_empty else value, cell_format, is_empty, 1]
+            if constant_memory:
+                worksheet.write(worksheet_row, col_idx, None if is_empty else value, cell_format)
+
+    rows_written = 0
+    for row_keys, row_value in flattened_rows:
+        rows_written += 1
+        color_to_apply, highlighted_cols = (None, ())
+        if index_root is not None:
+            color_to_apply, highlighted_cols = _resolve_row_highlight(row_keys, index_root, num_cols)
+        _add_row(rows_written, list(row_keys) + [row_value], color_to_apply, highlighted_cols)
+    if rows_written == 0:
+        _add_row(1, ["Empty Schema or No Data to Display."], None, ())
+
+    for col_idx, run in enumerate(open_runs):
+        if run is not None and not constant_memory:
+            _close_run(col_idx, run)
+        worksheet.set_column(col_idx, col_idx, min(max(column_max_lens[col_idx] + 5, 15), 70))
+    print(f"  [EXCEL_WRITER SHEET] Sheet '{sheet_name}' streamed ({rows_written} rows).")
+
+
+def _compute_column_runs(column_values, column_is_na, column_format_ids):
+    """
+    Run-length encoding of one sheet column in a single vectorized pass.
+    A run is a block of consecutive identical non-empty values with the same cell format (empty cells are
+    always runs of length 1). Returns (run_starts, run_lengths) as 0-based row index arrays.
+    """
+    num_rows = len(column_values)
+    if num_rows == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    starts_new_run = np.ones(num_rows, dtype=bool)
+    if num_rows > 1:
+        same_as_previous = np.asarray(column_values[1:] == column_values[:-1], dtype=bool)
+        continues_run = (same_as_previous & ~column_is_na[1:] & ~column_is_na[:-1]
+                         & (column_format_ids[1:] == column_format_ids[:-1]))
+        starts_new_run[1:] = ~continues_run
+    run_starts = np.flatnonzero(starts_new_run)
+    run_lengths = np.diff(np.append(run_starts, num_rows))
+    return run_starts, run_lengths
+
+
+# ... (apply_styles_to_sheet como antes; as folhas de sumário são escritas por _write_table_sheet) ...
+@run_metrics.instrument("apply_styles_to_sheet")
 def apply_styles_to_sheet(writer, df, sheet_name, highlights_map):
     # ... (Mesma lógica, mas os nomes das colunas do df serão "Level X" e "Schema Attribute Value")
     if df.empty and (not hasattr(df, 'columns') or df.columns.empty):
@@ -81,153 +209,279 @@ def apply_styles_to_sheet(writer, df, sheet_name, highlights_map):
         print(f"  [EXCEL_WRITER SHEET] Sheet '{sheet_name}' has only header. Data styling skipped.")
         return
 
-    for col_idx in range(len(df.columns)):
-        current_row_on_worksheet = 1
-        while current_row_on_worksheet <= len(df):
-            value_to_check = df.iloc[current_row_on_worksheet - 1, col_idx]
-            cell_format_to_use = data_format_default
-            highlight_key = (current_row_on_worksheet, col_idx)
-            if highlight_key in highlights_map and highlights_map[highlight_key] in highlight_formats:
-                cell_format_to_use = highlight_formats[highlights_map[highlight_key]]
-
-            if pd.isna(value_to_check):
-                worksheet.write(current_row_on_worksheet, col_idx, None, cell_format_to_use)
-                current_row_on_worksheet += 1; continue
-            
-            count_identical = 1
-            for next_df_row_idx in range(current_row_on_worksheet, len(df)):
-                if df.iloc[next_df_row_idx, col_idx] == value_to_check:
-                    next_cell_format = data_format_default
-                    next_highlight_key = (next_df_row_idx + 1, col_idx)
-                    if next_highlight_key in highlights_map and highlights_map[next_highlight_key] in highlight_formats:
-                        next_cell_format = highlight_formats[highlights_map[next_highlight_key]]
-                    if cell_format_to_use != next_cell_format: break
-                    count_identical += 1
-                else: break
-            
-            if count_identical > 1:
-                worksheet.merge_range(current_row_on_worksheet, col_idx, current_row_on_worksheet + count_identical - 1, col_idx, value_to_check, cell_format_to_use)
+    # Format id grid: 0 = default format, k = k-th highlight color
+    cell_formats = [data_format_default]
+    format_id_by_color = {}
+    for color_hex, color_format in highlight_formats.items():
+        format_id_by_color[color_hex] = len(cell_formats)
+        cell_formats.append(color_format)
+    num_rows, num_cols = df.shape
+    format_id_grid = np.zeros((num_rows, num_cols), dtype=np.int32)
+    for (worksheet_row, col_idx), color_hex in highlights_map.items():
+        if color_hex in format_id_by_color and 1 <= worksheet_row <= num_rows and col_idx < num_cols:
+            format_id_grid[worksheet_row - 1, col_idx] = format_id_by_color[color_hex]
+
+    for col_idx, column_title in enumerate(df.columns):
+        column_values = df.iloc[:, col_idx].to_numpy(dtype=object)
+        column_is_na = pd.isna(column_values)
+        column_format_ids = format_id_grid[:, col_idx]
+        run_starts, run_lengths = _compute_column_runs(column_values, column_is_na, column_format_ids)
+
+        for run_start, run_length in zip(run_starts.tolist(), run_lengths.tolist()):
+            worksheet_row = run_start + 1
+            cell_format_to_use = cell_formats[column_format_ids[run_start]]
+            value_to_write = None if column_is_na[run_start] else column_values[run_start]
+            if run_length > 1:
+                worksheet.merge_range(worksheet_row, col_idx, worksheet_row + run_length - 1, col_idx, value_to_write, cell_format_to_use)
             else:
-                worksheet.write(current_row_on_worksheet, col_idx, value_to_check, cell_format_to_use)
-            current_row_on_worksheet += count_identical
+                worksheet.write(worksheet_row, col_idx, value_to_write, cell_format_to_use)
 
-    if not df.columns.empty:
-        for col_idx, column_title in enumerate(df.columns):
-            max_len = len(str(column_title))
-            if not df.empty and column_title in df:
-                col_series = df[column_title].dropna()
-                if not col_series.empty:
-                    current_col_max_len = col_series.astype(str).map(len).max()
-                    if pd.notna(current_col_max_len): max_len = max(max_len, int(current_col_max_len))
-            adjusted_width = min(max(max_len + 5, 15), 70)
-            worksheet.set_column(col_idx, col_idx, adjusted_width)
+        max_len = len(str(column_title))
+        non_na_values = column_values[~column_is_na]
+        if non_na_values.size:
+            max_len = max(max_len, max(map(len, map(str, non_na_values))))
+        adjusted_width = min(max(max_len + 5, 15), 70)
+        worksheet.set_column(col_idx, col_idx, adjusted_width)
     print(f"  [EXCEL_WRITER SHEET] Styles for sheet '{sheet_name}' applied.")
 
 
-def apply_styles_to_summary_sheet(writer, df, sheet_name):
-    # ... (Mesma lógica, mas os nomes das colunas do df serão em inglês)
-    if df.empty:
-        print(f"  [EXCEL_WRITER SUMMARY] DataFrame for summary '{sheet_name}' is empty.")
-        if hasattr(df, 'columns') and not df.columns.empty:
-            workbook = writer.book; worksheet = writer.sheets[sheet_name]
-            header_format = workbook.add_format({'bold': True, 'text_wrap': True, 'valign': 'vcenter', 'align': 'left', 'fg_color': '#DDEBF7', 'border': 1})
-            for col_num, value in enumerate(df.columns.values):
-                worksheet.write(0, col_num, value, header_format)
-            print(f"  [EXCEL_WRITER SUMMARY] Header written for empty summary '{sheet_name}'.")
+def _compute_max_cols_overall(all_files_parsed_data):
+    """Number of columns of every schema sheet: deepest flattened row of all files + the value column."""
+    max_cols_overall = 0
+    if all_files_parsed_data:
+        for filename_iter, file_data_iter in all_files_parsed_data.items():
+            if 'collected_rows_for_excel' in file_data_iter and file_data_iter['collected_rows_for_excel']:
+                current_max = max(len(row['keys']) for row in file_data_iter['collected_rows_for_excel']) + 1
+                if current_max > max_cols_overall: max_cols_overall = current_max
+            elif 'max_row_depth' in file_data_iter: # Streaming mode: rows are produced at write time
+                max_cols_overall = max(max_cols_overall, file_data_iter['max_row_depth'] + 1)
+    if max_cols_overall == 0: max_cols_overall = 1
+    return max_cols_overall
+
+
+def _schema_sheet_name(filename, file_data):
+    sheet_name = os.path.splitext(filename)[0][:31]
+    return f"Error_{sheet_name}"[:26] if 'error' in file_data else sheet_name
+
+
+def _write_schema_sheets(writer, all_files_parsed_data, analysis_results, field_registry, constant_memory=False):
+    """
+    One sheet per schema file with its flattened structure, analyzed properties highlighted by sensitivity.
+    With constant_memory every sheet goes through the row-ordered _write_sheet_streaming (no merged cells).
+    """
+    max_cols_overall = _compute_max_cols_overall(all_files_parsed_data)
+    analyzed_path_index = _build_analyzed_path_index(analysis_results, field_registry)
+    for filename, file_data in all_files_parsed_data.items():
+        _write_schema_sheet(writer, filename, file_data, analyzed_path_index.get(filename), max_cols_overall, constant_memory)
+
+
+def _write_schema_sheet(writer, filename, file_data, index_root, max_cols_overall, constant_memory=False):
+    """Writes the sheet of one schema file; index_root is the file's node of _build_analyzed_path_index (None if nothing analyzed)."""
+    sheet_name = os.path.splitext(filename)[0][:31]
+    print(f"  [EXCEL_WRITER] Preparing data for sheet: '{sheet_name}'")
+
+    if 'error' in file_data:
+        if constant_memory:
+            _write_table_sheet(writer, _schema_sheet_name(filename, file_data), [{"Error": file_data['error']}], ["Error"], "")
+            return
+        # ... (error handling)
+        error_df = pd.DataFrame([{"Error": file_data['error']}]) # Coluna em Inglês
+        error_df.to_excel(writer, sheet_name=_schema_sheet_name(filename, file_data), index=False) # Nome da folha em Inglês
+        apply_styles_to_sheet(writer, error_df, _schema_sheet_name(filename, file_data), {})
         return
-    print(f"  [EXCEL_WRITER SUMMARY] Applying styles to summary sheet '{sheet_name}'...")
-    # ... (resto da função como antes) ...
-    workbook = writer.book; worksheet = writer.sheets[sheet_name]
+
+    column_names_excel = [f"Level {i+1}" for i in range(max_cols_overall -1)] + ["Schema Attribute Value"] # Nomes em Inglês
+
+    if 'row_source' in file_data or constant_memory: # Streaming mode: flattened rows are consumed incrementally
+        flattened_rows = file_data['row_source']() if 'row_source' in file_data else (
+            (row_dict['keys'], row_dict['value']) for row_dict in file_data['collected_rows_for_excel']
+        )
+        _write_sheet_streaming(writer, sheet_name, flattened_rows, index_root, column_names_excel, constant_memory)
+        print(f"    [EXCEL_WRITER] Sheet '{sheet_name}' added to Excel.")
+        return
+
+    collected_rows = file_data['collected_rows_for_excel']
+
+    if not collected_rows:
+        empty_df = pd.DataFrame(columns=column_names_excel)
+        if column_names_excel: # Adicionar mensagem apenas se houver colunas
+            empty_df.loc[0, column_names_excel[0]] = "Empty Schema or No Data to Display."
+        empty_df.to_excel(writer, sheet_name=sheet_name, index=False)
+        apply_styles_to_sheet(writer, empty_df, sheet_name, {})
+        return
+
+    excel_df_data, cell_highlights = _prepare_excel_sheet_data_and_highlights(collected_rows, index_root, max_cols_overall)
+    df_excel = pd.DataFrame(excel_df_data, columns=column_names_excel)
+    df_excel.to_excel(writer, sheet_name=sheet_name, index=False, header=True)
+    apply_styles_to_sheet(writer, df_excel, sheet_name, cell_highlights)
+    print(f"    [EXCEL_WRITER] Sheet '{sheet_name}' added to Excel.")
+
+
+def _write_table_sheet(writer, sheet_name, table_rows, empty_columns, empty_message):
+    """
+    Writes a list of row dicts as a summary-styled sheet (or a single message row when there is no data).
+    Header and cells are written once, in row order and without a DataFrame, so the sheet also works in
+    xlsxwriter's constant_memory mode. Styling: bold, wrapped header cells on a light blue fill, bordered top-aligned
+    wrapped data cells, and each column sized to its longest value plus 5 characters (at most 70).
+    """
+    column_names = []
+    if not table_rows:
+        column_names = list(empty_columns)
+        table_rows = [{empty_columns[0]: empty_message}]
+    for table_row in table_rows: # Ordered union of the row keys, as pd.DataFrame(table_rows) would give
+        column_names.extend(column_name for column_name in table_row if column_name not in column_names)
+
+    print(f"  [EXCEL_WRITER SUMMARY] Writing summary sheet '{sheet_name}' ({len(table_rows)} rows)...")
+    workbook = writer.book
+    worksheet = workbook.get_worksheet_by_name(sheet_name) or workbook.add_worksheet(sheet_name)
     header_format = workbook.add_format({'bold': True, 'text_wrap': True, 'valign': 'vcenter', 'align': 'left', 'fg_color': '#DDEBF7', 'border': 1})
-    data_format = workbook.add_format({'border': 1, 'valign': 'top', 'text_wrap': True}) 
-    for col_num, value in enumerate(df.columns.values):
-        worksheet.write(0, col_num, value, header_format)
-        header_len = len(str(value)); max_data_len = 0
-        if value in df:
-            col_series = df[value].dropna()
-            if not col_series.empty:
-                max_data_len = col_series.astype(str).str.len().max()
-                if pd.isna(max_data_len): max_data_len = 0
-            else: max_data_len = 0
-        column_width = min(max(header_len, int(max_data_len)) + 5, 70)
-        worksheet.set_column(col_num, col_num, column_width)
-
-    for row_num in range(len(df)):
-        for col_num in range(len(df.columns)):
-            worksheet.write(row_num + 1, col_num, df.iloc[row_num, col_num], data_format)
-    print(f"  [EXCEL_WRITER SUMMARY] Styles for summary sheet '{sheet_name}' applied.")
-
-
-def generate_excel_report(output_filepath, all_files_parsed_data, ollama_cache, all_unique_properties_info):
+    data_format = workbook.add_format({'border': 1, 'valign': 'top', 'text_wrap': True})
+    column_max_lens = [0] * len(column_names)
+    for col_num, column_name in enumerate(column_names):
+        worksheet.write(0, col_num, column_name, header_format)
+    for row_num, table_row in enumerate(table_rows, start=1):
+        for col_num, column_name in enumerate(column_names):
+            cell_value = table_row.get(column_name)
+            if cell_value is None or cell_value != cell_value: # None or NaN
+                worksheet.write_blank(row_num, col_num, None, data_format)
+                continue
+            worksheet.write(row_num, col_num, cell_value, data_format)
+            column_max_lens[col_num] = max(column_max_lens[col_num], len(str(cell_value)))
+    for col_num, column_name in enumerate(column_names):
+        worksheet.set_column(col_num, col_num, min(max(len(str(column_name)), column_max_lens[col_num]) + 5, 70))
+    print(f"  [EXCEL_WRITER SUMMARY] Summary sheet '{sheet_name}' written.")
+
+
+def _write_run_metrics_sheet(writer, run_metrics_collector):
+    """Writes the "Run Metrics" sheet of a run_metrics.RunMetrics collector (Phase 3 is still running, so its own time is only in the JSON lines file)."""
+    _write_table_sheet(writer, "Run Metrics", run_metrics_collector.build_summary_rows(), ["Metric"], "No metrics recorded.")
+    print("  [EXCEL_WRITER] Run Metrics sheet created.")
+
+
+def _open_excel_writer(output_filepath, constant_memory):
+    """xlsxwriter-backed ExcelWriter; constant_memory keeps only the current row of each sheet in memory."""
+    if constant_memory:
+        print("  [EXCEL_WRITER] Constant-memory mode: rows are flushed as they are written, repeated cells are not merged.")
+        return pd.ExcelWriter(output_filepath, engine='xlsxwriter', engine_kwargs={'options': {'constant_memory': True}})
+    return pd.ExcelWriter(output_filepath, engine='xlsxwriter')
+
+
+def _write_summary_sheets(writer, analysis_results, field_registry, property_class_sizes=None, run_metrics_collector=None):
+    """Writes the "PII Analysis Summary" sheet (plus "Run Metrics" when a collector is given)."""
+    # Generate summary sheet
+    summary_data_list = []
+    if analysis_results:
+        print(f"  [EXCEL_WRITER] Preparing data for Summary Sheet ({len(analysis_results)} analyzed properties)...")
+        for field_id, analysis_data in analysis_results.items():
+            # Include all analyzed properties in the summary
+            response_metrics = analysis_data.get("response_metrics") or {}
+            
+            summary_data_list.append({
+                "Source File": field_registry.file_name(field_id), # Inglês
+                "Schema Key Path": field_registry.path_string(field_id), # Inglês
+                "Original Description": field_registry.record(field_id).description, # Inglês
+                "PII Classification (Ollama)": analysis_data.get("pii_sensitivity_assessment", "ERROR_NOT_SPECIFIED"), # Inglês
+                "Justification (Ollama)": analysis_data.get("gdpr_justification", "N/A"), # Inglês
+                "Equivalence Class Size": (property_class_sizes or {}).get(field_id, 1),
+                "Decision Tier": analysis_data.get("analysis_tier", "LLM"),
+                "Pre-classifier Rule": f"{analysis_data['rule_name']} ({analysis_data.get('confidence')})" if analysis_data.get("rule_name") else "",
+                "Similar To (Source Field)": f"{analysis_data['similar_to']} ({analysis_data.get('confidence')})" if analysis_data.get("similar_to") else "",
+                "Time to Verdict (s)": response_metrics.get("time_to_verdict_s"),
+                "Completion Tokens": response_metrics.get("completion_tokens")
+            })
+    
+    summary_sheet_name_final = "PII Analysis Summary" # Nome em Inglês
+    if not summary_data_list:
+        print("  [EXCEL_WRITER] No Ollama analysis data for the summary sheet.")
+    _write_table_sheet(
+        writer, summary_sheet_name_final, summary_data_list,
+        ["Source File", "Schema Key Path", "Original Description", "PII Classification (Ollama)", "Justification (Ollama)", "Equivalence Class Size", "Decision Tier", "Pre-classifier Rule", "Similar To (Source Field)", "Time to Verdict (s)", "Completion Tokens"],
+        "No Ollama analysis performed or all failed."
+    )
+    if summary_data_list:
+        print(f"  [EXCEL_WRITER] Summary sheet '{summary_sheet_name_final}' created with {len(summary_data_list)} entries.")
+    if run_metrics_collector is not None:
+        _write_run_metrics_sheet(writer, run_metrics_collector)
+
+
+def generate_excel_report(output_filepath, all_files_parsed_data, analysis_results, field_registry, property_class_sizes=None,
+                          run_metrics_collector=None, constant_memory=False):
+    """analysis_results and property_class_sizes are keyed by the field ids of field_registry (schema_parser.FieldRegistry)."""
     print(f"\n--- GENERATING EXCEL REPORT: {output_filepath} ---")
-    with pd.ExcelWriter(output_filepath, engine='xlsxwriter') as writer:
-        max_cols_overall = 0
-        if all_files_parsed_data:
-            for filename_iter, file_data_iter in all_files_parsed_data.items():
-                if 'collected_rows_for_excel' in file_data_iter and file_data_iter['collected_rows_for_excel']:
-                    current_max = max(len(row['keys']) for row in file_data_iter['collected_rows_for_excel']) + 1
-                    if current_max > max_cols_overall: max_cols_overall = current_max
-        if max_cols_overall == 0: max_cols_overall = 1
+    with _open_excel_writer(output_filepath, constant_memory) as writer:
+        _write_schema_sheets(writer, all_files_parsed_data, analysis_results, field_registry, constant_memory)
+        _write_summary_sheets(writer, analysis_results, field_registry, property_class_sizes, run_metrics_collector)
+
+    print(f"--- EXCEL REPORT GENERATED: {output_filepath} ---")
+
 
+class IncrementalExcelReport:
+    """
+    Report of the pipelined mode, written while Phase 2 is still running: open() creates every schema sheet
+    in file order once Phase 1 is over (the column count depends on the deepest file), write_schema_sheet() fills
+    a file's sheet as soon as all of its fields have a verdict, and finish() adds the summary sheets and saves
+    the workbook, the only step that waits for the whole run. Sheets must be written from a single thread.
+    """
+
+    def __init__(self, output_filepath, field_registry, constant_memory=False):
+        self.output_filepath = output_filepath
+        self.field_registry = field_registry
+        self.constant_memory = constant_memory
+        self.sheets_written = 0
+        self._writer = None
+        self._max_cols_overall = 1
+
+    def open(self, all_files_parsed_data):
+        print(f"\n--- GENERATING EXCEL REPORT (incremental): {self.output_filepath} ---")
+        self._writer = _open_excel_writer(self.output_filepath, self.constant_memory)
+        self._max_cols_overall = _compute_max_cols_overall(all_files_parsed_data)
         for filename, file_data in all_files_parsed_data.items():
-            sheet_name = os.path.splitext(filename)[0][:31]
-            print(f"  [EXCEL_WRITER] Preparing data for sheet: '{sheet_name}'")
-
-            if 'error' in file_data:
-                # ... (error handling)
-                error_df = pd.DataFrame([{"Error": file_data['error']}]) # Coluna em Inglês
-                error_df.to_excel(writer, sheet_name=f"Error_{sheet_name}"[:26], index=False) # Nome da folha em Inglês
-                apply_styles_to_sheet(writer, error_df, f"Error_{sheet_name}"[:26], {})
-                continue
+            self._writer.book.add_worksheet(_schema_sheet_name(filename, file_data))
 
-            collected_rows = file_data['collected_rows_for_excel']
-            column_names_excel = [f"Level {i+1}" for i in range(max_cols_overall -1)] + ["Schema Attribute Value"] # Nomes em Inglês
+    def write_schema_sheet(self, filename, file_data, file_analysis_results):
+        """file_analysis_results: {field_id: analysis_result} of this file's properties."""
+        index_root = _build_analyzed_path_index(file_analysis_results, self.field_registry).get(filename)
+        _write_schema_sheet(self._writer, filename, file_data, index_root, self._max_cols_overall, self.constant_memory)
+        self.sheets_written += 1
 
-            if not collected_rows:
-                empty_df = pd.DataFrame(columns=column_names_excel)
-                if column_names_excel: # Adicionar mensagem apenas se houver colunas
-                    empty_df.loc[0, column_names_excel[0]] = "Empty Schema or No Data to Display."
-                empty_df.to_excel(writer, sheet_name=sheet_name, index=False)
-                apply_styles_to_sheet(writer, empty_df, sheet_name, {})
-                continue
-            
-            excel_df_data, cell_highlights = _prepare_excel_sheet_data_and_highlights(
-                filename, collected_rows, ollama_cache, max_cols_overall
-            )
-            df_excel = pd.DataFrame(excel_df_data, columns=column_names_excel)
-            df_excel.to_excel(writer, sheet_name=sheet_name, index=False, header=True)
-            apply_styles_to_sheet(writer, df_excel, sheet_name, cell_highlights)
-            print(f"    [EXCEL_WRITER] Sheet '{sheet_name}' added to Excel.")
-
-        # Generate summary sheet
-        summary_data_list = []
-        if ollama_cache:
-            print(f"  [EXCEL_WRITER] Preparing data for Summary Sheet ({len(ollama_cache)} cache entries)...")
-            for unique_key, analysis_data in ollama_cache.items():
-                # Include all analyzed properties in the summary
-                filename_ctx, path_str_ctx = unique_key.split("::", 1)
-                original_description = all_unique_properties_info.get(unique_key, "Description not available")
-                
-                summary_data_list.append({
-                    "Source File": filename_ctx, # Inglês
-                    "Schema Key Path": path_str_ctx, # Inglês
-                    "Original Description": original_description, # Inglês
-                    "PII Classification (Ollama)": analysis_data.get("pii_sensitivity_assessment", "ERROR_NOT_SPECIFIED"), # Inglês
-                    "Justification (Ollama)": analysis_data.get("gdpr_justification", "N/A") # Inglês
-                })
-        
-        summary_sheet_name_final = "PII Analysis Summary" # Nome em Inglês
-        if summary_data_list:
-            summary_df_final = pd.DataFrame(summary_data_list)
-            summary_df_final.to_excel(writer, sheet_name=summary_sheet_name_final, index=False)
-            apply_styles_to_summary_sheet(writer, summary_df_final, summary_sheet_name_final)
-            print(f"  [EXCEL_WRITER] Summary sheet '{summary_sheet_name_final}' created with {len(summary_data_list)} entries.")
-        else:
-            print("  [EXCEL_WRITER] No Ollama analysis data for the summary sheet.")
-            empty_summary_df_cols = ["Source File", "Schema Key Path", "Original Description", "PII Classification (Ollama)", "Justification (Ollama)"]
-            empty_summary_df = pd.DataFrame(columns=empty_summary_df_cols)
-            empty_summary_df.loc[0, empty_summary_df_cols[0]] = "No Ollama analysis performed or all failed."
-            empty_summary_df.to_excel(writer, sheet_name=summary_sheet_name_final, index=False)
-            apply_styles_to_summary_sheet(writer, empty_summary_df, summary_sheet_name_final)
-
-    print(f"--- EXCEL REPORT GENERATED: {output_filepath} ---")
\ No newline at end of file
+    def finish(self, analysis_results, property_class_sizes=None, run_metrics_collector=None):
+        _write_summary_sheets(self._writer, analysis_results, self.field_registry, property_class_sizes, run_metrics_collector)
+        self.close()
+        print(f"--- EXCEL REPORT GENERATED: {self.output_filepath} ---")
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def _highlight_severity(sensitivity_label):
+    highlight_color = _determine_cell_highlight_color(sensitivity_label)
+    return 2 if highlight_color == '#FFC7CE' else 1 if highlight_color == '#FFEB9C' else 0
+
+
+def generate_comparison_report(output_filepath, all_files_parsed_data, field_registry, analysis_results_by_model,
+                               comparison_rows, agreement_rows, throughput_rows, run_metrics_collector=None, constant_memory=False):
+    """
+    Multi-model comparison workbook: schema sheets (each property highlighted with the most sensitive verdict
+    given by any model), a "Model Comparison" sheet with one verdict column per model, a "Model Agreement"
+    sheet with pairwise agreement rates and a "Model Throughput" sheet (plus "Run Metrics" when a collector is given).
+    """
+    print(f"\n--- GENERATING MODEL COMPARISON REPORT: {output_filepath} ---")
+    most_sensitive_results = {}
+    for analysis_results in analysis_results_by_model.values():
+        for field_id, analysis_data in analysis_results.items():
+            current_result = most_sensitive_results.get(field_id)
+            if current_result is None or _highlight_severity(analysis_data.get("pii_sensitivity_assessment")) > _highlight_severity(current_result.get("pii_sensitivity_assessment")):
+                most_sensitive_results[field_id] = analysis_data
+
+    with _open_excel_writer(output_filepath, constant_memory) as writer:
+        _write_schema_sheets(writer, all_files_parsed_data, most_sensitive_results, field_registry, constant_memory)
+        _write_table_sheet(writer, "Model Comparison", comparison_rows, ["Source File"], "No properties analyzed.")
+        _write_table_sheet(writer, "Model Agreement", agreement_rows, ["Model A"], "At least two models are needed for agreement rates.")
+        _write_table_sheet(writer, "Model Throughput", throughput_rows, ["Model"], "No model was run.")
+        if run_metrics_collector is not None:
+            _write_run_metrics_sheet(writer, run_metrics_collector)
+        print(f"  [EXCEL_WRITER] Comparison sheets created ({len(comparison_rows)} properties, {len(analysis_results_by_model)} models).")
+
+    print(f"--- MODEL COMPARISON REPORT GENERATED: {output_filepath} ---")
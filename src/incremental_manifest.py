@@ -0,0 +1,201 @@
+# src/incremental_manifest.py
+import hashlib
+import json
+import os
+import pickle
+import re
+
+import dispatcher
+import utils
+
+MANIFEST_FILENAME = "schema_manifest.json"
+PHASE1_STATE_SUBDIR = "phase1"
+MANIFEST_VERSION = 1
+# Documents named by a "$ref" (the part before '#'); refs to sibling files make them dependencies
+_REF_DOCUMENT_PATTERN = re.compile(rb'"\$ref"\s*:\s*"([^"#]+)')
+
+
+class SchemaManifest:
+    """
+    Manifest of content hashes from the previous run, used by the incremental mode:
+    - one fingerprint per schema file (its bytes plus every sibling schema it references through $ref),
+      to detect added, changed and removed files and reuse their pickled Phase 1 ingestion;
+    - one fingerprint per property (description, schema fragment, $ref alias) with its last verdict,
+      so that only added or changed properties go to Phase 2.
+    Layout: {"version", "analysis_fingerprint", "files": {filename: {"fingerprint", "properties": {unique_key: {"fingerprint", "result"}}}}}
+    """
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.manifest_path = os.path.join(state_dir, MANIFEST_FILENAME)
+        self.phase1_dir = os.path.join(state_dir, PHASE1_STATE_SUBDIR)
+        self.previous = self._load()
+        self.file_fingerprints = {} # Fingerprints of the current run (compute_file_fingerprints)
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest_data = json.load(f)
+            if manifest_data.get("version") == MANIFEST_VERSION:
+                print(f"[MANIFEST INFO] Manifest loaded from {self.manifest_path} ({len(manifest_data.get('files', {}))} files).")
+                return manifest_data
+            print(f"[MANIFEST INFO] Manifest {self.manifest_path} has an old version. Starting from scratch.")
+        except FileNotFoundError:
+            print(f"[MANIFEST INFO] No manifest at {self.manifest_path}. First incremental run.")
+        except Exception as e:
+            print(f"[MANIFEST ERRO] Error reading manifest {self.manifest_path}: {e}. Starting from scratch.")
+        return {"version": MANIFEST_VERSION, "analysis_fingerprint": None, "files": {}}
+
+    def compute_file_fingerprints(self, json_filepaths):
+        """{filename: hash of the file and, transitively, of the sibling schema files it references}."""
+        raw_hashes = {}
+        dependencies = {}
+        pending_paths = list(json_filepaths)
+        while pending_paths:
+            filepath = pending_paths.pop()
+            filename = os.path.basename(filepath)
+            if filename in raw_hashes:
+                continue
+            with open(filepath, 'rb') as f:
+                raw_bytes = f.read()
+            raw_hashes[filename] = hashlib.sha256(raw_bytes).hexdigest()
+            dependencies[filename] = set()
+            for ref_document in _REF_DOCUMENT_PATTERN.findall(raw_bytes):
+                dependency_name = os.path.basename(ref_document.decode('utf-8', 'replace').rstrip('/'))
+                dependency_path = os.path.join(os.path.dirname(filepath), dependency_name)
+                if dependency_name != filename and os.path.isfile(dependency_path):
+                    dependencies[filename].add(dependency_name)
+                    pending_paths.append(dependency_path)
+
+        def _closure(filename):
+            seen, stack = set(), [filename]
+            while stack:
+                for dependency_name in dependencies[stack.pop()]:
+                    if dependency_name not in seen:
+                        seen.add(dependency_name)
+                        stack.append(dependency_name)
+            seen.discard(filename)
+            return sorted(seen)
+
+        self.file_fingerprints = {
+            os.path.basename(filepath): utils.compute_content_hash(
+                raw_hashes[os.path.basename(filepath)],
+                [(dependency_name, raw_hashes[dependency_name]) for dependency_name in _closure(os.path.basename(filepath))]
+            )
+            for filepath in json_filepaths
+        }
+        return self.file_fingerprints
+
+    def diff_files(self, file_fingerprints):
+        """Returns {"added": [...], "changed": [...], "removed": [...], "unchanged": [...]} against the previous run."""
+        previous_files = self.previous["files"]
+        file_changes = {"added": [], "changed": [], "removed": [], "unchanged": []}
+        for filename, fingerprint in file_fingerprints.items():
+            if filename not in previous_files:
+                file_changes["added"].append(filename)
+            elif previous_files[filename]["fingerprint"] != fingerprint:
+                file_changes["changed"].append(filename)
+            else:
+                file_changes["unchanged"].append(filename)
+        file_changes["removed"] = sorted(set(previous_files) - set(file_fingerprints))
+        return file_changes
+
+    def _ingestion_path(self, filename):
+        return os.path.join(self.phase1_dir, f"{filename}.pkl")
+
+    def load_ingestion(self, filename, ingestion_token):
+        """Pickled Phase 1 result of an unchanged file, or None (missing, stale or unreadable)."""
+        try:
+            with open(self._ingestion_path(filename), 'rb') as f:
+                stored_token, ingested_file = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"[MANIFEST ERRO] Error reading Phase 1 state of {filename}: {e}")
+            return None
+        return ingested_file if stored_token == ingestion_token else None
+
+    def store_ingestion(self, filename, ingestion_token, ingested_file):
+        os.makedirs(self.phase1_dir, exist_ok=True)
+        temp_path = self._ingestion_path(filename) + ".tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump((ingestion_token, ingested_file), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self._ingestion_path(filename))
+
+    def remove_ingestion(self, filename):
+        try:
+            os.remove(self._ingestion_path(filename))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def compute_property_fingerprints(field_registry):
+        """{unique_key: fingerprint} of every property of field_registry (schema_parser.FieldRegistry)."""
+        property_fingerprints = {}
+        for field_id in field_registry.field_ids():
+            field_record = field_registry.record(field_id)
+            property_fingerprints[field_registry.unique_key(field_id)] = utils.compute_content_hash(
+                field_record.description, field_record.fragment_hash, field_registry.ref_alias(field_id)
+            )
+        return property_fingerprints
+
+    def _previous_property_entries(self):
+        return {
+            unique_key: property_entry
+            for file_entry in self.previous["files"].values()
+            for unique_key, property_entry in file_entry.get("properties", {}).items()
+        }
+
+    def diff_properties(self, property_fingerprints):
+        """Counts of added, changed, removed and unchanged properties against the previous run."""
+        previous_entries = self._previous_property_entries()
+        property_changes = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+        for unique_key, fingerprint in property_fingerprints.items():
+            if unique_key not in previous_entries:
+                property_changes["added"] += 1
+            elif previous_entries[unique_key]["fingerprint"] != fingerprint:
+                property_changes["changed"] += 1
+            else:
+                property_changes["unchanged"] += 1
+        property_changes["removed"] = len(set(previous_entries) - set(property_fingerprints))
+        return property_changes
+
+    def get_reusable_results(self, property_fingerprints, analysis_fingerprint):
+        """
+        {unique_key: previous verdict} for unchanged properties, provided the analysis setup
+        (model, prompts, rules) is the same as in the previous run. Failed analyses are never reused.
+        """
+        if self.previous.get("analysis_fingerprint") != analysis_fingerprint:
+            if self.previous["files"]:
+                print("[MANIFEST INFO] Model, prompts or rules changed since the previous run: no verdict is reused.")
+            return {}
+        previous_entries = self._previous_property_entries()
+        return {
+            unique_key: previous_entries[unique_key]["result"]
+            for unique_key, fingerprint in property_fingerprints.items()
+            if unique_key in previous_entries
+            and previous_entries[unique_key]["fingerprint"] == fingerprint
+            and previous_entries[unique_key].get("result") is not None
+        }
+
+    def save(self, property_fingerprints, analysis_results, analysis_fingerprint):
+        """Writes the manifest of this run (atomically) and drops the Phase 1 state of removed files."""
+        files = {filename: {"fingerprint": fingerprint, "properties": {}} for filename, fingerprint in self.file_fingerprints.items()}
+        for unique_key, fingerprint in property_fingerprints.items():
+            filename = unique_key.split("::", 1)[0]
+            if filename not in files:
+                continue
+            analysis_result = analysis_results.get(unique_key)
+            if analysis_result is not None and dispatcher.is_failed_result(analysis_result):
+                analysis_result = None # Failed analyses are retried on the next run
+            files[filename]["properties"][unique_key] = {"fingerprint": fingerprint, "result": analysis_result}
+        for filename in set(self.previous["files"]) - set(files):
+            self.remove_ingestion(filename)
+
+        self.previous = {"version": MANIFEST_VERSION, "analysis_fingerprint": analysis_fingerprint, "files": files}
+        os.makedirs(self.state_dir, exist_ok=True)
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.previous, f, ensure_ascii=False)
+        os.replace(temp_path, self.manifest_path)
+        print(f"[MANIFEST INFO] Manifest saved to {self.manifest_path} ({len(files)} files, {len(property_fingerprints)} properties).")
@@ -1,154 +1,1073 @@
 # src/main.py
 import os
 import json
+import functools
 import pandas as pd
+import queue
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 
 import utils
+import cache_store
+import dispatcher
+import pre_classifier
 import schema_parser
 import ollama_analyzer # Já importa as constantes do ollama_analyzer
 import excel_writer
+import incremental_manifest
+import model_comparison
+import run_metrics
+import report_exporters
+import similarity_index
+import classification_service
 
 # --- Configurações Globais ---
 PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 JSON_FILES_DIR_CONFIG = os.path.join(PROJECT_ROOT_DIR, "JSONFiles")
 # OUTPUT_EXCEL_FILENAME_CONFIG será definido dinamicamente
 
+# --- Phase 1 / Phase 3 Schema Flattening ---
+# When True, flattened rows are not kept in memory: each sheet re-reads its schema file at write time
+# (incrementally if the optional 'ijson' package is installed) and streams rows into the Excel writer.
+# Phase 1 still loads each schema once for property extraction; only the flattened rows are not retained.
+STREAMING_FLATTEN_MODE = False
+
+# --- Phase 1 Ingestion ---
+PHASE1_PARALLEL_MIN_FILES = 32 # Below this number of files (or with a single CPU), ingestion runs in-process
+PHASE1_MAX_WORKERS = None # Process pool size (None = number of CPUs)
+
+# --- Phase 2 Dispatch ---
+PHASE2_MAX_IN_FLIGHT_REQUESTS = 4 # Upper bound of concurrent Ollama requests (1 = sequential)
+PHASE2_MIN_IN_FLIGHT_REQUESTS = 1
+PHASE2_ADAPTIVE_CONCURRENCY = True # Adjust the limit from observed latency and overload errors
+FIELD_BATCH_SIZE = 5 # Fields of the same schema file sent in one chat request (1 = one request per field)
+PHASE2_CACHE_SAVE_INTERVAL = 5 # Save the JSON cache every N analyzed properties (SQLite commits every entry)
+PHASE2_PROGRESS_LOG_INTERVAL = 10
+# Transient failures (timeouts, connection errors, HTTP 429/5xx, malformed model JSON) are re-queued with
+# exponential backoff and jitter, and are never cached; permanent failures (other HTTP 4xx, API errors) are cached.
+PHASE2_MAX_ATTEMPTS = 3 # Attempts per field before the final retry pass
+PHASE2_RETRY_BASE_DELAY_SECONDS = 2.0
+PHASE2_RETRY_MAX_DELAY_SECONDS = 30.0
+PHASE2_FINAL_RETRY_PASS = True # One more attempt for fields still failing, once everything else is done
+PHASE2_CIRCUIT_BREAKER_FAILURES = 5 # Consecutive server failures that pause dispatch (the server is down)
+PHASE2_CIRCUIT_BREAKER_COOLDOWN_SECONDS = 15.0 # Doubled after every failed probe request (up to 120s)
+PHASE2_CIRCUIT_BREAKER_MAX_PROBES = 6 # Failed probes in a row before the remaining fields are given up for this run
+# Most likely personal data first: pending fields are sent in order of pre_classifier.score_pii_likelihood (name and
+# description tokens such as email/user/phone/location/id, and schema depth) instead of schema order.
+PHASE2_PRIORITY_ORDER = True
+# Budget of a Phase 2 run (None = unlimited): once the wall-clock seconds (from the start of dispatch) or the number of
+# chat requests (retries included) are used up, no more requests are sent and the fields left are reported as PENDING
+# (not cached, analyzed by the next run). With the priority order, the fields left are the least likely to be personal data.
+PHASE2_TIME_BUDGET_SECONDS = None
+PHASE2_REQUEST_BUDGET = None
+
+# --- Pre-classifier (rule tier in front of the LLM, rules in rules/pre_classifier_rules.json) ---
+PRE_CLASSIFIER_ENABLED = True
+PRE_CLASSIFIER_CONFIDENCE_THRESHOLD = 0.9 # Rule verdicts below this confidence are sent to the LLM
+
+# --- Similarity Tier (between the cache and the LLM) ---
+# When True, fields missing from the cache are embedded (name, path and description) with ollama_analyzer.OLLAMA_EMBED_MODEL
+# and take the verdict of an analyzed field whose embedding is at least SIMILARITY_THRESHOLD cosine-similar, tagged with
+# that source field; near-duplicates of the same run wait for the first one's verdict. Embeddings of analyzed fields are
+# kept in SIMILARITY_INDEX_DIR (one index per model and prompt version). Reused verdicts are not written to the cache.
+SIMILARITY_REUSE_ENABLED = False
+SIMILARITY_THRESHOLD = 0.95
+SIMILARITY_INDEX_DIR = os.path.join(PROJECT_ROOT_DIR, ".similarity_index")
+
+# --- Analysis Cache ---
+# The cache persists across runs; entries are keyed by model + prompt texts + field content,
+# so a prompt or model change invalidates them automatically. Set to True to re-analyze everything.
+FORCE_FULL_REFRESH = False
+CACHE_BACKEND = "sqlite" # "sqlite" (per-entry upserts, crash-safe) or "json" (whole-file ollama_analysis_cache.json)
+
+# --- Multi-model Comparison ---
+# When non-empty, the pipeline runs every model on one shared Phase 1 and writes a single comparison workbook
+# (COMPARISON_REPORT_FILENAME) instead of Analysis_Report_<model>.xlsx, e.g.
+# ["gemma3:1b", "llama3.2:1b", "qwen3:1.7b", "deepseek-r1:1.5b"]
+COMPARISON_MODELS = []
+COMPARISON_REPORT_FILENAME = "Model_Comparison_Report.xlsx"
+COMPARISON_USE_PRE_CLASSIFIER = False # Rule verdicts are identical for every model and would inflate agreement
+COMPARISON_UNLOAD_BETWEEN_MODELS = True # Free the previous model's memory before loading the next one
+
+# --- Incremental Runs ---
+# When True, a manifest of per-file and per-property content hashes (INCREMENTAL_STATE_DIR) is kept between runs:
+# unchanged files reuse their Phase 1 results and only added or changed properties go to Phase 2.
+INCREMENTAL_MODE = False
+INCREMENTAL_STATE_DIR = os.path.join(PROJECT_ROOT_DIR, ".incremental_state")
+
+# --- Run Metrics ---
+# Per-phase times, every Ollama call (wall time and server-side token counts/durations), cache hits/misses and
+# hot-path timings are written as JSON lines to RUN_METRICS_DIR and summarized in a "Run Metrics" report sheet.
+RUN_METRICS_ENABLED = True
+RUN_METRICS_DIR = os.path.join(PROJECT_ROOT_DIR, "run_metrics")
+
+# --- Phase 3 Outputs ---
+# Extra machine-readable outputs written next to the Excel report, record by record (no DataFrames):
+# per-field verdicts and flattened schema rows as EXPORT_DIR/<model>_verdicts.<ext> and <model>_schema_rows.<ext>.
+# Any of "jsonl", "csv", "parquet" (Parquet needs the optional 'pyarrow' package), e.g. ["jsonl", "csv"].
+EXPORT_FORMATS = []
+EXPORT_DIR = os.path.join(PROJECT_ROOT_DIR, "exports")
+# xlsxwriter constant_memory mode: every row is flushed once the next one is written, so memory stays flat
+# regardless of sheet size. Repeated cells of the schema sheets are then left blank instead of merged.
+EXCEL_CONSTANT_MEMORY = False
+
+# --- Pipelined Execution ---
+# When True, Phase 1, Phase 2 and sheet writing overlap: files go to the dispatcher as soon as they are parsed,
+# each schema sheet is written once all of its fields have verdicts, and only the summary sheets and the workbook
+# save wait for the whole run. Ignored with INCREMENTAL_MODE (its diff needs every file first) and COMPARISON_MODELS.
+PIPELINED_MODE = False
+PIPELINED_PARTIAL_RESULTS = True # Append each completed file's verdicts to EXPORT_DIR/<model>_partial_verdicts.jsonl during the run
+
+# --- Service Mode ---
+# When True, main.py runs as a long-lived service instead of a single run: the prompts, the analysis cache and the
+# loaded model stay resident. JSON_FILES_DIR_CONFIG is polled and every settled change (files added, changed or
+# removed) triggers an incremental run (INCREMENTAL_MODE) that rewrites the report. A local HTTP API classifies posted
+# schemas and single fields synchronously (see classification_service.ClassificationServer), sharing the cache.
+SERVICE_MODE = False
+SERVICE_HOST = "127.0.0.1" # Local only: the API has no authentication
+SERVICE_PORT = 8765
+SERVICE_WATCH_ENABLED = True
+SERVICE_POLL_INTERVAL_SECONDS = 5.0 # Directory poll period (a change is processed once it is unchanged for one period)
+SERVICE_KEEP_WARM_INTERVAL_SECONDS = 600 # Re-pin the model (warm-up request) this often, below ollama_analyzer.OLLAMA_KEEP_ALIVE
+SERVICE_METRICS_ROTATE_RECORDS = 10000 # Run metrics of the API calls are written to RUN_METRICS_DIR every N records
+
 # Remover PROPERTIES_TO_SKIP_ANALYSIS, pois não vamos mais filtrar antes do LLM
 # PROPERTIES_TO_SKIP_ANALYSIS = [...] 
 
-def _collect_properties_for_analysis(json_files_dir):
+def _iter_ingested_schema_files(json_filepaths):
+    """
+    Yields schema_parser.ingest_schema_file results in the order of json_filepaths, as soon as each one is ready;
+    uses a process pool when there are enough files (the pool parses ahead of the consumer).
+    """
+    if not json_filepaths:
+        return
+    max_workers = PHASE1_MAX_WORKERS or os.cpu_count() or 1
+    if len(json_filepaths) >= PHASE1_PARALLEL_MIN_FILES and max_workers > 1:
+        print(f"  [Phase 1] Parallel ingestion of {len(json_filepaths)} files with {max_workers} processes (JSON decoder: {'orjson' if schema_parser.orjson else 'json'}).")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # map() yields results in submission order, so the merge below is deterministic
+            yield from executor.map(
+                functools.partial(schema_parser.ingest_schema_file, streaming_mode=STREAMING_FLATTEN_MODE),
+                json_filepaths,
+                chunksize=max(1, len(json_filepaths) // (max_workers * 4))
+            )
+        return
+    print(f"  [Phase 1] In-process ingestion of {len(json_filepaths)} files (JSON decoder: {'orjson' if schema_parser.orjson else 'json'}).")
+    for filepath in json_filepaths:
+        yield schema_parser.ingest_schema_file(filepath, streaming_mode=STREAMING_FLATTEN_MODE)
+
+
+def _ingest_schema_files(json_filepaths):
+    """Runs schema_parser.ingest_schema_file for every path, in a process pool when there are enough files."""
+    return list(_iter_ingested_schema_files(json_filepaths))
+
+
+def _list_schema_filepaths(json_files_dir):
+    """Sorted paths of the .json files of json_files_dir (None, after logging why, when there are none)."""
+    if not os.path.exists(json_files_dir):
+        print(f"[PHASE 1 ERROR] JSONs directory not found: {json_files_dir}")
+        return None
+        
+    json_files_list = [f for f in os.listdir(json_files_dir) if f.endswith(".json")]
+    if not json_files_list:
+        print(f"[PHASE 1 ERROR] No .json files found in {json_files_dir}")
+        return None
+
+    # Sorted so that sheets, keys and merges are identical whatever the listing or completion order
+    json_files_list.sort()
+    return [os.path.join(json_files_dir, filename) for filename in json_files_list]
+
+
+def _collect_properties_for_analysis(json_files_dir, manifest=None):
     """
     Phase 1: Loads schemas, extracts all properties with descriptions.
     No pre-filtering here; LLM should assess everything.
+    manifest: incremental_manifest.SchemaManifest (INCREMENTAL_MODE); unchanged files reuse their stored Phase 1 results.
     Returns:
-        all_properties_to_analyze (dict): {unique_key: description} for analysis.
+        field_registry (schema_parser.FieldRegistry): every property for analysis, with its description, schema
+            fragment hash and $ref alias; the rest of the run refers to properties by their field id.
         all_files_parsed_data (dict): {filename: {'schema_data': ..., 'collected_rows_for_excel': ...}}
+            (in STREAMING_FLATTEN_MODE: {filename: {'row_source': ..., 'max_row_depth': ...}})
     """
     print("\n--- PHASE 1: Collecting All Properties with Descriptions ---")
     # ... (lógica interna como em _collect_all_properties da resposta anterior)
-    all_properties_to_analyze = {} 
+    field_registry = schema_parser.FieldRegistry()
     all_files_parsed_data = {} 
 
-    if not os.path.exists(json_files_dir):
-        print(f"[PHASE 1 ERROR] JSONs directory not found: {json_files_dir}")
-        return None, None
-        
-    json_files_list = [f for f in os.listdir(json_files_dir) if f.endswith(".json")]
-    if not json_files_list:
-        print(f"[PHASE 1 ERROR] No .json files found in {json_files_dir}")
+    json_filepaths = _list_schema_filepaths(json_files_dir)
+    if json_filepaths is None:
         return None, None
 
-    for filename in json_files_list:
-        print(f"  [Phase 1] Processing file for collection: {filename}")
-        filepath = os.path.join(json_files_dir, filename)
-        schema_data = schema_parser.load_schema(filepath)
-        
-        if not schema_data:
-            all_files_parsed_data[filename] = {'error': "Failed to load schema."}
-            continue
+    schema_parser.reset_ref_resolvers() # Referenced documents may have changed since the last run in this process
 
-        all_files_parsed_data[filename] = {
-            'schema_data': schema_data,
-            'collected_rows_for_excel': schema_parser.flatten_schema_for_excel(schema_data)
+    reused_files = {}
+    ingestion_tokens = {}
+    if manifest is not None:
+        file_fingerprints = manifest.compute_file_fingerprints(json_filepaths)
+        file_changes = manifest.diff_files(file_fingerprints)
+        print(f"  [Phase 1 INCREMENTAL] Files: {len(file_changes['added'])} added, {len(file_changes['changed'])} changed, {len(file_changes['removed'])} removed, {len(file_changes['unchanged'])} unchanged.")
+        for filename in file_changes['added'] + file_changes['changed'] + file_changes['removed']:
+            status = 'added' if filename in file_changes['added'] else 'changed' if filename in file_changes['changed'] else 'removed'
+            print(f"    [Phase 1 INCREMENTAL] {status}: {filename}")
+        ingestion_tokens = {
+            filename: utils.compute_content_hash(fingerprint, STREAMING_FLATTEN_MODE)
+            for filename, fingerprint in file_fingerprints.items()
         }
-        
-        file_properties_with_desc = schema_parser.extract_all_properties_with_descriptions(
-            schema_data, filename_context=filename
-        )
-        
-        for unique_key, description_text in file_properties_with_desc.items():
-             all_properties_to_analyze[unique_key] = description_text if description_text else ""
+        for filename in file_changes['unchanged']:
+            ingested_file = manifest.load_ingestion(filename, ingestion_tokens[filename])
+            if ingested_file is not None:
+                reused_files[filename] = ingested_file
+
+    new_ingestions = {
+        ingested_file[0]: ingested_file
+        for ingested_file in _ingest_schema_files([path for path in json_filepaths if os.path.basename(path) not in reused_files])
+    }
+    if manifest is not None:
+        for filename, ingested_file in new_ingestions.items():
+            if 'error' not in ingested_file[1]:
+                manifest.store_ingestion(filename, ingestion_tokens[filename], ingested_file)
+
+    for filepath in json_filepaths:
+        filename = os.path.basename(filepath)
+        is_reused = filename in reused_files
+        _, file_data, file_properties_with_desc, parse_seconds = reused_files[filename] if is_reused else new_ingestions[filename]
+        all_files_parsed_data[filename] = file_data
+        if 'error' in file_data:
+            print(f"    [Phase 1] {filename}: {file_data['error']} ({parse_seconds * 1000:.1f} ms)")
+            continue
+        _register_file_properties(field_registry, filename, file_data, file_properties_with_desc)
+        if is_reused:
+            print(f"    [Phase 1] {filename}: {len(file_properties_with_desc)} properties with description found (unchanged, reused from incremental state).")
+            continue
+        print(f"    [Phase 1] {filename}: {len(file_properties_with_desc)} properties with description found (to be sent to LLM), parsed in {parse_seconds * 1000:.1f} ms.")
+
+    print(f"--- PHASE 1 COMPLETED. {len(field_registry)} unique properties with descriptions for PII analysis. ---")
+    return field_registry, all_files_parsed_data
 
-        print(f"    [Phase 1] {filename}: {len(file_properties_with_desc)} properties with description found (to be sent to LLM).")
 
-    print(f"--- PHASE 1 COMPLETED. {len(all_properties_to_analyze)} unique properties with descriptions for PII analysis. ---")
-    return all_properties_to_analyze, all_files_parsed_data
+def _register_file_properties(field_registry, filename, file_data, file_properties_with_desc):
+    """
+    Registers a parsed file's properties in field_registry; the registry takes over the file's property fragments
+    and $ref aliases, so they are dropped from file_data. Returns the file's field ids.
+    """
+    return field_registry.add_file(
+        filename, file_properties_with_desc, file_data.pop('property_fragments', None), file_data.pop('ref_aliases', None)
+    )
 
 
-def _run_ollama_analysis_phase(properties_map_to_analyze, ollama_cache):
+def _group_properties_for_analysis(field_registry):
     """
-    Phase 2: Sends properties for Ollama analysis, using and updating the cache.
-    Returns: updated ollama_cache.
+    Grouping stage between Phase 1 and Phase 2: puts identical field definitions from all files
+    into equivalence classes so that each class costs a single Ollama call.
+    Properties inherited from the same $ref definition always share a class.
+    Returns: list of classes (lists of field ids, representative first).
     """
-    print("\n--- PHASE 2: Detailed Field Analysis with Ollama and Cache ---")
-    # ... (lógica como antes, mas chamando ollama_analyzer.analyze_single_field_ollama) ...
-    # ... (e usando as chaves de resultado em inglês: pii_sensitivity_assessment, gdpr_justification) ...
-    properties_to_send_to_ollama = []
-    for unique_key, description in properties_map_to_analyze.items():
-        if unique_key not in ollama_cache:
-            properties_to_send_to_ollama.append({"unique_key": unique_key, "description": description})
+    print("\n--- GROUPING: Cross-file Deduplication of Field Definitions ---")
+    property_classes = schema_parser.group_equivalent_properties(field_registry)
+    calls_saved = len(field_registry) - len(property_classes)
+    print(f"--- GROUPING COMPLETED. {len(field_registry)} properties in {len(property_classes)} equivalence classes ({calls_saved} Ollama calls saved). ---")
+    return property_classes
 
-    total_new_to_analyze = len(properties_to_send_to_ollama)
-    print(f"  [Phase 2] {total_new_to_analyze} new properties for Ollama (total unique candidates: {len(properties_map_to_analyze)}, already cached: {len(ollama_cache)}).")
 
-    if total_new_to_analyze == 0 and ollama_cache:
-        print("  [Phase 2] No new properties to analyze. Using existing cache.")
-        return ollama_cache
-    elif total_new_to_analyze == 0 and not ollama_cache:
-        print("  [Phase 2] No properties to analyze and cache is empty. Ollama analysis skipped.")
-        return ollama_cache
+def _build_phase2_work_items(field_registry, properties_to_send_to_ollama, batch_size, first_position=1, priority_order=False):
+    """
+    Splits the fields to analyze into batches of at most batch_size fields of the same schema file (the file index
+    of their field_registry record), keeping schema order so that sibling fields travel together.
+    priority_order: fields carry a "priority" (pre_classifier.score_pii_likelihood); each file's fields are batched
+    from the highest priority down and the batches of all files are sorted by their best field.
+    Returns: list of (position of the first field, [field_to_analyze, ...]).
+    """
+    fields_by_file = {}
+    for field_to_analyze in properties_to_send_to_ollama:
+        fields_by_file.setdefault(field_registry.record(field_to_analyze["field_id"]).file_index, []).append(field_to_analyze)
 
-    newly_analyzed_this_run = 0
-    for idx, field_to_analyze in enumerate(properties_to_send_to_ollama):
-        unique_key = field_to_analyze["unique_key"]
-        description = field_to_analyze["description"]
-        
-        time.sleep(0.2) 
-        
-        analysis_result = ollama_analyzer.analyze_single_field_ollama( # Nome da função atualizado
-            unique_key, 
-            description,
-            current_count=idx + 1,
-            total_count=total_new_to_analyze
+    batches = []
+    batch_size = max(1, batch_size)
+    for file_fields in fields_by_file.values():
+        if priority_order:
+            file_fields = sorted(file_fields, key=lambda field_to_analyze: -field_to_analyze["priority"]) # Stable: schema order among ties
+        for batch_start in range(0, len(file_fields), batch_size):
+            batches.append(file_fields[batch_start:batch_start + batch_size])
+    if priority_order:
+        batches.sort(key=lambda batch: -batch[0]["priority"])
+
+    work_items = []
+    position = first_position
+    for batch in batches:
+        work_items.append((position, batch))
+        position += len(batch)
+    return work_items
+
+
+def _retry_work_items(position, retry_fields, results_by_cache_key):
+    """
+    Work items re-queued for the transient failures of a batch: fields whose verdict was missing from the batch
+    answer are retried one per request, the others (the whole request failed) together as one batch.
+    """
+    missing_fields = [field_to_analyze for field_to_analyze in retry_fields if results_by_cache_key[field_to_analyze["cache_key"]].get(
+        "pii_sensitivity_assessment") == ollama_analyzer.BATCH_VERDICT_MISSING_ASSESSMENT]
+    batch_fields = [field_to_analyze for field_to_analyze in retry_fields if field_to_analyze not in missing_fields]
+    return [(position, [field_to_analyze]) for field_to_analyze in missing_fields] + ([(position, batch_fields)] if batch_fields else [])
+
+
+class _Phase2ClassPlanner:
+    """
+    Phase 2 planning: decides each equivalence class from the rule tier (pre_classifier_threshold) or the cache, and
+    merges the classes left to send on their representative's content key, so each key is sent once.
+    pending_by_cache_key: representative cache_key -> {"field_ids": [...], "cache_keys": [...]} (+ "result" once stored)
+    pending_by_class_id: class_id -> its pending entry (shared by classes merged on the same cache_key)
+    set_results(field_ids, analysis_result) records the final result of properties.
+    """
+
+    def __init__(self, field_registry, ollama_cache, model_name, set_results, force_refresh=False, pre_classifier_threshold=None):
+        self.field_registry = field_registry
+        self.ollama_cache = ollama_cache
+        self.model_name = model_name
+        self.set_results = set_results
+        self.force_refresh = force_refresh
+        self.pre_classifier_threshold = pre_classifier_threshold
+        self.pending_by_cache_key = {}
+        self.pending_by_class_id = {}
+        self.counts = {"classes": 0, "decided_by_rules": 0, "cache_hits": 0}
+
+    def _set_answered_results(self, pending, class_members, member_cache_keys):
+        # Members added after their request was answered share its result (and its cache entry, unless it was a transient failure)
+        if pending.get("cache_new_members"):
+            for field_id, cache_key in zip(class_members, member_cache_keys):
+                self.ollama_cache.put(cache_key, pending["result"], unique_key=self.field_registry.unique_key(field_id))
+        self.set_results(class_members, pending["result"])
+
+    def plan_class(self, class_id, class_members):
+        """Decides a class (or the new members of a known class) from rules or cache; returns its field to send to Ollama, if any."""
+        member_cache_keys = [
+            ollama_analyzer.build_analysis_cache_key(self.field_registry.record(field_id), self.model_name) for field_id in class_members
+        ]
+        known_pending = self.pending_by_class_id.get(class_id)
+        if known_pending is not None: # Pipelined mode: a later file adds members to a class planned earlier
+            if "result" not in known_pending:
+                known_pending["field_ids"].extend(class_members)
+                known_pending["cache_keys"].extend(member_cache_keys)
+                return None
+            self._set_answered_results(known_pending, class_members, member_cache_keys)
+            return None
+
+        self.counts["classes"] += 1
+        representative_record = self.field_registry.record(class_members[0])
+        if self.pre_classifier_threshold is not None:
+            rule_verdict = pre_classifier.classify_field(representative_record.path, representative_record.description)
+            if rule_verdict is not None and rule_verdict["confidence"] >= self.pre_classifier_threshold:
+                self.pending_by_class_id[class_id] = {"result": rule_verdict}
+                self.set_results(class_members, rule_verdict)
+                self.counts["decided_by_rules"] += 1
+                return None
+
+        cached_result = None
+        if not self.force_refresh:
+            cached_result = next(
+                (result for result in (self.ollama_cache.get(cache_key) for cache_key in member_cache_keys)
+                 if result is not None and dispatcher.classify_failure(result) != dispatcher.FAILURE_TRANSIENT), None
+            )
+        if cached_result is not None:
+            self.pending_by_class_id[class_id] = {"result": cached_result}
+            self.set_results(class_members, cached_result)
+            self.counts["cache_hits"] += 1
+            return None
+        # Classes whose representatives share a content key are merged and sent once
+        is_new_request = member_cache_keys[0] not in self.pending_by_cache_key
+        pending = self.pending_by_cache_key.setdefault(member_cache_keys[0], {"field_ids": [], "cache_keys": []})
+        self.pending_by_class_id[class_id] = pending
+        if "result" in pending: # Pipelined mode: merged with a request that has already been answered
+            self._set_answered_results(pending, class_members, member_cache_keys)
+            return None
+        pending["field_ids"].extend(class_members)
+        pending["cache_keys"].extend(member_cache_keys)
+        if not is_new_request:
+            return None
+        field_to_analyze = {"cache_key": member_cache_keys[0], "field_id": class_members[0]}
+        if PHASE2_PRIORITY_ORDER:
+            field_to_analyze["priority"] = pre_classifier.score_pii_likelihood(representative_record.path, representative_record.description)
+        return field_to_analyze
+
+
+def _run_ollama_analysis_phase(field_registry, ollama_cache, force_refresh=False, property_classes=None,
+                               pre_classifier_threshold=None, model_name=None, phase2_stats=None,
+                               class_update_source=None, on_results=None):
+    """
+    Phase 2: Sends the properties of field_registry (schema_parser.FieldRegistry) for Ollama analysis, using and updating the cache.
+    The persistent cache is content-addressed (see ollama_analyzer.build_analysis_cache_key), so
+    unchanged fields are served from previous runs, other schema files and earlier model comparisons.
+    force_refresh: re-analyze every property and overwrite its cache entry.
+    property_classes: equivalence classes from _group_properties_for_analysis; only the first member
+        of each class (lists of field ids) is sent to Ollama and its verdict fans out to every member. Defaults to one class per property.
+    pre_classifier_threshold: if set, classes whose rule verdict (pre_classifier) reaches this confidence
+        are decided by the rule tier and never reach the cache or the LLM.
+    model_name: Ollama model to use (defaults to ollama_analyzer.OLLAMA_MODEL).
+    phase2_stats: optional dict filled with this run's dispatch numbers
+        ({"llm_fields_analyzed", "llm_errors", "dispatch_seconds", "warmup_seconds", "completion_tokens", "verdict_times",
+          "retries", "final_pass_items", "unresolved_transient_failures", "pending_fields"}).
+    class_update_source: pipelined mode (replaces property_classes): iterable of [(class_id, [new field ids])] lists
+        (schema_parser.EquivalenceClassIndex.add_fields), one per parsed file, that may block until the next file is
+        parsed. It is consumed on a planning thread while dispatch already runs; the same producer registers each file
+        in field_registry before its list is yielded.
+    on_results: optional callback(field_ids, analysis_result) called, under the dispatcher lock, whenever properties get
+        their final result (used to detect files whose fields are all decided).
+    Transient failures are retried (PHASE2_MAX_ATTEMPTS, final retry pass) and never cached, so the next run retries them too;
+    cached transient failures of older runs are treated as cache misses.
+    Returns: analysis_results (dict): {field_id: analysis_result} for every property of this run, in field id order.
+    """
+    model_name = model_name or ollama_analyzer.OLLAMA_MODEL
+    print(f"\n--- PHASE 2: Detailed Field Analysis with Ollama ({model_name}) and Cache ---")
+    if phase2_stats is None:
+        phase2_stats = {}
+    phase2_stats.update({
+        "llm_fields_analyzed": 0, "llm_errors": 0, "dispatch_seconds": 0.0, "warmup_seconds": None,
+        "completion_tokens": 0, "verdict_times": [], "retries": 0, "final_pass_items": 0, "unresolved_transient_failures": 0
+    })
+    if property_classes is None and class_update_source is None:
+        property_classes = [[field_id] for field_id in field_registry.field_ids()]
+
+    analysis_results = {}
+
+    def _set_results(field_ids, analysis_result):
+        for field_id in field_ids:
+            analysis_results[field_id] = analysis_result
+        if on_results is not None:
+            on_results(field_ids, analysis_result)
+
+    def _log_plan_summary():
+        plan_counts = class_planner.counts
+        total_new_to_analyze = len(pending_by_cache_key) - similarity_tier.reused_count - similarity_tier.follower_count
+        metrics.increment("pre_classifier_decisions", plan_counts["decided_by_rules"])
+        metrics.increment("cache_hits", plan_counts["cache_hits"])
+        metrics.increment("cache_misses", plan_counts["classes"] - plan_counts["decided_by_rules"] - plan_counts["cache_hits"])
+        similarity_summary = ""
+        if similarity_tier.verdict_index is not None:
+            metrics.increment("similarity_reused", similarity_tier.reused_count)
+            metrics.increment("similarity_followers", similarity_tier.follower_count)
+            similarity_summary = f", similar to an analyzed field: {similarity_tier.reused_count}, waiting for a similar field: {similarity_tier.follower_count}"
+        print(f"  [Phase 2] {total_new_to_analyze} new Ollama calls (total properties: {len(field_registry)}, equivalence classes: {plan_counts['classes']}, decided by rules: {plan_counts['decided_by_rules']} classes{similarity_summary}, properties with results: {len(analysis_results)}, force refresh: {force_refresh}).")
+
+    metrics = run_metrics.get_run_metrics()
+    progress = {"planned": 0, "completed": 0, "since_last_save": 0}
+    ollama_client = ollama_analyzer.get_ollama_client()
+    requests_redispatched_before = getattr(ollama_client, "requests_redispatched", 0)
+    class_planner = _Phase2ClassPlanner(field_registry, ollama_cache, model_name, _set_results, force_refresh, pre_classifier_threshold)
+    pending_by_cache_key = class_planner.pending_by_cache_key
+    similarity_tier = similarity_index.SimilarityTier(
+        _open_similarity_index(model_name) if SIMILARITY_REUSE_ENABLED else None, SIMILARITY_THRESHOLD,
+        ollama_analyzer.embed_texts, _set_results, reuse_indexed_verdicts=not force_refresh
+    )
+
+    def _embed_fields(fields_to_send):
+        return similarity_tier.embed_fields([field_registry.record(field_to_analyze["field_id"]) for field_to_analyze in fields_to_send])
+    work_feed = None
+    if class_update_source is None:
+        properties_to_send_to_ollama = [
+            field_to_analyze for field_to_analyze in (
+                class_planner.plan_class(class_id, class_members) for class_id, class_members in enumerate(property_classes)
+            ) if field_to_analyze is not None
+        ]
+        properties_to_send_to_ollama = similarity_tier.apply(properties_to_send_to_ollama, _embed_fields(properties_to_send_to_ollama), pending_by_cache_key)
+        progress["planned"] = len(properties_to_send_to_ollama)
+        _log_plan_summary()
+        if not properties_to_send_to_ollama:
+            print("  [Phase 2] No new properties to analyze. Using existing cache.")
+            return analysis_results
+        if ollama_analyzer.OLLAMA_WARMUP_ENABLED:
+            # Before dispatch, so the model load time is neither counted as field latency nor seen by the limiter
+            phase2_stats["warmup_seconds"] = ollama_client.warm_up(model_name)
+        work_items = _build_phase2_work_items(field_registry, properties_to_send_to_ollama, FIELD_BATCH_SIZE, priority_order=PHASE2_PRIORITY_ORDER)
+        print(f"  [Phase 2] {len(work_items)} chat requests planned (batch size: {FIELD_BATCH_SIZE}, order: {'PII likelihood' if PHASE2_PRIORITY_ORDER else 'schema'}).")
+    else:
+        work_items = work_feed = dispatcher.WorkItemFeed()
+        planning_errors = []
+
+        def _plan_updates_as_files_arrive():
+            try:
+                for class_updates in class_update_source:
+                    with work_feed.condition:
+                        fields_to_send = [
+                            field_to_analyze for field_to_analyze in (
+                                class_planner.plan_class(class_id, new_members) for class_id, new_members in class_updates
+                            ) if field_to_analyze is not None
+                        ]
+                    field_vectors = _embed_fields(fields_to_send) # Outside the lock: dispatch goes on meanwhile
+                    with work_feed.condition:
+                        fields_to_send = similarity_tier.apply(fields_to_send, field_vectors, pending_by_cache_key)
+                    if not fields_to_send:
+                        continue
+                    if ollama_analyzer.OLLAMA_WARMUP_ENABLED and phase2_stats["warmup_seconds"] is None:
+                        phase2_stats["warmup_seconds"] = ollama_client.warm_up(model_name)
+                    with work_feed.condition:
+                        for work_item in _build_phase2_work_items(field_registry, fields_to_send, FIELD_BATCH_SIZE, progress["planned"] + 1, PHASE2_PRIORITY_ORDER):
+                            work_feed.put(work_item, priority=work_item[1][0]["priority"] if PHASE2_PRIORITY_ORDER else 0)
+                        progress["planned"] += len(fields_to_send)
+                with work_feed.condition:
+                    _log_plan_summary()
+            except BaseException as planning_error: # Re-raised by the dispatching thread once the feed is drained
+                planning_errors.append(planning_error)
+            finally:
+                work_feed.close()
+
+        planning_thread = threading.Thread(target=_plan_updates_as_files_arrive, name="phase2-planning", daemon=True)
+        planning_thread.start()
+        print(f"  [Phase 2] Pipelined: fields are planned and dispatched as schema files are parsed (batch size: {FIELD_BATCH_SIZE}).")
+
+    limiter = dispatcher.AdaptiveConcurrencyLimiter(
+        max_limit=PHASE2_MAX_IN_FLIGHT_REQUESTS,
+        min_limit=PHASE2_MIN_IN_FLIGHT_REQUESTS,
+        adaptive=PHASE2_ADAPTIVE_CONCURRENCY
+    )
+    print(f"  [Phase 2] Dispatching with up to {limiter.max_limit} in-flight requests (adaptive: {limiter.adaptive}).")
+
+    def _analyze(work_item):
+        position, batch = work_item
+        batch_results = ollama_analyzer.analyze_field_batch_ollama(
+            field_registry,
+            [field_to_analyze["field_id"] for field_to_analyze in batch],
+            current_count=position,
+            total_count=progress["planned"],
+            model_name=model_name
+        )
+        return {field_to_analyze["cache_key"]: batch_results[field_to_analyze["field_id"]] for field_to_analyze in batch}
+
+    def _store_result(work_item, results_by_cache_key, can_retry):
+        # Called under the dispatcher's results lock; returns the fields to re-queue (transient failures), if any
+        position, batch = work_item
+        retry_fields = []
+        for field_to_analyze in batch:
+            representative_cache_key = field_to_analyze["cache_key"]
+            analysis_result = results_by_cache_key[representative_cache_key]
+            failure_class = dispatcher.classify_failure(analysis_result)
+            if failure_class == dispatcher.FAILURE_TRANSIENT and can_retry:
+                retry_fields.append(field_to_analyze)
+                continue
+            analysis_result["analysis_tier"] = pre_classifier.TIER_LLM
+            pending = pending_by_cache_key[representative_cache_key]
+            for member_field_id, cache_key in zip(pending["field_ids"], pending["cache_keys"]):
+                if failure_class == dispatcher.FAILURE_TRANSIENT: # Out of attempts: reported, logged, but not cached
+                    ollama_cache.record_failure(cache_key, analysis_result, unique_key=field_registry.unique_key(member_field_id))
+                else:
+                    ollama_cache.put(cache_key, analysis_result, unique_key=field_registry.unique_key(member_field_id))
+            pending["result"] = analysis_result # Members planned later (pipelined mode) take it directly
+            pending["cache_new_members"] = failure_class != dispatcher.FAILURE_TRANSIENT
+            _set_results(pending["field_ids"], analysis_result)
+            representative_unique_key = field_registry.unique_key(field_to_analyze["field_id"])
+            if failure_class is None:
+                similarity_tier.add_verdict(field_to_analyze, representative_unique_key, analysis_result)
+            similarity_tier.resolve_followers(pending, representative_unique_key, analysis_result, failure_class is None)
+            if failure_class is not None:
+                phase2_stats["llm_errors"] += 1
+            if failure_class == dispatcher.FAILURE_TRANSIENT:
+                phase2_stats["unresolved_transient_failures"] += 1
+        if retry_fields:
+            print(f"    [Phase 2 RETRY] {len(retry_fields)} field(s) re-queued after a transient failure ({results_by_cache_key[retry_fields[0]['cache_key']].get('pii_sensitivity_assessment')}).")
+        # Fields of one batched request share its metrics: count each request (retried ones included) once
+        for response_metrics in {id(result.get("response_metrics")): result.get("response_metrics") for result in results_by_cache_key.values()}.values():
+            if response_metrics:
+                phase2_stats["completion_tokens"] += response_metrics.get("completion_tokens") or 0
+                if response_metrics.get("time_to_verdict_s") is not None:
+                    phase2_stats["verdict_times"].append(response_metrics["time_to_verdict_s"])
+        fields_done = len(batch) - len(retry_fields)
+        previous_completed = progress["completed"]
+        progress["completed"] += fields_done
+        completed = progress["completed"]
+        if completed // PHASE2_PROGRESS_LOG_INTERVAL > previous_completed // PHASE2_PROGRESS_LOG_INTERVAL or completed == progress["planned"]:
+            print(f"    [Phase 2 PROGRESS] {completed}/{progress['planned']} analyzed (concurrency limit: {limiter.current_limit}).")
+        progress["since_last_save"] += fields_done
+        if ollama_cache.requires_periodic_flush and progress["since_last_save"] >= PHASE2_CACHE_SAVE_INTERVAL:
+            progress["since_last_save"] = 0
+            print(f"    [Phase 2 CACHE] Flushing Ollama cache ({ollama_cache.name} backend)...")
+            ollama_cache.flush()
+        return _retry_work_items(position, retry_fields, results_by_cache_key)
+
+    retry_policy = dispatcher.RetryPolicy(
+        max_attempts=PHASE2_MAX_ATTEMPTS,
+        base_delay_s=PHASE2_RETRY_BASE_DELAY_SECONDS,
+        max_delay_s=PHASE2_RETRY_MAX_DELAY_SECONDS,
+        final_pass=PHASE2_FINAL_RETRY_PASS
+    )
+    circuit_breaker = dispatcher.CircuitBreaker(
+        failure_threshold=PHASE2_CIRCUIT_BREAKER_FAILURES,
+        cooldown_s=PHASE2_CIRCUIT_BREAKER_COOLDOWN_SECONDS,
+        max_failed_probes=PHASE2_CIRCUIT_BREAKER_MAX_PROBES
+    )
+
+    budget = None
+    if PHASE2_TIME_BUDGET_SECONDS is not None or PHASE2_REQUEST_BUDGET is not None:
+        budget = dispatcher.DispatchBudget(max_seconds=PHASE2_TIME_BUDGET_SECONDS, max_requests=PHASE2_REQUEST_BUDGET)
+        print(f"  [Phase 2] Budget: {PHASE2_TIME_BUDGET_SECONDS or 'unlimited'} seconds, {PHASE2_REQUEST_BUDGET or 'unlimited'} requests.")
+
+    dispatch_started_at = time.perf_counter()
+    dispatch_stats = dispatcher.run_concurrent_analysis(
+        work_items, _analyze, _store_result, limiter, overload_check=dispatcher.is_overload_batch_result,
+        retry_policy=retry_policy, circuit_breaker=circuit_breaker, budget=budget
+    )
+    phase2_stats["dispatch_seconds"] = time.perf_counter() - dispatch_started_at
+    if work_feed is not None:
+        planning_thread.join()
+        if planning_errors:
+            raise planning_errors[0]
+    abandoned_fields = 0
+    if dispatch_stats["abandoned_items"]:
+        abandoned_fields = sum(len(batch) for _, batch in dispatch_stats["abandoned_items"])
+        print(f"  [Phase 2] Ollama server unavailable: {abandoned_fields} field(s) not analyzed in this run (not cached, retried on the next run).")
+        for work_item in dispatch_stats["abandoned_items"]:
+            unavailable_result = {
+                "pii_sensitivity_assessment": "ERROR_OLLAMA_UNAVAILABLE",
+                "gdpr_justification": "Not sent: the Ollama server kept failing and dispatch was stopped by the circuit breaker."
+            }
+            _store_result(work_item, {field_to_analyze["cache_key"]: unavailable_result for field_to_analyze in work_item[1]}, False)
+    phase2_stats["pending_fields"] = 0
+    if dispatch_stats["budget_exhausted_items"]:
+        for _, batch in dispatch_stats["budget_exhausted_items"]:
+            for field_to_analyze in batch:
+                pending_result = {
+                    "pii_sensitivity_assessment": dispatcher.PENDING_ASSESSMENT,
+                    "gdpr_justification": f"Not analyzed: the Phase 2 {budget.exhausted_reason} was used up before this field was sent.",
+                    "analysis_tier": dispatcher.PENDING_ASSESSMENT
+                }
+                pending = pending_by_cache_key[field_to_analyze["cache_key"]]
+                pending["result"] = pending_result # Not cached: the next run analyzes it
+                pending["cache_new_members"] = False
+                _set_results(pending["field_ids"], pending_result)
+                similarity_tier.resolve_followers(pending, field_registry.unique_key(field_to_analyze["field_id"]), pending_result, False)
+                phase2_stats["pending_fields"] += 1
+        print(f"  [Phase 2] Budget used up ({budget.exhausted_reason}): {phase2_stats['pending_fields']} field(s) reported as {dispatcher.PENDING_ASSESSMENT} (not cached, analyzed by the next run).")
+        metrics.increment("budget_pending_fields", phase2_stats["pending_fields"])
+    phase2_stats["llm_fields_analyzed"] = progress["completed"] - abandoned_fields
+    phase2_stats["retries"] = dispatch_stats["retries"]
+    phase2_stats["final_pass_items"] = dispatch_stats["final_pass_items"]
+    metrics.increment("llm_fields_analyzed", phase2_stats["llm_fields_analyzed"])
+    metrics.increment("llm_errors", phase2_stats["llm_errors"])
+    metrics.increment("retried_requests", dispatch_stats["retries"] + dispatch_stats["final_pass_items"])
+    metrics.increment("unresolved_transient_failures", phase2_stats["unresolved_transient_failures"])
+    metrics.increment("circuit_breaker_openings", circuit_breaker.times_opened)
+    print(f"  [Phase 2] {dispatch_stats['retries']} request(s) retried with backoff, {dispatch_stats['final_pass_items']} in the final retry pass, "
+          f"circuit opened {circuit_breaker.times_opened} time(s); {phase2_stats['unresolved_transient_failures']} field(s) still failing transiently (not cached).")
+
+    print(f"  [Phase 2 CACHE] Flushing final Ollama cache ({ollama_cache.name} backend)...")
+    ollama_cache.flush()
+    similarity_tier.save()
+
+    # Completion order depends on concurrency; restore the Phase 1 (field id) order for a deterministic report
+    analysis_results = dict(sorted(analysis_results.items()))
+
+    connection_stats = ollama_client.get_connection_stats()
+    print(f"  [Phase 2] Ollama HTTP session: {connection_stats['requests_sent']} requests over {connection_stats['connections_opened']} connections (reuse ratio: {connection_stats['connection_reuse_ratio']}, warm-up by model: {connection_stats['warmup_seconds']}).")
+    for endpoint_stats in connection_stats.get("endpoints", []):
+        print(f"  [Phase 2] Endpoint {endpoint_stats['endpoint']}: {endpoint_stats['requests_completed']} requests completed, {endpoint_stats['requests_failed']} failed, "
+              f"mean latency {endpoint_stats['mean_latency_s']}s, {endpoint_stats['requests_per_second']} requests/s, "
+              f"dropped {endpoint_stats['times_dropped']} / re-admitted {endpoint_stats['times_readmitted']} time(s), {'healthy' if endpoint_stats['healthy'] else 'unhealthy'}.")
+        metrics.record("ollama_endpoint", **endpoint_stats)
+    if "requests_redispatched" in connection_stats:
+        metrics.increment("ollama_requests_redispatched", connection_stats["requests_redispatched"] - requests_redispatched_before)
+    print(f"--- PHASE 2 COMPLETED. {len(analysis_results)} properties with results; Ollama cache now has {len(ollama_cache)} total entries. ---")
+    return analysis_results
+
+
+def _open_similarity_index(model_name):
+    """Persisted embedding index of the fields analyzed with this chat model, prompt version and embedding model."""
+    index_fingerprint = utils.compute_content_hash(model_name, ollama_analyzer.get_prompt_fingerprint(), ollama_analyzer.OLLAMA_EMBED_MODEL)
+    embed_model_cleaned = ollama_analyzer.OLLAMA_EMBED_MODEL.replace(":", "_").replace("/", "_")
+    return similarity_index.EmbeddingIndex(os.path.join(SIMILARITY_INDEX_DIR, f"{embed_model_cleaned}_{index_fingerprint[:16]}.npz"))
+
+
+def _get_analysis_fingerprint():
+    """Hash of everything a verdict depends on besides the field itself: model, prompts and pre-classifier rules."""
+    return utils.compute_content_hash(
+        ollama_analyzer.OLLAMA_MODEL,
+        ollama_analyzer.get_prompt_fingerprint(),
+        pre_classifier.get_rules_fingerprint() if PRE_CLASSIFIER_ENABLED else None,
+        PRE_CLASSIFIER_CONFIDENCE_THRESHOLD if PRE_CLASSIFIER_ENABLED else None
+    )
+
+
+def _split_classes_for_incremental_run(field_registry, property_classes, reusable_results):
+    """
+    Incremental mode: classes with a member whose verdict from the previous run is still valid take that
+    verdict for all members; the other classes (added or changed properties) go to Phase 2.
+    reusable_results is keyed by unique_key (as stored in the manifest).
+    Returns (classes_to_analyze, reused_results keyed by field id).
+    """
+    classes_to_analyze = []
+    reused_results = {}
+    for class_members in property_classes:
+        reused_result = next(
+            (reusable_results[unique_key] for unique_key in map(field_registry.unique_key, class_members) if unique_key in reusable_results), None
         )
-        ollama_cache[unique_key] = analysis_result 
-        newly_analyzed_this_run +=1
+        if reused_result is None:
+            classes_to_analyze.append(class_members)
+            continue
+        for field_id in class_members:
+            reused_results[field_id] = reused_result
+    return classes_to_analyze, reused_results
+
+
+def _write_run_metrics(metrics, run_label):
+    if RUN_METRICS_ENABLED:
+        metrics.write_jsonl(os.path.join(RUN_METRICS_DIR, f"run_metrics_{run_label}_{time.strftime('%Y%m%d_%H%M%S')}.jsonl"))
+
+
+def _write_exports(metrics, model_name_cleaned, parsed_files_data, analysis_results, field_registry, property_class_sizes):
+    if EXPORT_FORMATS:
+        with metrics.timed_phase("exports"):
+            report_exporters.export_reports(
+                os.path.join(EXPORT_DIR, model_name_cleaned), EXPORT_FORMATS,
+                parsed_files_data, analysis_results, field_registry, property_class_sizes
+            )
+
+
+def _run_pipelined(force_refresh, model_name_cleaned, output_excel_filename, metrics):
+    """
+    PIPELINED_MODE run: Phase 1 is a generator consumed by the Phase 2 planning thread, so every parsed file goes to
+    the dispatcher right away; a sheet-writer thread fills each file's sheet (IncrementalExcelReport) as soon as all
+    of its fields have verdicts, and appends them to the partial results file. The summary sheets and the workbook
+    save are the only steps that wait for the whole run. Returns analysis_results (None if Phase 1 failed).
+    """
+    json_filepaths = _list_schema_filepaths(JSON_FILES_DIR_CONFIG)
+    if json_filepaths is None:
+        print("Pipeline aborted due to error in property collection.")
+        return
+
+    field_registry = schema_parser.FieldRegistry()
+    parsed_files_data = {}
+    class_index = schema_parser.EquivalenceClassIndex()
+    pending_field_ids_by_file = {} # file index -> field ids still without a final result
+    results_by_file = {}
+    completion_lock = threading.Lock()
+    completed_files = queue.Queue() # (filename, {field_id: analysis_result}); None stops the sheet writer
+    phase1_finished = threading.Event()
+    pipeline_state = {"phase1_completed": False, "sheet_writer_errors": []}
+    pipeline_started_at = time.perf_counter()
+    partial_results_path = os.path.join(EXPORT_DIR, f"{model_name_cleaned}_partial_verdicts.jsonl") if PIPELINED_PARTIAL_RESULTS else None
+    if partial_results_path and os.path.exists(partial_results_path):
+        os.remove(partial_results_path)
+
+    def _on_results(field_ids, analysis_result):
+        # Called under the dispatcher lock: bookkeeping only, the sheet is written by the sheet-writer thread
+        with completion_lock:
+            for field_id in field_ids:
+                file_index = field_registry.record(field_id).file_index
+                file_pending_field_ids = pending_field_ids_by_file.get(file_index)
+                if not file_pending_field_ids or field_id not in file_pending_field_ids:
+                    continue
+                file_pending_field_ids.discard(field_id)
+                results_by_file[file_index][field_id] = analysis_result
+                if not file_pending_field_ids:
+                    del pending_field_ids_by_file[file_index]
+                    completed_files.put((field_registry.file_name(field_id), results_by_file.pop(file_index)))
+
+    def _iter_class_updates():
+        """Phase 1, file by file: registers each file's properties, then yields their equivalence class updates."""
+        print("\n--- PHASE 1 (pipelined): Collecting Properties File by File ---")
+        phase1_started_at = time.perf_counter()
+        schema_parser.reset_ref_resolvers() # Referenced documents may have changed since the last run in this process
+        try:
+            for filename, file_data, file_properties_with_desc, parse_seconds in _iter_ingested_schema_files(json_filepaths):
+                parsed_files_data[filename] = file_data
+                file_field_ids = []
+                if 'error' in file_data:
+                    print(f"    [Phase 1] {filename}: {file_data['error']} ({parse_seconds * 1000:.1f} ms)")
+                else:
+                    file_field_ids = _register_file_properties(field_registry, filename, file_data, file_properties_with_desc)
+                    print(f"    [Phase 1] {filename}: {len(file_field_ids)} properties with description found (to be sent to LLM), parsed in {parse_seconds * 1000:.1f} ms.")
+                with completion_lock:
+                    if file_field_ids:
+                        file_index = field_registry.record(file_field_ids[0]).file_index
+                        pending_field_ids_by_file[file_index] = set(file_field_ids)
+                        results_by_file[file_index] = {}
+                    else:
+                        completed_files.put((filename, {}))
+                yield class_index.add_fields(field_registry, file_field_ids)
+            pipeline_state["phase1_completed"] = True
+            print(f"--- PHASE 1 COMPLETED. {len(field_registry)} unique properties with descriptions for PII analysis ({len(parsed_files_data)} files). ---")
+        finally:
+            metrics.record("phase", name="phase1_collect", seconds=round(time.perf_counter() - phase1_started_at, 6))
+            phase1_finished.set()
+
+    excel_report = excel_writer.IncrementalExcelReport(output_excel_filename, field_registry, EXCEL_CONSTANT_MEMORY)
+
+    def _write_sheets_as_files_complete():
+        try:
+            phase1_finished.wait() # The sheet layout (order, column count) needs every file
+            if not pipeline_state["phase1_completed"]:
+                return
+            excel_report.open(parsed_files_data)
+            while excel_report.sheets_written < len(parsed_files_data):
+                completed_file = completed_files.get()
+                if completed_file is None:
+                    return
+                filename, file_analysis_results = completed_file
+                excel_report.write_schema_sheet(filename, parsed_files_data[filename], file_analysis_results)
+                if partial_results_path and file_analysis_results:
+                    report_exporters.append_verdicts_jsonl(
+                        partial_results_path, file_analysis_results, field_registry,
+                        {field_id: class_index.class_size(field_id) for field_id in file_analysis_results}
+                    )
+                print(f"[PIPELINE] Sheet of '{filename}' written at {time.perf_counter() - pipeline_started_at:.1f}s ({excel_report.sheets_written}/{len(parsed_files_data)} files complete).")
+        except BaseException as sheet_writer_error: # Re-raised by the main thread
+            pipeline_state["sheet_writer_errors"].append(sheet_writer_error)
 
-        if newly_analyzed_this_run > 0 and newly_analyzed_this_run % 5 == 0 :
-            print(f"    [Phase 2 CACHE] Saving Ollama cache with {len(ollama_cache)} entries...")
-            utils.save_ollama_cache(ollama_cache)
-            if newly_analyzed_this_run % 10 == 0: 
-                print(f"    [Phase 2 DELAY] Pausing for 1 second...")
-                time.sleep(1.0)
-    
-    if newly_analyzed_this_run > 0 :
-         print(f"  [Phase 2 CACHE] Saving final Ollama cache with {len(ollama_cache)} entries...")
-         utils.save_ollama_cache(ollama_cache)
+    sheet_writer = threading.Thread(target=_write_sheets_as_files_complete, name="sheet-writer", daemon=True)
+    sheet_writer.start()
+    try:
+        with metrics.timed_phase("phase2_analysis"):
+            current_ollama_cache = cache_store.open_cache_backend(CACHE_BACKEND)
+            try:
+                analysis_results = _run_ollama_analysis_phase(
+                    field_registry, current_ollama_cache, force_refresh,
+                    pre_classifier_threshold=PRE_CLASSIFIER_CONFIDENCE_THRESHOLD if PRE_CLASSIFIER_ENABLED else None,
+                    class_update_source=_iter_class_updates(), on_results=_on_results
+                )
+            finally:
+                current_ollama_cache.close()
+    finally:
+        phase1_finished.set() # Unblocks the sheet writer if Phase 1 failed
+        completed_files.put(None) # Stops it if a file never completed
+        with metrics.timed_phase("sheet_writer_drain"):
+            sheet_writer.join()
+    if pipeline_state["sheet_writer_errors"]:
+        raise pipeline_state["sheet_writer_errors"][0]
+    if not pipeline_state["phase1_completed"]:
+        print("Pipeline aborted due to error in property collection.")
+        return
 
-    print(f"--- PHASE 2 COMPLETED. Ollama cache now has {len(ollama_cache)} total entries. ---")
-    return ollama_cache
+    property_class_sizes = {field_id: class_index.class_size(field_id) for field_id in field_registry.field_ids()}
+    with metrics.timed_phase("phase3_excel"):
+        excel_report.finish(analysis_results, property_class_sizes, metrics if RUN_METRICS_ENABLED else None)
+    _write_exports(metrics, model_name_cleaned, parsed_files_data, analysis_results, field_registry, property_class_sizes)
+    _write_run_metrics(metrics, model_name_cleaned)
+    print(f"--- PIPELINE COMPLETED (pipelined). Results in: {output_excel_filename} ---")
+    return analysis_results
 
 
-def run_pipeline():
+def run_pipeline(force_refresh=FORCE_FULL_REFRESH, incremental_mode=None, ollama_cache=None):
+    """
+    incremental_mode: overrides INCREMENTAL_MODE (service mode runs are always incremental).
+    ollama_cache: an open cache backend to use (and leave open) instead of opening CACHE_BACKEND for this run.
+    """
     print("--- STARTING JSON SCHEMA ANALYSIS PIPELINE (Refactored v3 - English) ---")
-    utils.clear_ollama_cache()
+    if incremental_mode is None:
+        incremental_mode = INCREMENTAL_MODE
 
     model_name_cleaned = ollama_analyzer.OLLAMA_MODEL.replace(":", "_").replace("/", "_")
     output_excel_filename_dynamic = os.path.join(PROJECT_ROOT_DIR, f"Analysis_Report_{model_name_cleaned}.xlsx")
     print(f"[INFO] Output Excel file will be: {output_excel_filename_dynamic}")
+    metrics = run_metrics.start_run_metrics(ollama_analyzer.OLLAMA_MODEL)
+    if PIPELINED_MODE and incremental_mode:
+        print("[INFO] PIPELINED_MODE is ignored in INCREMENTAL_MODE (the manifest diff needs every file first).")
+    elif PIPELINED_MODE:
+        _run_pipelined(force_refresh, model_name_cleaned, output_excel_filename_dynamic, metrics)
+        return
+
+    manifest = incremental_manifest.SchemaManifest(INCREMENTAL_STATE_DIR) if incremental_mode else None
 
     # Phase 1
-    unique_properties_for_ollama, parsed_files_data = _collect_properties_for_analysis(JSON_FILES_DIR_CONFIG)
-    if unique_properties_for_ollama is None:
+    with metrics.timed_phase("phase1_collect"):
+        field_registry, parsed_files_data = _collect_properties_for_analysis(JSON_FILES_DIR_CONFIG, manifest)
+    if field_registry is None:
         print("Pipeline aborted due to error in property collection.")
         return
-    if not unique_properties_for_ollama:
+    if not len(field_registry):
         print("[INFO] No properties with descriptions found to send to Ollama.")
 
+    # Grouping
+    with metrics.timed_phase("grouping"):
+        property_classes = _group_properties_for_analysis(field_registry)
+
+    classes_to_analyze, reused_results = property_classes, {}
+    if manifest is not None:
+        with metrics.timed_phase("incremental_diff"):
+            property_fingerprints = manifest.compute_property_fingerprints(field_registry)
+            property_changes = manifest.diff_properties(property_fingerprints)
+            print(f"[INCREMENTAL] Properties: {property_changes['added']} added, {property_changes['changed']} changed, {property_changes['removed']} removed, {property_changes['unchanged']} unchanged.")
+            analysis_fingerprint = _get_analysis_fingerprint()
+            if not force_refresh:
+                classes_to_analyze, reused_results = _split_classes_for_incremental_run(
+                    field_registry, property_classes, manifest.get_reusable_results(property_fingerprints, analysis_fingerprint)
+                )
+            print(f"[INCREMENTAL] {len(reused_results)} properties reuse their previous verdict; {len(classes_to_analyze)} equivalence classes go to Phase 2.")
+        metrics.increment("incremental_reused_properties", len(reused_results))
+
     # Phase 2
-    current_ollama_cache = utils.load_ollama_cache() # Should be empty due to clear_ollama_cache()
-    updated_ollama_cache = _run_ollama_analysis_phase(unique_properties_for_ollama, current_ollama_cache)
+    with metrics.timed_phase("phase2_analysis"):
+        current_ollama_cache = ollama_cache if ollama_cache is not None else cache_store.open_cache_backend(CACHE_BACKEND)
+        try:
+            new_analysis_results = _run_ollama_analysis_phase(
+                field_registry, current_ollama_cache, force_refresh, classes_to_analyze,
+                PRE_CLASSIFIER_CONFIDENCE_THRESHOLD if PRE_CLASSIFIER_ENABLED else None
+            )
+        finally:
+            if ollama_cache is None:
+                current_ollama_cache.close()
+    analysis_results = {
+        field_id: reused_results.get(field_id, new_analysis_results.get(field_id))
+        for field_id in field_registry.field_ids()
+        if field_id in reused_results or field_id in new_analysis_results
+    }
+    if manifest is not None:
+        with metrics.timed_phase("manifest_save"):
+            manifest.save(
+                property_fingerprints,
+                {field_registry.unique_key(field_id): analysis_result for field_id, analysis_result in analysis_results.items()},
+                analysis_fingerprint
+            )
 
     # Phase 3
-    excel_writer.generate_excel_report(
-        output_excel_filename_dynamic,
-        parsed_files_data, 
-        updated_ollama_cache,
-        unique_properties_for_ollama # Pass this for original descriptions in summary
-    )
+    property_class_sizes = {
+        field_id: len(class_members) for class_members in property_classes for field_id in class_members
+    }
+    with metrics.timed_phase("phase3_excel"):
+        excel_writer.generate_excel_report(
+            output_excel_filename_dynamic,
+            parsed_files_data, 
+            analysis_results,
+            field_registry, # Paths and original descriptions of the analyzed field ids
+            property_class_sizes,
+            metrics if RUN_METRICS_ENABLED else None,
+            EXCEL_CONSTANT_MEMORY
+        )
+    _write_exports(metrics, model_name_cleaned, parsed_files_data, analysis_results, field_registry, property_class_sizes)
+    _write_run_metrics(metrics, model_name_cleaned)
             
     print(f"--- PIPELINE COMPLETED. Results in: {output_excel_filename_dynamic} ---")
 
+def run_model_comparison(model_names, force_refresh=FORCE_FULL_REFRESH):
+    """
+    Comparison mode: one Phase 1 and grouping shared by every model, then Phase 2 model by model.
+    Model-major scheduling keeps each model loaded (and the server busy at the Phase 2 concurrency limit)
+    until all of its fields are done, so every model is loaded once instead of swapping per field.
+    """
+    print(f"--- STARTING MODEL COMPARISON PIPELINE ({len(model_names)} models: {', '.join(model_names)}) ---")
+    output_excel_filename = os.path.join(PROJECT_ROOT_DIR, COMPARISON_REPORT_FILENAME)
+    metrics = run_metrics.start_run_metrics("model_comparison")
+
+    with metrics.timed_phase("phase1_collect"):
+        field_registry, parsed_files_data = _collect_properties_for_analysis(JSON_FILES_DIR_CONFIG)
+    if field_registry is None:
+        print("Pipeline aborted due to error in property collection.")
+        return
+    with metrics.timed_phase("grouping"):
+        property_classes = _group_properties_for_analysis(field_registry)
+
+    analysis_results_by_model = {}
+    throughput_rows = []
+    ollama_client = ollama_analyzer.get_ollama_client()
+    current_ollama_cache = cache_store.open_cache_backend(CACHE_BACKEND)
+    try:
+        for model_index, model_name in enumerate(model_names):
+            phase2_stats = {}
+            with metrics.timed_phase(f"phase2_analysis {model_name}"):
+                analysis_results_by_model[model_name] = _run_ollama_analysis_phase(
+                    field_registry, current_ollama_cache, force_refresh, property_classes,
+                    PRE_CLASSIFIER_CONFIDENCE_THRESHOLD if COMPARISON_USE_PRE_CLASSIFIER else None,
+                    model_name=model_name, phase2_stats=phase2_stats
+                )
+            throughput_rows.append(model_comparison.summarize_model_throughput(model_name, analysis_results_by_model[model_name], phase2_stats))
+            if COMPARISON_UNLOAD_BETWEEN_MODELS and phase2_stats["llm_fields_analyzed"] and model_index < len(model_names) - 1:
+                ollama_client.unload_model(model_name)
+    finally:
+        current_ollama_cache.close()
+
+    property_class_sizes = {
+        field_id: len(class_members) for class_members in property_classes for field_id in class_members
+    }
+    with metrics.timed_phase("phase3_excel"):
+        excel_writer.generate_comparison_report(
+            output_excel_filename,
+            parsed_files_data,
+            field_registry,
+            analysis_results_by_model,
+            model_comparison.build_comparison_rows(analysis_results_by_model, field_registry, property_class_sizes),
+            model_comparison.compute_pairwise_agreement(analysis_results_by_model),
+            throughput_rows,
+            metrics if RUN_METRICS_ENABLED else None,
+            EXCEL_CONSTANT_MEMORY
+        )
+    _write_run_metrics(metrics, "model_comparison")
+    print(f"--- MODEL COMPARISON COMPLETED. Results in: {output_excel_filename} ---")
+
+
+def run_service():
+    """
+    SERVICE_MODE: keeps the prompts, the analysis cache and the warm model resident, serves the classification API
+    (classification_service.ClassificationServer) on SERVICE_HOST:SERVICE_PORT from its own threads and, on this thread,
+    polls JSON_FILES_DIR_CONFIG: each settled change triggers an incremental run_pipeline sharing the open cache.
+    The first poll reports every file, so the service starts with an incremental run. Stops on Ctrl+C.
+    Prompt files are read once: restart the service after editing them.
+    """
+    print(f"--- STARTING CLASSIFICATION SERVICE ({ollama_analyzer.OLLAMA_MODEL}) ---")
+    run_metrics.start_run_metrics("service")
+    ollama_cache = cache_store.open_cache_backend(CACHE_BACKEND)
+    service = classification_service.ClassificationService(
+        ollama_cache,
+        pre_classifier_threshold=PRE_CLASSIFIER_CONFIDENCE_THRESHOLD if PRE_CLASSIFIER_ENABLED else None,
+        batch_size=FIELD_BATCH_SIZE,
+        limiter=dispatcher.AdaptiveConcurrencyLimiter(
+            max_limit=PHASE2_MAX_IN_FLIGHT_REQUESTS, min_limit=PHASE2_MIN_IN_FLIGHT_REQUESTS, adaptive=PHASE2_ADAPTIVE_CONCURRENCY
+        ),
+        # Clients wait for the answer: no final retry pass
+        retry_policy=dispatcher.RetryPolicy(
+            max_attempts=PHASE2_MAX_ATTEMPTS, base_delay_s=PHASE2_RETRY_BASE_DELAY_SECONDS,
+            max_delay_s=PHASE2_RETRY_MAX_DELAY_SECONDS, final_pass=False
+        ),
+        schema_dir=JSON_FILES_DIR_CONFIG
+    )
+    if ollama_analyzer.OLLAMA_WARMUP_ENABLED:
+        service.warm_up()
+    last_warm_up_at = time.monotonic()
+    watcher = classification_service.SchemaDirectoryWatcher(JSON_FILES_DIR_CONFIG) if SERVICE_WATCH_ENABLED else None
+    watch_status = {"watch_dir": JSON_FILES_DIR_CONFIG if watcher else None, "incremental_runs": 0, "last_run_at": None, "last_run_seconds": None}
+    server = classification_service.ClassificationServer(service, SERVICE_HOST, SERVICE_PORT, status_fn=lambda: dict(watch_status))
+    server.start()
+
+    def _write_service_metrics():
+        # Records of the API's Ollama calls and cache writes made outside incremental runs
+        if run_metrics.get_run_metrics().records:
+            _write_run_metrics(run_metrics.get_run_metrics(), "service")
+
+    print(f"[SERVICE] Classification API listening on {server.url} (POST /classify/field, POST /classify/schema, GET /health).")
+    try:
+        while True:
+            directory_changes = watcher.poll() if watcher else None
+            if directory_changes is not None:
+                print(f"\n[SERVICE] {JSON_FILES_DIR_CONFIG}: {len(directory_changes['added'])} added, {len(directory_changes['changed'])} changed, {len(directory_changes['removed'])} removed. Starting an incremental run.")
+                _write_service_metrics() # The run starts its own collector
+                run_started_at = time.perf_counter()
+                try:
+                    run_pipeline(incremental_mode=True, ollama_cache=ollama_cache)
+                except Exception as e: # The service keeps running; the next change triggers a new run
+                    print(f"[SERVICE ERROR] Incremental run failed: {type(e).__name__}: {e}")
+                watch_status.update(
+                    incremental_runs=watch_status["incremental_runs"] + 1, last_run_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    last_run_seconds=round(time.perf_counter() - run_started_at, 3)
+                )
+                run_metrics.start_run_metrics("service")
+                last_warm_up_at = time.monotonic() # The run's requests pinned the model
+            if ollama_analyzer.OLLAMA_WARMUP_ENABLED and time.monotonic() - last_warm_up_at >= SERVICE_KEEP_WARM_INTERVAL_SECONDS:
+                service.warm_up()
+                last_warm_up_at = time.monotonic()
+            service.flush_cache()
+            if len(run_metrics.get_run_metrics().records) >= SERVICE_METRICS_ROTATE_RECORDS:
+                _write_service_metrics()
+                run_metrics.start_run_metrics("service")
+            time.sleep(SERVICE_POLL_INTERVAL_SECONDS)
+    except KeyboardInterrupt:
+        print("\n[SERVICE] Stopping...")
+    finally:
+        server.stop()
+        service.flush_cache()
+        ollama_cache.close()
+        _write_service_metrics()
+    print(f"--- CLASSIFICATION SERVICE STOPPED. {service.stats['requests']} API requests served. ---")
+
+
 if __name__ == "__main__":
-    run_pipeline()
\ No newline at end of file
+    if SERVICE_MODE:
+        run_service()
+    elif COMPARISON_MODELS:
+        run_model_comparison(COMPARISON_MODELS)
+    else:
+        run_pipeline()
\ No newline at end of file
@@ -0,0 +1,76 @@
+# src/model_comparison.py
+import itertools
+
+import dispatcher
+
+
+def build_comparison_rows(analysis_results_by_model, field_registry, property_class_sizes=None):
+    """
+    One row per property of field_registry (schema_parser.FieldRegistry) with the verdict of every model (one column
+    per model) and whether they agree. Results and class sizes are keyed by field id.
+    Failed analyses are shown but do not count as a disagreement.
+    """
+    model_names = list(analysis_results_by_model)
+    comparison_rows = []
+    for field_id in field_registry.field_ids():
+        comparison_row = {
+            "Source File": field_registry.file_name(field_id),
+            "Schema Key Path": field_registry.path_string(field_id),
+            "Original Description": field_registry.record(field_id).description,
+            "Equivalence Class Size": (property_class_sizes or {}).get(field_id, 1)
+        }
+        answered_verdicts = set()
+        for model_name in model_names:
+            analysis_result = analysis_results_by_model[model_name].get(field_id)
+            verdict = analysis_result.get("pii_sensitivity_assessment", "ERROR_NOT_SPECIFIED") if analysis_result else "NOT_ANALYZED"
+            comparison_row[f"{model_name} Verdict"] = verdict
+            if analysis_result and not dispatcher.is_failed_result(analysis_result):
+                answered_verdicts.add(verdict)
+        comparison_row["Distinct Verdicts"] = len(answered_verdicts)
+        comparison_row["Models Agree"] = "YES" if len(answered_verdicts) <= 1 else "NO"
+        comparison_rows.append(comparison_row)
+    return comparison_rows
+
+
+def compute_pairwise_agreement(analysis_results_by_model):
+    """Agreement rate of every pair of models over the properties both of them answered (failures excluded)."""
+    agreement_rows = []
+    for model_a, model_b in itertools.combinations(analysis_results_by_model, 2):
+        results_a = analysis_results_by_model[model_a]
+        results_b = analysis_results_by_model[model_b]
+        compared_field_ids = [
+            field_id for field_id in results_a
+            if field_id in results_b and not dispatcher.is_failed_result(results_a[field_id]) and not dispatcher.is_failed_result(results_b[field_id])
+        ]
+        same_verdict_count = sum(
+            1 for field_id in compared_field_ids
+            if results_a[field_id].get("pii_sensitivity_assessment") == results_b[field_id].get("pii_sensitivity_assessment")
+        )
+        agreement_rows.append({
+            "Model A": model_a,
+            "Model B": model_b,
+            "Properties Compared": len(compared_field_ids),
+            "Same Verdict": same_verdict_count,
+            "Agreement Rate": round(same_verdict_count / len(compared_field_ids), 3) if compared_field_ids else None
+        })
+    return agreement_rows
+
+
+def summarize_model_throughput(model_name, analysis_results, phase2_stats):
+    """Throughput row of one model from the dispatch numbers of this run (phase2_stats filled by Phase 2)."""
+    dispatch_seconds = phase2_stats.get("dispatch_seconds") or 0.0
+    fields_analyzed = phase2_stats.get("llm_fields_analyzed", 0)
+    verdict_times = phase2_stats.get("verdict_times") or []
+    completion_tokens = phase2_stats.get("completion_tokens", 0)
+    return {
+        "Model": model_name,
+        "Properties With Results": len(analysis_results),
+        "LLM Fields Analyzed (this run)": fields_analyzed,
+        "LLM Errors (this run)": phase2_stats.get("llm_errors", 0),
+        "Warm-up (s)": round(phase2_stats["warmup_seconds"], 3) if phase2_stats.get("warmup_seconds") is not None else None,
+        "Dispatch Time (s)": round(dispatch_seconds, 3),
+        "Fields per Second": round(fields_analyzed / dispatch_seconds, 3) if dispatch_seconds else None,
+        "Mean Time to Verdict per Request (s)": round(sum(verdict_times) / len(verdict_times), 3) if verdict_times else None,
+        "Completion Tokens": completion_tokens,
+        "Completion Tokens per Second": round(completion_tokens / dispatch_seconds, 1) if dispatch_seconds else None
+    }
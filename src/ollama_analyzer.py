@@ -1,18 +1,445 @@
 # src/ollama_analyzer.py
+import contextlib
 import json
 import os
 import requests
+import threading
 import time
 import traceback 
+import run_metrics
 import utils 
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
 
 # --- Configuration ---
 OLLAMA_CHAT_ENDPOINT = "http://localhost:11434/api/chat"
+# Several Ollama servers sharing one run (e.g. ["http://box1:11434/api/chat", "http://box2:11434/api/chat"]).
+# Empty = OLLAMA_CHAT_ENDPOINT only. Each request goes to the healthy endpoint with the fewest outstanding
+# requests, weighted by its observed latency.
+OLLAMA_CHAT_ENDPOINTS = []
+OLLAMA_HEALTH_CHECK_INTERVAL_SECONDS = 10.0 # Period of the GET /api/tags probe that drops and re-admits endpoints
+OLLAMA_HEALTH_CHECK_TIMEOUT_SECONDS = 3.0
+OLLAMA_ENDPOINT_LATENCY_SMOOTHING = 0.2 # Weight of the newest request in each endpoint's latency average
 OLLAMA_MODEL = "qwen3:1.7b" # CONFIRM YOUR MODEL (e.g., "gemma:2b")
 OLLAMA_REQUEST_TIMEOUT = 240 
+# Stream the chat response and stop generation as soon as a complete, valid verdict object has arrived
+# (reasoning models keep emitting tokens after the JSON we need)
+OLLAMA_STREAM_RESPONSES = True
+OLLAMA_NUM_PREDICT_SINGLE = 1024 # Generation cap (tokens) of a single-field request (None = model default)
+OLLAMA_NUM_PREDICT_PER_BATCH_FIELD = 512 # Generation cap per field of a batched request (None = model default)
+OLLAMA_KEEP_ALIVE = "30m" # Sent with every request so the model stays loaded for the whole run
+OLLAMA_WARMUP_ENABLED = True # Load the model with an empty chat request before Phase 2
+OLLAMA_HTTP_POOL_MAXSIZE = 16 # Pooled keep-alive connections per host (>= the Phase 2 in-flight limit)
+OLLAMA_EMBED_MODEL = "nomic-embed-text" # Embedding model of the similarity tier (main.SIMILARITY_REUSE_ENABLED); must be pulled
+OLLAMA_EMBED_BATCH_SIZE = 64 # Texts per /api/embed request
+# Assessment of the fields a batch answer left out (transient: re-queued by the dispatcher as single-field requests)
+BATCH_VERDICT_MISSING_ASSESSMENT = "ERROR_MODEL_BATCH_VERDICT_MISSING"
+
+# Prompt files whose text determines the model's answer (part of the analysis cache key)
+PROMPT_COMPONENT_FILES = [
+    "system_instructions_rgpd_expert.txt",
+    "user_task_and_field_info_template.txt",
+    "response_format_examples.txt",
+    "user_task_batch_template.txt",
+    "batch_response_format_examples.txt"
+]
+
+class OllamaClient:
+    """
+    Ollama HTTP client owning a pooled requests.Session (keep-alive connections shared by all Phase 2 threads).
+    Every request pins the model with keep_alive; warm_up() loads the model before the first field is analyzed,
+    so the load time is reported on its own instead of inflating the first fields' latency.
+    """
+
+    def __init__(self, chat_endpoint=None, model_name=None, keep_alive=None, pool_maxsize=None):
+        self.chat_endpoint = chat_endpoint or OLLAMA_CHAT_ENDPOINT
+        parsed_endpoint = urlsplit(self.chat_endpoint)
+        self.embed_endpoint = f"{parsed_endpoint.scheme}://{parsed_endpoint.netloc}/api/embed"
+        self.model_name = model_name or OLLAMA_MODEL
+        self.keep_alive = keep_alive if keep_alive is not None else OLLAMA_KEEP_ALIVE
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize or OLLAMA_HTTP_POOL_MAXSIZE)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+        self.warmup_seconds_by_model = {}
+        self.requests_sent = 0
+        self._lock = threading.Lock()
+
+    def post_chat(self, payload, stream=False):
+        """POSTs a chat payload (model and keep_alive filled in when missing) through the pooled session."""
+        payload = dict(payload)
+        payload.setdefault("model", self.model_name)
+        payload.setdefault("keep_alive", self.keep_alive)
+        with self._lock:
+            self.requests_sent += 1
+        return self.session.post(self.chat_endpoint, json=payload, timeout=OLLAMA_REQUEST_TIMEOUT, stream=stream)
+
+    @contextlib.contextmanager
+    def open_chat(self, payload, stream=False):
+        """post_chat as a context manager; the response is read inside the block (same interface as OllamaEndpointPool)."""
+        yield self.post_chat(payload, stream=stream)
+
+    def post_embed(self, payload):
+        """POSTs an /api/embed payload ({"input": [texts]}; model defaults to OLLAMA_EMBED_MODEL) through the pooled session."""
+        payload = dict(payload)
+        payload.setdefault("model", OLLAMA_EMBED_MODEL)
+        payload.setdefault("keep_alive", self.keep_alive)
+        with self._lock:
+            self.requests_sent += 1
+        return self.session.post(self.embed_endpoint, json=payload, timeout=OLLAMA_REQUEST_TIMEOUT)
+
+    def warm_up(self, model_name=None):
+        """
+        Loads the model into memory (a chat request with no messages only loads it) and pins it with keep_alive.
+        Returns the warm-up latency in seconds, or None if the request failed.
+        """
+        model_name = model_name or self.model_name
+        log_prefix = f"[OLLAMA_CLIENT {model_name}]"
+        started_at = time.perf_counter()
+        try:
+            response = self.post_chat({"model": model_name, "messages": [], "stream": False})
+            response.raise_for_status()
+            response.content # Read the body so the connection goes back to the pool
+        except Exception as ex:
+            print(f"{log_prefix} Warm-up failed ({type(ex).__name__}: {ex}); the first request will load the model.")
+            return None
+        warmup_seconds = time.perf_counter() - started_at
+        self.warmup_seconds_by_model[model_name] = warmup_seconds
+        print(f"{log_prefix} Model warm-up: {warmup_seconds:.2f}s (keep_alive={self.keep_alive}; not counted in per-field latency).")
+        return warmup_seconds
+
+    def unload_model(self, model_name):
+        """Asks Ollama to unload a model now (keep_alive=0), freeing memory for the next one."""
+        try:
+            response = self.post_chat({"model": model_name, "messages": [], "stream": False, "keep_alive": 0})
+            response.content
+            print(f"[OLLAMA_CLIENT {model_name}] Model unloaded.")
+        except Exception as ex:
+            print(f"[OLLAMA_CLIENT {model_name}] Unload request failed ({type(ex).__name__}: {ex}).")
+
+    def get_connection_stats(self):
+        """Connection-reuse statistics of the session's urllib3 pools."""
+        connections_opened = 0
+        pooled_requests = 0
+        connection_pools = self._adapter.poolmanager.pools
+        for pool_key in connection_pools.keys():
+            connection_pool = connection_pools[pool_key]
+            connections_opened += connection_pool.num_connections
+            pooled_requests += connection_pool.num_requests
+        return {
+            "requests_sent": self.requests_sent,
+            "connections_opened": connections_opened,
+            "connection_reuse_ratio": round(1 - connections_opened / pooled_requests, 3) if pooled_requests else None,
+            "warmup_seconds": {model_name: round(seconds, 3) for model_name, seconds in self.warmup_seconds_by_model.items()}
+        }
+
+    def close(self):
+        self.session.close()
+
+
+class _PoolEndpoint:
+    """State of one endpoint of an OllamaEndpointPool (guarded by the pool's lock)."""
+
+    def __init__(self, chat_endpoint, client):
+        self.chat_endpoint = chat_endpoint
+        self.client = client
+        parsed_endpoint = urlsplit(chat_endpoint)
+        self.health_url = f"{parsed_endpoint.scheme}://{parsed_endpoint.netloc}/api/tags"
+        self.healthy = True
+        self.outstanding = 0
+        self.latency_ewma = None
+        self.requests_completed = 0
+        self.requests_failed = 0
+        self.busy_seconds = 0.0
+        self.first_request_at = None
+        self.last_request_at = None
+        self.times_dropped = 0
+        self.times_readmitted = 0
+
+
+class OllamaEndpointPool:
+    """
+    Several Ollama servers behind the OllamaClient interface. Each request goes to the healthy endpoint with
+    the lowest (outstanding requests + 1) x average latency; endpoints without a measured latency yet count as
+    the pool average, so new and re-admitted endpoints get work right away.
+    An endpoint is dropped when a request to it fails with a connection error (the request is then re-sent to
+    another endpoint) or when the periodic GET /api/tags health check fails, and re-admitted once the check
+    passes again. With no healthy endpoint left, requests fail with a connection error, which the dispatcher
+    retries with backoff like any other transient failure.
+    """
+
+    def __init__(self, chat_endpoints, model_name=None, keep_alive=None, pool_maxsize=None,
+                 health_check_interval=None, latency_smoothing=None):
+        self.model_name = model_name or OLLAMA_MODEL
+        self.keep_alive = keep_alive if keep_alive is not None else OLLAMA_KEEP_ALIVE
+        self.health_check_interval = health_check_interval if health_check_interval is not None else OLLAMA_HEALTH_CHECK_INTERVAL_SECONDS
+        self.latency_smoothing = latency_smoothing if latency_smoothing is not None else OLLAMA_ENDPOINT_LATENCY_SMOOTHING
+        self.endpoints = [
+            _PoolEndpoint(chat_endpoint, OllamaClient(chat_endpoint, self.model_name, self.keep_alive, pool_maxsize))
+            for chat_endpoint in dict.fromkeys(chat_endpoints)
+        ]
+        self.requests_redispatched = 0
+        self._next_start_index = 0 # Rotates the tie-break among equally scored endpoints
+        self._lock = threading.Lock()
+        self._stop_health_checks = threading.Event()
+        self._health_check_thread = threading.Thread(target=self._run_health_checks, name="ollama-health-checks", daemon=True)
+        self._health_check_thread.start()
+
+    @property
+    def chat_endpoint(self):
+        return ", ".join(endpoint.chat_endpoint for endpoint in self.endpoints)
+
+    @property
+    def warmup_seconds_by_model(self):
+        warmup_seconds_by_model = {}
+        for endpoint in self.endpoints:
+            for model_name, seconds in endpoint.client.warmup_seconds_by_model.items():
+                warmup_seconds_by_model[model_name] = max(seconds, warmup_seconds_by_model.get(model_name, 0.0))
+        return warmup_seconds_by_model
+
+    def _healthy_endpoints(self):
+        return [endpoint for endpoint in self.endpoints if endpoint.healthy]
+
+    def _acquire_endpoint(self, excluded_endpoints):
+        """Picks the endpoint for the next request and counts it as outstanding; None if no healthy endpoint is left."""
+        with self._lock:
+            candidates = [endpoint for endpoint in self._healthy_endpoints() if endpoint not in excluded_endpoints]
+            if not candidates:
+                return None
+            measured_latencies = [endpoint.latency_ewma for endpoint in candidates if endpoint.latency_ewma is not None]
+            default_latency = sum(measured_latencies) / len(measured_latencies) if measured_latencies else 1.0
+            start_index = self._next_start_index % len(candidates)
+            self._next_start_index += 1
+            rotated_candidates = candidates[start_index:] + candidates[:start_index]
+            chosen_endpoint = min(
+                rotated_candidates,
+                key=lambda endpoint: (endpoint.outstanding + 1) * (endpoint.latency_ewma if endpoint.latency_ewma is not None else default_latency)
+            )
+            chosen_endpoint.outstanding += 1
+            if chosen_endpoint.first_request_at is None:
+                chosen_endpoint.first_request_at = time.perf_counter()
+            return chosen_endpoint
+
+    def _release_endpoint(self, endpoint, elapsed_seconds, succeeded, is_chat_request=True):
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.last_request_at = time.perf_counter()
+            if not succeeded:
+                endpoint.requests_failed += 1
+                return
+            if not is_chat_request: # Embedding requests are much faster: kept out of the chat latency average
+                return
+            endpoint.requests_completed += 1
+            endpoint.busy_seconds += elapsed_seconds
+            if endpoint.latency_ewma is None:
+                endpoint.latency_ewma = elapsed_seconds
+            else:
+                endpoint.latency_ewma += self.latency_smoothing * (elapsed_seconds - endpoint.latency_ewma)
+
+    def _set_endpoint_health(self, endpoint, healthy, reason=None):
+        with self._lock:
+            if endpoint.healthy == healthy:
+                return
+            endpoint.healthy = healthy
+            if healthy:
+                endpoint.times_readmitted += 1
+                endpoint.latency_ewma = None # Measured again (the model may have to be reloaded)
+            else:
+                endpoint.times_dropped += 1
+            healthy_count = len(self._healthy_endpoints())
+        if healthy:
+            print(f"[OLLAMA_POOL] Endpoint {endpoint.chat_endpoint} re-admitted ({healthy_count}/{len(self.endpoints)} healthy).")
+        else:
+            print(f"[OLLAMA_POOL] Endpoint {endpoint.chat_endpoint} dropped: {reason} ({healthy_count}/{len(self.endpoints)} healthy).")
+
+    def _check_endpoint_health(self, endpoint):
+        try:
+            response = endpoint.client.session.get(endpoint.health_url, timeout=OLLAMA_HEALTH_CHECK_TIMEOUT_SECONDS)
+            response.content
+            if not response.ok:
+                self._set_endpoint_health(endpoint, False, f"health check returned HTTP {response.status_code}")
+                return
+        except requests.exceptions.RequestException as ex:
+            self._set_endpoint_health(endpoint, False, f"health check failed ({type(ex).__name__})")
+            return
+        self._set_endpoint_health(endpoint, True)
+
+    def _run_health_checks(self):
+        while not self._stop_health_checks.wait(self.health_check_interval):
+            for endpoint in self.endpoints:
+                self._check_endpoint_health(endpoint)
+
+    @contextlib.contextmanager
+    def _open_routed_request(self, send_request, is_chat_request=True):
+        """
+        Sends send_request(client) to the best endpoint and yields its response; the request stays outstanding on that
+        endpoint until the block exits. Connection errors drop the endpoint: before a response, the request is
+        re-sent to the next endpoint; while reading it, the error propagates (the dispatcher retries the field).
+        """
+        tried_endpoints = []
+        while True:
+            endpoint = self._acquire_endpoint(tried_endpoints)
+            if endpoint is None:
+                raise requests.exceptions.ConnectionError(
+                    f"No healthy Ollama endpoint left ({len(tried_endpoints)} tried for this request, {len(self._healthy_endpoints())}/{len(self.endpoints)} healthy)."
+                )
+            if tried_endpoints:
+                with self._lock:
+                    self.requests_redispatched += 1
+            tried_endpoints.append(endpoint)
+            started_at = time.perf_counter()
+            try:
+                response = send_request(endpoint.client)
+            except requests.exceptions.ConnectionError as ex:
+                self._release_endpoint(endpoint, time.perf_counter() - started_at, False, is_chat_request)
+                self._set_endpoint_health(endpoint, False, f"{type(ex).__name__} on a request")
+                continue
+            except BaseException:
+                self._release_endpoint(endpoint, time.perf_counter() - started_at, False, is_chat_request)
+                raise
+            break
+        succeeded = False
+        try:
+            yield response
+            succeeded = response.ok
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as ex:
+            self._set_endpoint_health(endpoint, False, f"{type(ex).__name__} while reading a response")
+            raise
+        finally:
+            self._release_endpoint(endpoint, time.perf_counter() - started_at, succeeded, is_chat_request)
+
+    def open_chat(self, payload, stream=False):
+        """Context manager yielding the response of a chat payload sent to the best endpoint (read it inside the block)."""
+        return self._open_routed_request(lambda client: client.post_chat(payload, stream=stream))
+
+    def post_chat(self, payload, stream=False):
+        """Sends a chat payload to the best endpoint (warm-up/unload style calls; Phase 2 requests use open_chat)."""
+        with self.open_chat(payload, stream=stream) as response:
+            if not stream:
+                response.content
+            return response
+
+    def post_embed(self, payload):
+        """Sends an /api/embed payload to the best endpoint."""
+        with self._open_routed_request(lambda client: client.post_embed(payload), is_chat_request=False) as response:
+            response.content
+            return response
+
+    def _for_each_healthy_endpoint(self, endpoint_action):
+        """Runs endpoint_action(endpoint) on every healthy endpoint concurrently; returns the results in endpoint order."""
+        healthy_endpoints = self._healthy_endpoints()
+        action_results = [None] * len(healthy_endpoints)
+
+        def _run_action(endpoint_index):
+            action_results[endpoint_index] = endpoint_action(healthy_endpoints[endpoint_index])
+
+        action_threads = [threading.Thread(target=_run_action, args=(endpoint_index,), daemon=True) for endpoint_index in range(len(healthy_endpoints))]
+        for action_thread in action_threads:
+            action_thread.start()
+        for action_thread in action_threads:
+            action_thread.join()
+        return action_results
+
+    def warm_up(self, model_name=None):
+        """Loads the model on every healthy endpoint at once; returns the slowest warm-up in seconds (None if all failed)."""
+        for endpoint in self.endpoints:
+            self._check_endpoint_health(endpoint) # Drop servers that are already down before the first request
+        warmup_results = [seconds for seconds in self._for_each_healthy_endpoint(lambda endpoint: endpoint.client.warm_up(model_name)) if seconds is not None]
+        return max(warmup_results) if warmup_results else None
+
+    def unload_model(self, model_name):
+        self._for_each_healthy_endpoint(lambda endpoint: endpoint.client.unload_model(model_name))
+
+    def get_endpoint_stats(self):
+        """Per-endpoint requests, failures, latency and throughput (completed requests per second of activity)."""
+        with self._lock:
+            endpoint_stats = []
+            for endpoint in self.endpoints:
+                active_seconds = (endpoint.last_request_at - endpoint.first_request_at) if endpoint.first_request_at and endpoint.last_request_at else None
+                endpoint_stats.append({
+                    "endpoint": endpoint.chat_endpoint,
+                    "healthy": endpoint.healthy,
+                    "requests_completed": endpoint.requests_completed,
+                    "requests_failed": endpoint.requests_failed,
+                    "mean_latency_s": round(endpoint.busy_seconds / endpoint.requests_completed, 4) if endpoint.requests_completed else None,
+                    "requests_per_second": round(endpoint.requests_completed / active_seconds, 2) if active_seconds else None,
+                    "times_dropped": endpoint.times_dropped,
+                    "times_readmitted": endpoint.times_readmitted
+                })
+            return endpoint_stats
+
+    def get_connection_stats(self):
+        """Connection-reuse statistics summed over the endpoints' sessions, plus the per-endpoint statistics."""
+        client_stats = [endpoint.client.get_connection_stats() for endpoint in self.endpoints]
+        connections_opened = sum(stats["connections_opened"] for stats in client_stats)
+        pooled_requests = 0
+        for endpoint in self.endpoints:
+            connection_pools = endpoint.client._adapter.poolmanager.pools
+            for pool_key in connection_pools.keys():
+                pooled_requests += connection_pools[pool_key].num_requests
+        return {
+            "requests_sent": sum(stats["requests_sent"] for stats in client_stats),
+            "connections_opened": connections_opened,
+            "connection_reuse_ratio": round(1 - connections_opened / pooled_requests, 3) if pooled_requests else None,
+            "warmup_seconds": {model_name: round(seconds, 3) for model_name, seconds in self.warmup_seconds_by_model.items()},
+            "requests_redispatched": self.requests_redispatched,
+            "endpoints": self.get_endpoint_stats()
+        }
+
+    def close(self):
+        self._stop_health_checks.set()
+        for endpoint in self.endpoints:
+            endpoint.client.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_ollama_client():
+    """
+    Shared client of this process (created on first use with the current configuration): an OllamaEndpointPool
+    when OLLAMA_CHAT_ENDPOINTS lists several servers, an OllamaClient otherwise.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            chat_endpoints = list(dict.fromkeys(OLLAMA_CHAT_ENDPOINTS))
+            if len(chat_endpoints) > 1:
+                _default_client = OllamaEndpointPool(chat_endpoints)
+            else:
+                _default_client = OllamaClient(chat_endpoints[0] if chat_endpoints else None)
+        return _default_client
+
+
+def embed_texts(texts, model_name=None):
+    """
+    Embeddings of texts from Ollama's /api/embed (model_name defaults to OLLAMA_EMBED_MODEL), OLLAMA_EMBED_BATCH_SIZE
+    texts per request. Returns one vector (list of floats) per text, or None (after logging why) if a request fails.
+    """
+    model_name = model_name or OLLAMA_EMBED_MODEL
+    ollama_client = get_ollama_client()
+    embeddings = []
+    for batch_start in range(0, len(texts), OLLAMA_EMBED_BATCH_SIZE):
+        batch_texts = texts[batch_start:batch_start + OLLAMA_EMBED_BATCH_SIZE]
+        try:
+            with run_metrics.get_run_metrics().timed("ollama_embed", texts=len(batch_texts)):
+                response = ollama_client.post_embed({"model": model_name, "input": batch_texts})
+                response.raise_for_status()
+                batch_embeddings = response.json().get("embeddings")
+            if not isinstance(batch_embeddings, list) or len(batch_embeddings) != len(batch_texts):
+                raise ValueError(f"expected {len(batch_texts)} embeddings, got {type(batch_embeddings).__name__}")
+        except Exception as ex:
+            print(f"[OLLAMA_EMBED {model_name}] Embedding request failed ({type(ex).__name__}: {ex}).")
+            return None
+        embeddings.extend(batch_embeddings)
+    return embeddings
+
 
 # Cache for loaded prompt components
 _prompt_cache = {}
+_prompt_fingerprint = None
+_json_decoder = json.JSONDecoder()
 
 def _load_prompt_component(filename):
     """Loads a prompt component from file and caches it in memory."""
@@ -25,6 +452,29 @@ def _load_prompt_component(filename):
             _prompt_cache[filename] = content
     return _prompt_cache[filename]
 
+def get_prompt_fingerprint():
+    """Hash of the text of all prompt components. Changes whenever a prompt file is edited."""
+    global _prompt_fingerprint
+    if _prompt_fingerprint is None:
+        _prompt_fingerprint = utils.compute_content_hash(*[_load_prompt_component(filename) for filename in PROMPT_COMPONENT_FILES])
+    return _prompt_fingerprint
+
+
+def build_analysis_cache_key(field_record, model_name=None):
+    """
+    Content-addressed cache key for a field analysis (field_record: schema_parser.FieldRecord).
+    Hashes everything that determines the answer (model, prompt texts, field name, path and description)
+    but not the source filename, so verdicts survive file renames and are shared across schema files.
+    """
+    return utils.compute_content_hash(
+        model_name or OLLAMA_MODEL,
+        get_prompt_fingerprint(),
+        field_record.name,
+        ".".join(field_record.path),
+        field_record.description or ""
+    )
+
+
 def _build_ollama_messages(field_info):
     """
     Builds the 'messages' list for the Ollama chat API.
@@ -84,64 +534,299 @@ def _handle_ollama_api_error(response, log_prefix, response_text_on_error):
                 "gdpr_justification": f"Unexpected API response: {str(response)}"}
 
 
-def analyze_single_field_ollama(unique_field_key, field_description, current_count=0, total_count=0):
+def _decode_leading_json(content_str):
     """
-    Orchestrates the analysis of a single field with Ollama using the chat API and structured prompts.
+    Decodes the first complete JSON object/array in content_str, skipping any preamble.
+    Returns (decoded_value, json_text), or (None, None) while the value is still incomplete.
     """
-    progress_log = f"({current_count}/{total_count})" if total_count > 0 else ""
-    log_prefix = f"[OLLAMA_CHAT {unique_field_key} {progress_log}]"
-    print(f"{log_prefix} Starting analysis...")
+    candidate_starts = [index for index in (content_str.find('{'), content_str.find('[')) if index >= 0]
+    if not candidate_starts:
+        return None, None
+    start_index = min(candidate_starts)
+    try:
+        decoded_value, end_index = _json_decoder.raw_decode(content_str, start_index)
+    except json.JSONDecodeError:
+        return None, None
+    return decoded_value, content_str[start_index:end_index]
 
-    filename_context, full_path_in_schema = unique_field_key.split("::", 1)
-    field_name = full_path_in_schema.split('.')[-1]
 
-    field_info = {
-        "model_name_context": os.path.splitext(filename_context)[0],
-        "full_field_path": full_path_in_schema,
-        "field_name": field_name,
-        "field_description": field_description if field_description else "N/A"
-    }
+def _is_complete_field_verdict(decoded_value):
+    return isinstance(decoded_value, dict) and "pii_sensitivity_assessment" in decoded_value and "gdpr_justification" in decoded_value
 
-    messages = _build_ollama_messages(field_info)
-    if messages is None: # Error loading prompt components
-        return {"pii_sensitivity_assessment": "ERROR_PROMPT_LOADING", 
-                "gdpr_justification": "Failed to load one or more prompt components."}
 
+def _is_complete_batch_verdict(decoded_value):
+    verdict_list = decoded_value.get("verdicts") if isinstance(decoded_value, dict) else decoded_value
+    return isinstance(verdict_list, list)
+
+
+def _capture_server_timings(response_metrics, final_response):
+    """Copies the server-side durations of a finished request (nanoseconds in Ollama's answer) into response_metrics, in seconds."""
+    for duration_field in run_metrics.OLLAMA_SERVER_DURATION_FIELDS:
+        if final_response.get(duration_field) is not None:
+            response_metrics[f"{duration_field}_s"] = round(final_response[duration_field] / 1e9, 4)
+
+
+def _read_chat_stream(response, is_complete_verdict, started_at, response_metrics):
+    """
+    Reads an Ollama chat stream (one JSON chunk per line) until the model is done or, if is_complete_verdict
+    accepts the JSON decoded so far, until the verdict is complete; the request is then closed, which stops generation.
+    Returns (content_str, api_error_chunk).
+    """
+    content_parts = []
+    content_chunks = 0
+    try:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if "error" in chunk:
+                return None, chunk
+            chunk_content = chunk.get("message", {}).get("content", "")
+            if chunk_content:
+                content_parts.append(chunk_content)
+                content_chunks += 1
+            if chunk.get("done"):
+                response_metrics["completion_tokens"] = chunk.get("eval_count", content_chunks)
+                response_metrics["prompt_tokens"] = chunk.get("prompt_eval_count")
+                response_metrics["token_count_source"] = "server"
+                _capture_server_timings(response_metrics, chunk)
+                break
+            if time.perf_counter() - started_at > OLLAMA_REQUEST_TIMEOUT:
+                raise requests.exceptions.Timeout(f"No complete answer after {OLLAMA_REQUEST_TIMEOUT}s (streaming).")
+            if is_complete_verdict is not None and ('}' in chunk_content or ']' in chunk_content):
+                decoded_value, json_text = _decode_leading_json("".join(content_parts))
+                if decoded_value is not None and is_complete_verdict(decoded_value):
+                    response_metrics["stopped_early"] = True
+                    response_metrics["completion_tokens"] = content_chunks # Ollama streams one chunk per token
+                    response_metrics["token_count_source"] = "stream_chunks"
+                    return json_text, None
+    finally:
+        response.close()
+    return "".join(content_parts), None
+
+
+def _send_chat_request(messages, log_prefix, num_predict=None, is_complete_verdict=None, model_name=None):
+    """
+    Sends a chat request to Ollama (model_name defaults to OLLAMA_MODEL).
+    num_predict: generation cap in tokens (None = model default).
+    is_complete_verdict: with OLLAMA_STREAM_RESPONSES, predicate on the JSON decoded so far that ends the stream early.
+    Returns (model_response_content_str, None, response_metrics) on success or
+    (None, error_result, response_metrics) on API/transport errors.
+    response_metrics: {"streamed", "stopped_early", "time_to_verdict_s", "completion_tokens", "prompt_tokens", "token_count_source", "num_predict"}
+        plus, when the server reported them, "load_duration_s", "prompt_eval_duration_s", "eval_duration_s" and "total_duration_s".
+    Every call is recorded in the active run_metrics collector.
+    """
+    started_at = time.perf_counter()
+    model_response_content_str, error_result, response_metrics = _post_chat_request(messages, log_prefix, num_predict, is_complete_verdict, model_name)
+    run_metrics.get_run_metrics().record_ollama_call(
+        model_name or OLLAMA_MODEL, time.perf_counter() - started_at, response_metrics,
+        error_result.get("pii_sensitivity_assessment") if error_result is not None else None
+    )
+    return model_response_content_str, error_result, response_metrics
+
+
+def _post_chat_request(messages, log_prefix, num_predict, is_complete_verdict, model_name):
     payload = {
-        "model": OLLAMA_MODEL,
+        "model": model_name or OLLAMA_MODEL,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
         "messages": messages,
-        "stream": False,
+        "stream": OLLAMA_STREAM_RESPONSES,
         "format": "json" # Instruct Ollama that the *assistant's message content* should be JSON
     }
+    if num_predict is not None:
+        payload["options"] = {"num_predict": num_predict}
+    response_metrics = {
+        "streamed": OLLAMA_STREAM_RESPONSES, "stopped_early": False, "time_to_verdict_s": None,
+        "completion_tokens": None, "prompt_tokens": None, "token_count_source": None, "num_predict": num_predict
+    }
     
     # print(f"{log_prefix} Payload to be sent (partial messages for brevity):")
     # print(json.dumps({"model": OLLAMA_MODEL, "messages": [{"role": m["role"], "content": m["content"][:200] + "..."} for m in messages], "format": "json"}, indent=2))
 
-
-    analysis_result = {"pii_sensitivity_assessment": "ERROR_OLLAMA_CALL_UNHANDLED", "gdpr_justification": "Ollama call did not complete as expected."}
     response_text_for_log = "Response not captured."
     http_status = "N/A"
 
+    started_at = time.perf_counter()
     try:
-        response = requests.post(OLLAMA_CHAT_ENDPOINT, json=payload, timeout=OLLAMA_REQUEST_TIMEOUT)
-        http_status = response.status_code
-        response_text_for_log = response.text
+        with get_ollama_client().open_chat(payload, stream=OLLAMA_STREAM_RESPONSES) as response:
+            http_status = response.status_code
         
-        print(f"{log_prefix} HTTP Status: {http_status}")
-        # print(f"{log_prefix} Raw Response (first 300 chars): {response_text_for_log[:300]}...") # Uncomment for deep debug
+            print(f"{log_prefix} HTTP Status: {http_status}")
+
+            if OLLAMA_STREAM_RESPONSES and response.ok:
+                model_response_content_str, api_error_chunk = _read_chat_stream(response, is_complete_verdict, started_at, response_metrics)
+                response_metrics["time_to_verdict_s"] = round(time.perf_counter() - started_at, 3)
+                if api_error_chunk is not None:
+                    return None, _handle_ollama_api_error(api_error_chunk, log_prefix, str(api_error_chunk)), response_metrics
+                return model_response_content_str, None, response_metrics
 
-        response.raise_for_status() # Raises HTTPError for 4xx/5xx
+            response_text_for_log = response.text
+            # print(f"{log_prefix} Raw Response (first 300 chars): {response_text_for_log[:300]}...") # Uncomment for deep debug
+
+            response.raise_for_status() # Raises HTTPError for 4xx/5xx
         
-        response_data_json = response.json() # Parse the API's JSON response
+            response_data_json = response.json() # Parse the API's JSON response
+            response_metrics["time_to_verdict_s"] = round(time.perf_counter() - started_at, 3)
+            response_metrics["completion_tokens"] = response_data_json.get("eval_count")
+            response_metrics["prompt_tokens"] = response_data_json.get("prompt_eval_count")
+            response_metrics["token_count_source"] = "server"
+            _capture_server_timings(response_metrics, response_data_json)
 
-        if "message" in response_data_json and isinstance(response_data_json["message"], dict) and "content" in response_data_json["message"]:
-            model_response_content_str = response_data_json["message"]["content"]
-            analysis_result = _parse_ollama_model_response(model_response_content_str, log_prefix)
-        else: # API response format is not as expected (e.g., no "message" or "content")
-            analysis_result = _handle_ollama_api_error(response_data_json, log_prefix, response_text_for_log)
+            if "message" in response_data_json and isinstance(response_data_json["message"], dict) and "content" in response_data_json["message"]:
+                return response_data_json["message"]["content"], None, response_metrics
+            # API response format is not as expected (e.g., no "message" or "content")
+            return None, _handle_ollama_api_error(response_data_json, log_prefix, response_text_for_log), response_metrics
             
     except Exception as ex:
-        analysis_result = utils._handle_ollama_request_exception(ex, log_prefix, response_text_for_log, http_status) # Use utils version
+        response_metrics["time_to_verdict_s"] = round(time.perf_counter() - started_at, 3)
+        return None, utils._handle_ollama_request_exception(ex, log_prefix, response_text_for_log, http_status), response_metrics # Use utils version
+
+
+def analyze_single_field_ollama(field_registry, field_id, current_count=0, total_count=0, model_name=None):
+    """
+    Orchestrates the analysis of a single field with Ollama using the chat API and structured prompts.
+    field_id: id of the field in field_registry (schema_parser.FieldRegistry).
+    model_name: Ollama model to use (defaults to OLLAMA_MODEL).
+    """
+    progress_log = f"({current_count}/{total_count})" if total_count > 0 else ""
+    log_prefix = f"[OLLAMA_CHAT {field_registry.unique_key(field_id)} {progress_log}]"
+    print(f"{log_prefix} Starting analysis...")
+
+    field_record = field_registry.record(field_id)
+    field_info = {
+        "model_name_context": os.path.splitext(field_registry.file_name(field_id))[0],
+        "full_field_path": ".".join(field_record.path),
+        "field_name": field_record.name,
+        "field_description": field_record.description if field_record.description else "N/A"
+    }
+
+    messages = _build_ollama_messages(field_info)
+    if messages is None: # Error loading prompt components
+        return {"pii_sensitivity_assessment": "ERROR_PROMPT_LOADING", 
+                "gdpr_justification": "Failed to load one or more prompt components."}
+
+    model_response_content_str, analysis_result, response_metrics = _send_chat_request(
+        messages, log_prefix, num_predict=OLLAMA_NUM_PREDICT_SINGLE, is_complete_verdict=_is_complete_field_verdict,
+        model_name=model_name
+    )
+    if model_response_content_str is not None:
+        analysis_result = _parse_ollama_model_response(model_response_content_str, log_prefix)
+    analysis_result["response_metrics"] = response_metrics
     
-    print(f"{log_prefix} Result: Sensitivity='{analysis_result.get('pii_sensitivity_assessment', 'N/A')}'")
-    return analysis_result
\ No newline at end of file
+    print(f"{log_prefix} Result: Sensitivity='{analysis_result.get('pii_sensitivity_assessment', 'N/A')}' "
+          f"(time to verdict: {response_metrics['time_to_verdict_s']}s, tokens: {response_metrics['completion_tokens']}, stopped early: {response_metrics['stopped_early']})")
+    return analysis_result
+
+
+def _build_ollama_batch_messages(filename_context, batch_field_records):
+    """
+    Builds the chat 'messages' for a batch of fields of the same schema file.
+    batch_field_records: list of schema_parser.FieldRecord.
+    """
+    system_instructions = _load_prompt_component("system_instructions_rgpd_expert.txt")
+    batch_task_template = _load_prompt_component("user_task_batch_template.txt")
+    batch_response_examples = _load_prompt_component("batch_response_format_examples.txt")
+
+    if "ERROR:" in system_instructions or "ERROR:" in batch_task_template or "ERROR:" in batch_response_examples:
+        return None
+
+    field_lines = []
+    for field_record in batch_field_records:
+        field_lines.append(json.dumps({
+            "field_id": ".".join(field_record.path),
+            "field_name": field_record.name,
+            "field_description": field_record.description if field_record.description else "N/A"
+        }, ensure_ascii=False))
+
+    user_message_content = batch_task_template.format(
+        model_name_context=os.path.splitext(filename_context)[0],
+        field_count=len(batch_field_records),
+        fields_block="\n".join(field_lines)
+    )
+    full_user_prompt_with_examples = f"{user_message_content}\n\n--- RESPONSE FORMAT EXAMPLES ---\n{batch_response_examples}"
+
+    return [
+        {"role": "system", "content": system_instructions},
+        {"role": "user", "content": full_user_prompt_with_examples}
+    ]
+
+
+def _parse_ollama_batch_response(model_response_str, expected_field_ids, log_prefix):
+    """
+    Parses and validates a batch response. Accepts {"verdicts": [...]} or a bare JSON array.
+    Returns {field_id: analysis_result} with only the valid verdicts for expected fields.
+    """
+    try:
+        parsed_response = json.loads(model_response_str)
+    except json.JSONDecodeError as je:
+        print(f"{log_prefix} ERRO: Failed to decode model's batch JSON response. Error: {je}")
+        return {}
+
+    verdict_list = parsed_response.get("verdicts") if isinstance(parsed_response, dict) else parsed_response
+    if not isinstance(verdict_list, list):
+        print(f"{log_prefix} ERRO: Model's batch response has no verdict array: {model_response_str[:200]}...")
+        return {}
+
+    valid_verdicts = {}
+    for verdict in verdict_list:
+        if not isinstance(verdict, dict):
+            continue
+        field_id = verdict.get("field_id")
+        if field_id not in expected_field_ids or field_id in valid_verdicts:
+            continue
+        if isinstance(verdict.get("pii_sensitivity_assessment"), str) and "gdpr_justification" in verdict:
+            valid_verdicts[field_id] = {
+                "pii_sensitivity_assessment": verdict["pii_sensitivity_assessment"],
+                "gdpr_justification": verdict["gdpr_justification"]
+            }
+    return valid_verdicts
+
+
+def analyze_field_batch_ollama(field_registry, field_ids, current_count=0, total_count=0, model_name=None):
+    """
+    Analyzes several fields of the same schema file in one chat request.
+    field_ids: ids in field_registry (schema_parser.FieldRegistry) of fields that all come from the same file.
+    model_name: Ollama model to use (defaults to OLLAMA_MODEL).
+    Fields missing from (or malformed in) the model's answer get a transient ERROR_MODEL_BATCH_VERDICT_MISSING
+    result: the caller's dispatcher re-queues them as single-field work items (with its retry policy and limiter).
+    Returns: {field_id: analysis_result}.
+    """
+    if len(field_ids) == 1:
+        return {field_ids[0]: analyze_single_field_ollama(field_registry, field_ids[0], current_count, total_count, model_name)}
+
+    filename_context = field_registry.file_name(field_ids[0])
+    progress_log = f"({current_count}/{total_count})" if total_count > 0 else ""
+    log_prefix = f"[OLLAMA_BATCH {filename_context} x{len(field_ids)} {progress_log}]"
+    print(f"{log_prefix} Starting batch analysis...")
+
+    messages = _build_ollama_batch_messages(filename_context, [field_registry.record(field_id) for field_id in field_ids])
+    if messages is None:
+        error_result = {"pii_sensitivity_assessment": "ERROR_PROMPT_LOADING",
+                        "gdpr_justification": "Failed to load one or more prompt components."}
+        return {field_id: error_result for field_id in field_ids}
+
+    batch_num_predict = OLLAMA_NUM_PREDICT_PER_BATCH_FIELD * len(field_ids) if OLLAMA_NUM_PREDICT_PER_BATCH_FIELD else None
+    model_response_content_str, error_result, response_metrics = _send_chat_request(
+        messages, log_prefix, num_predict=batch_num_predict, is_complete_verdict=_is_complete_batch_verdict,
+        model_name=model_name
+    )
+    # Every field of the batch shares the request's metrics; batch_size lets per-field shares be derived
+    batch_metrics = dict(response_metrics, batch_size=len(field_ids))
+    if model_response_content_str is None:
+        # Transport/API failure: the server did not answer, so individual retries would fail the same way
+        error_result["response_metrics"] = batch_metrics
+        return {field_id: error_result for field_id in field_ids}
+
+    # The prompt identifies each field by its path ("field_id" of the batch answer)
+    field_ids_by_prompt_id = {field_registry.path_string(field_id): field_id for field_id in field_ids}
+    valid_verdicts = _parse_ollama_batch_response(model_response_content_str, field_ids_by_prompt_id, log_prefix)
+
+    batch_results = {field_ids_by_prompt_id[prompt_field_id]: dict(verdict, response_metrics=batch_metrics) for prompt_field_id, verdict in valid_verdicts.items()}
+    missing_field_ids = [field_id for field_id in field_ids if field_id not in batch_results]
+    print(f"{log_prefix} {len(batch_results)}/{len(field_ids)} valid verdicts; {len(missing_field_ids)} field(s) to retry individually.")
+    missing_result = {"pii_sensitivity_assessment": BATCH_VERDICT_MISSING_ASSESSMENT,
+                      "gdpr_justification": "The model's batch answer had no valid verdict for this field.",
+                      "response_metrics": batch_metrics}
+    for field_id in missing_field_ids:
+        batch_results[field_id] = missing_result
+    return batch_results
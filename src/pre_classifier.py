@@ -0,0 +1,139 @@
+# src/pre_classifier.py
+import functools
+import json
+import os
+import re
+
+import utils
+
+PRE_CLASSIFIER_RULES_FILE = os.path.join(utils.PROJECT_ROOT_DIR, "rules", "pre_classifier_rules.json")
+RULE_TARGETS = ["field_name", "path", "description"]
+RULE_TYPES = ["keyword", "regex"]
+
+# Tier labels recorded in every analysis result ("analysis_tier")
+TIER_RULES = "RULES"
+TIER_LLM = "LLM"
+TIER_SIMILARITY = "SIMILARITY" # Verdict of a near-duplicate field (main.SIMILARITY_REUSE_ENABLED)
+
+# Phase 2 priority (not a verdict): weight of the name/description tokens that make a field likely to hold personal data.
+# The field name counts in full, its parent path and description at PII_LIKELIHOOD_CONTEXT_FACTOR, and shallow fields
+# get up to PII_LIKELIHOOD_DEPTH_WEIGHT more (top-level attributes are usually the entity's own data).
+PII_LIKELIHOOD_TOKEN_WEIGHTS = {
+    "email": 1.0, "mail": 0.9, "phone": 1.0, "telephone": 1.0, "mobile": 0.9, "fax": 0.7,
+    "name": 0.8, "surname": 0.9, "firstname": 0.9, "lastname": 0.9, "nickname": 0.8,
+    "user": 0.8, "username": 0.9, "person": 0.9, "owner": 0.7, "customer": 0.8, "citizen": 0.8, "contact": 0.8,
+    "patient": 1.0, "health": 1.0, "gender": 0.9, "birth": 0.9, "birthdate": 1.0, "age": 0.7,
+    "address": 0.8, "street": 0.7, "postal": 0.6, "postcode": 0.6, "zip": 0.5,
+    "passport": 1.0, "ssn": 1.0, "iban": 1.0, "card": 0.6, "account": 0.6, "password": 0.9,
+    "location": 0.6, "coordinates": 0.5, "latitude": 0.5, "longitude": 0.5, "gps": 0.6,
+    "ip": 0.8, "device": 0.5, "id": 0.4, "identifier": 0.4
+}
+PII_LIKELIHOOD_CONTEXT_FACTOR = 0.5
+PII_LIKELIHOOD_DEPTH_WEIGHT = 0.3
+_WORD_TOKEN_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+_compiled_rules = None
+
+
+def _compile_rule(rule):
+    """Validates a rule from the rules file and precompiles its matcher."""
+    if rule.get("target") not in RULE_TARGETS or rule.get("type") not in RULE_TYPES:
+        raise ValueError(f"Invalid pre-classifier rule '{rule.get('name')}': target must be one of {RULE_TARGETS} and type one of {RULE_TYPES}.")
+    compiled_rule = dict(rule)
+    if rule["type"] == "keyword":
+        compiled_rule["keyword_set"] = {str(value).lower() for value in rule.get("values", [])}
+    else:
+        compiled_rule["regex"] = re.compile(rule["pattern"])
+    # Optional "negative_examples": values of the rule's target it must not match (guards against over-broad patterns)
+    for negative_example in rule.get("negative_examples", []):
+        if _rule_matches(compiled_rule, {rule["target"]: negative_example}):
+            raise ValueError(f"Invalid pre-classifier rule '{rule.get('name')}': it matches its negative example '{negative_example}'")
+    return compiled_rule
+
+
+def load_rules(rules_filepath=PRE_CLASSIFIER_RULES_FILE):
+    """Loads and compiles the rules file. A missing or invalid file disables the rule tier."""
+    global _compiled_rules
+    try:
+        with open(rules_filepath, 'r', encoding='utf-8') as f:
+            rules_config = json.load(f)
+        _compiled_rules = [_compile_rule(rule) for rule in rules_config.get("rules", [])]
+        print(f"[PRE_CLASSIFIER INFO] {len(_compiled_rules)} rules loaded from {rules_filepath}.")
+    except Exception as e:
+        print(f"[PRE_CLASSIFIER ERRO] Failed to load rules from {rules_filepath}: {e}. Rule tier disabled.")
+        _compiled_rules = []
+    return _compiled_rules
+
+
+def get_rules_fingerprint(rules_filepath=PRE_CLASSIFIER_RULES_FILE):
+    """Hash of the rules file content (None if it cannot be read). Changes whenever a rule is edited."""
+    try:
+        with open(rules_filepath, 'r', encoding='utf-8') as f:
+            return utils.compute_content_hash(f.read())
+    except OSError:
+        return None
+
+
+def _rule_matches(rule, target_values):
+    target_value = target_values[rule["target"]]
+    if rule["type"] == "keyword":
+        return target_value.lower() in rule["keyword_set"]
+    return rule["regex"].search(target_value) is not None
+
+
+def classify_field(field_path, field_description):
+    """
+    Applies the rules to a field (field_path: tuple of path segments, as in schema_parser.FieldRecord.path) and returns
+    the verdict of the most confident matching rule (with "confidence", "rule_name" and "analysis_tier"), or None if no rule matches.
+    """
+    if _compiled_rules is None:
+        load_rules()
+
+    target_values = {
+        "field_name": field_path[-1],
+        "path": ".".join(field_path),
+        "description": field_description or ""
+    }
+
+    best_rule = None
+    for rule in _compiled_rules:
+        if _rule_matches(rule, target_values) and (best_rule is None or rule["confidence"] > best_rule["confidence"]):
+            best_rule = rule
+    if best_rule is None:
+        return None
+
+    return {
+        "pii_sensitivity_assessment": best_rule["verdict"],
+        "gdpr_justification": best_rule.get("justification", "Matched pre-classifier rule.").format(field_name=target_values["field_name"]),
+        "confidence": best_rule["confidence"],
+        "rule_name": best_rule["name"],
+        "analysis_tier": TIER_RULES
+    }
+
+
+@functools.lru_cache(maxsize=65536) # Schema vocabularies are small: most tokens repeat across fields
+def _token_weight(token):
+    token_weight = PII_LIKELIHOOD_TOKEN_WEIGHTS.get(token)
+    if token_weight is not None:
+        return token_weight
+    # Lower-case compounds ("userid", "emailaddress"): longer keywords inside the token count at half weight
+    return max([weight / 2 for keyword, weight in PII_LIKELIHOOD_TOKEN_WEIGHTS.items() if len(keyword) >= 4 and keyword in token], default=0.0)
+
+
+def _max_token_weight(text):
+    tokens = [token.lower() for token in _WORD_TOKEN_PATTERN.findall(text)]
+    joined_tokens = "".join(tokens) # e.g. "firstName" also matches "firstname"
+    return max([_token_weight(token) for token in tokens] + [PII_LIKELIHOOD_TOKEN_WEIGHTS.get(joined_tokens, 0.0)])
+
+
+def score_pii_likelihood(field_path, field_description):
+    """
+    Cheap score (higher = more likely personal data) used to send the most promising fields to the LLM first.
+    Token weights of the field name, plus its parent path and description at a lower weight, plus a depth bonus.
+    field_path: tuple of path segments (schema_parser.FieldRecord.path).
+    """
+    context_weight = max(_max_token_weight(".".join(field_path[:-1])), _max_token_weight(field_description or ""))
+    return round(
+        _max_token_weight(field_path[-1]) + PII_LIKELIHOOD_CONTEXT_FACTOR * context_weight + PII_LIKELIHOOD_DEPTH_WEIGHT / len(field_path),
+        4
+    )
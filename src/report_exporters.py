@@ -0,0 +1,160 @@
+# src/report_exporters.py
+import csv
+import json
+import os
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError: # Optional: Parquet export is skipped without pyarrow
+    pyarrow = None
+
+import run_metrics
+
+EXPORT_FORMATS = ["jsonl", "csv", "parquet"]
+PARQUET_ROW_GROUP_SIZE = 10000 # Records buffered per Parquet row group (the only records held in memory)
+
+VERDICT_FIELDS = [
+    "source_file", "schema_key_path", "description", "pii_sensitivity_assessment", "gdpr_justification",
+    "equivalence_class_size", "analysis_tier", "rule_name", "similar_to", "confidence", "time_to_verdict_s", "completion_tokens"
+]
+SCHEMA_ROW_FIELDS = ["source_file", "path", "depth", "value"]
+
+
+def iter_verdict_records(analysis_results, field_registry, property_class_sizes=None):
+    """
+    One flat record per analyzed property (same content as the "PII Analysis Summary" sheet, snake_case keys).
+    analysis_results and property_class_sizes are keyed by the field ids of field_registry (schema_parser.FieldRegistry).
+    """
+    for field_id, analysis_data in analysis_results.items():
+        if not analysis_data:
+            continue
+        response_metrics = analysis_data.get("response_metrics") or {}
+        yield {
+            "source_file": field_registry.file_name(field_id),
+            "schema_key_path": field_registry.path_string(field_id),
+            "description": field_registry.record(field_id).description,
+            "pii_sensitivity_assessment": analysis_data.get("pii_sensitivity_assessment", "ERROR_NOT_SPECIFIED"),
+            "gdpr_justification": analysis_data.get("gdpr_justification"),
+            "equivalence_class_size": (property_class_sizes or {}).get(field_id, 1),
+            "analysis_tier": analysis_data.get("analysis_tier", "LLM"),
+            "rule_name": analysis_data.get("rule_name"),
+            "similar_to": analysis_data.get("similar_to"),
+            "confidence": analysis_data.get("confidence"),
+            "time_to_verdict_s": response_metrics.get("time_to_verdict_s"),
+            "completion_tokens": response_metrics.get("completion_tokens")
+        }
+
+
+def iter_schema_row_records(all_files_parsed_data):
+    """
+    One record per flattened schema row of every file (the rows of the Excel schema sheets).
+    In streaming-flatten mode the rows are produced by each file's row_source, so nothing is materialized.
+    """
+    for filename, file_data in all_files_parsed_data.items():
+        if 'error' in file_data:
+            continue
+        if 'row_source' in file_data:
+            flattened_rows = file_data['row_source']()
+        else:
+            flattened_rows = ((row_dict['keys'], row_dict['value']) for row_dict in file_data.get('collected_rows_for_excel') or [])
+        for row_keys, row_value in flattened_rows:
+            yield {"source_file": filename, "path": ".".join(map(str, row_keys)), "depth": len(row_keys), "value": row_value}
+
+
+def _write_jsonl(output_filepath, records, mode='w'):
+    record_count = 0
+    with open(output_filepath, mode, encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            record_count += 1
+    return record_count
+
+
+def append_verdicts_jsonl(output_filepath, analysis_results, field_registry, property_class_sizes=None):
+    """Appends verdict records to a JSON lines file (pipelined mode: one call per schema file as soon as it is complete)."""
+    os.makedirs(os.path.dirname(os.path.abspath(output_filepath)), exist_ok=True)
+    return _write_jsonl(output_filepath, iter_verdict_records(analysis_results, field_registry, property_class_sizes), mode='a')
+
+
+def _write_csv(output_filepath, records, field_names):
+    record_count = 0
+    with open(output_filepath, 'w', encoding='utf-8', newline='') as f:
+        csv_writer = csv.DictWriter(f, fieldnames=field_names)
+        csv_writer.writeheader()
+        for record in records:
+            csv_writer.writerow(record)
+            record_count += 1
+    return record_count
+
+
+def _parquet_cell(value):
+    """Schema values are mixed scalars: strings are kept, other values are stored as their JSON text."""
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _write_parquet(output_filepath, records, field_names):
+    """Writes the records in row groups of PARQUET_ROW_GROUP_SIZE; every column is a nullable string except counts."""
+    integer_fields = {"depth", "equivalence_class_size", "completion_tokens"}
+    float_fields = {"confidence", "time_to_verdict_s"}
+    parquet_schema = pyarrow.schema([
+        (field_name, pyarrow.int64() if field_name in integer_fields else pyarrow.float64() if field_name in float_fields else pyarrow.string())
+        for field_name in field_names
+    ])
+    record_count = 0
+    column_buffers = {field_name: [] for field_name in field_names}
+
+    def _flush(parquet_writer):
+        parquet_writer.write_table(pyarrow.Table.from_pydict(column_buffers, schema=parquet_schema))
+        for column_buffer in column_buffers.values():
+            column_buffer.clear()
+
+    with pyarrow.parquet.ParquetWriter(output_filepath, parquet_schema) as parquet_writer:
+        for record in records:
+            for field_name in field_names:
+                value = record.get(field_name)
+                column_buffers[field_name].append(value if field_name in integer_fields or field_name in float_fields else _parquet_cell(value))
+            record_count += 1
+            if record_count % PARQUET_ROW_GROUP_SIZE == 0:
+                _flush(parquet_writer)
+        if record_count == 0 or record_count % PARQUET_ROW_GROUP_SIZE:
+            _flush(parquet_writer)
+    return record_count
+
+
+def _export_records(output_filepath, export_format, records, field_names):
+    if export_format == "jsonl":
+        return _write_jsonl(output_filepath, records)
+    if export_format == "csv":
+        return _write_csv(output_filepath, records, field_names)
+    return _write_parquet(output_filepath, records, field_names)
+
+
+@run_metrics.instrument("export_reports")
+def export_reports(output_base_path, export_formats, all_files_parsed_data, analysis_results, field_registry,
+                   property_class_sizes=None):
+    """
+    Streams the per-field verdicts and the flattened schema rows to <output_base_path>_verdicts.<ext> and
+    <output_base_path>_schema_rows.<ext> for every requested format ("jsonl", "csv", "parquet"), record by record.
+    Returns the list of written file paths.
+    """
+    written_paths = []
+    for export_format in export_formats:
+        if export_format not in EXPORT_FORMATS:
+            print(f"[EXPORT WARNING] Unknown export format '{export_format}' (expected one of {EXPORT_FORMATS}). Skipped.")
+            continue
+        if export_format == "parquet" and pyarrow is None:
+            print("[EXPORT WARNING] Parquet export requested but 'pyarrow' is not installed. Skipped.")
+            continue
+        for export_name, records, field_names in (
+            ("verdicts", iter_verdict_records(analysis_results, field_registry, property_class_sizes), VERDICT_FIELDS),
+            ("schema_rows", iter_schema_row_records(all_files_parsed_data), SCHEMA_ROW_FIELDS)
+        ):
+            output_filepath = f"{output_base_path}_{export_name}.{export_format}"
+            os.makedirs(os.path.dirname(os.path.abspath(output_filepath)), exist_ok=True)
+            record_count = _export_records(output_filepath, export_format, records, field_names)
+            print(f"[EXPORT] {record_count} {export_name.replace('_', ' ')} records written to {output_filepath}.")
+            written_paths.append(output_filepath)
+    return written_paths
@@ -0,0 +1,177 @@
+# src/run_metrics.py
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+RUN_METRICS_PERCENTILES = [50, 90, 99]
+# Server-side durations reported by Ollama in nanoseconds (final chunk / non-streamed response)
+OLLAMA_SERVER_DURATION_FIELDS = ["load_duration", "prompt_eval_duration", "eval_duration", "total_duration"]
+
+
+class RunMetrics:
+    """
+    Structured instrumentation of one pipeline run, shared by all threads of the run.
+    Records (one dict per event, written as JSON lines by write_jsonl):
+    - {"type": "phase", "name", "seconds"}: pipeline phases (timed_phase);
+    - {"type": "ollama_call", "model", "wall_s", "time_to_verdict_s", "prompt_eval_count", "prompt_eval_duration_s", ...}: every chat request;
+    - {"type": "timing", "name", "seconds", ...}: hot-path functions (timed / @instrument, e.g. save_ollama_cache, apply_styles_to_sheet);
+    - {"type": "ollama_endpoint", "endpoint", "requests_completed", "requests_per_second", ...}: per-endpoint totals of a multi-endpoint pool.
+    Counters (cache hits/misses, ...) are emitted once, in the final "run_summary" record.
+    """
+
+    def __init__(self, run_label=None):
+        self.run_label = run_label
+        self.started_at = time.time()
+        self.records = []
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, record_type, **fields):
+        fields["type"] = record_type
+        fields["elapsed_s"] = round(time.time() - self.started_at, 4)
+        with self._lock:
+            self.records.append(fields)
+
+    def increment(self, counter_name, amount=1):
+        with self._lock:
+            self.counters[counter_name] = self.counters.get(counter_name, 0) + amount
+
+    @contextlib.contextmanager
+    def timed(self, timing_name, record_type="timing", **fields):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(record_type, name=timing_name, seconds=round(time.perf_counter() - started_at, 6), **fields)
+
+    def timed_phase(self, phase_name):
+        return self.timed(phase_name, record_type="phase")
+
+    def record_ollama_call(self, model_name, wall_seconds, response_metrics, error_key=None):
+        self.record(
+            "ollama_call",
+            model=model_name,
+            wall_s=round(wall_seconds, 4),
+            time_to_verdict_s=response_metrics.get("time_to_verdict_s"),
+            streamed=response_metrics.get("streamed"),
+            stopped_early=response_metrics.get("stopped_early"),
+            num_predict=response_metrics.get("num_predict"),
+            prompt_eval_count=response_metrics.get("prompt_tokens"),
+            eval_count=response_metrics.get("completion_tokens"),
+            token_count_source=response_metrics.get("token_count_source"),
+            **{f"{duration_field}_s": response_metrics.get(f"{duration_field}_s") for duration_field in OLLAMA_SERVER_DURATION_FIELDS},
+            error=error_key
+        )
+
+    def build_summary_rows(self):
+        """Rows of the "Run Metrics" sheet: phase times, latency percentiles, tokens/sec, hot-path timings and counters."""
+        with self._lock:
+            records = list(self.records)
+            counters = dict(self.counters)
+        summary_rows = []
+
+        def _values(record_type, field_name, name=None):
+            return [
+                record[field_name] for record in records
+                if record["type"] == record_type and (name is None or record.get("name") == name) and record.get(field_name) is not None
+            ]
+
+        def _add_row(metric_name, values=None, total=None, with_total=True):
+            if values is not None and not values:
+                return # Not measured in this run (e.g. no server durations when every stream stopped early)
+            metric_row = {"Metric": metric_name, "Count": len(values) if values is not None else None, "Total": total}
+            if values:
+                values_array = np.asarray(values, dtype=float)
+                metric_row["Total"] = round(float(values_array.sum()), 4) if with_total else None
+                metric_row["Mean"] = round(float(values_array.mean()), 4)
+                for percentile, value in zip(RUN_METRICS_PERCENTILES, np.percentile(values_array, RUN_METRICS_PERCENTILES)):
+                    metric_row[f"P{percentile}"] = round(float(value), 4)
+                metric_row["Max"] = round(float(values_array.max()), 4)
+            summary_rows.append(metric_row)
+
+        for record in records:
+            if record["type"] == "phase":
+                _add_row(f"Phase: {record['name']} (s)", [record["seconds"]])
+
+        ollama_calls = [record for record in records if record["type"] == "ollama_call"]
+        if ollama_calls:
+            _add_row("Ollama call: wall time (s)", [record["wall_s"] for record in ollama_calls])
+            _add_row("Ollama call: time to verdict (s)", _values("ollama_call", "time_to_verdict_s"))
+            for duration_field in OLLAMA_SERVER_DURATION_FIELDS:
+                _add_row(f"Ollama server: {duration_field} (s)", _values("ollama_call", f"{duration_field}_s"))
+            _add_row("Ollama call: prompt tokens", _values("ollama_call", "prompt_eval_count"))
+            _add_row("Ollama call: completion tokens", _values("ollama_call", "eval_count"))
+            prompt_rates = [
+                record["prompt_eval_count"] / record["prompt_eval_duration_s"] for record in ollama_calls
+                if record.get("prompt_eval_count") and record.get("prompt_eval_duration_s")
+            ]
+            generation_rates = [
+                record["eval_count"] / record["eval_duration_s"] for record in ollama_calls
+                if record.get("eval_count") and record.get("eval_duration_s")
+            ]
+            _add_row("Ollama server: prompt eval tokens/s (per call)", prompt_rates, with_total=False)
+            _add_row("Ollama server: generation tokens/s (per call)", generation_rates, with_total=False)
+            timed_calls = [record for record in ollama_calls if record.get("eval_count") and record.get("eval_duration_s")]
+            if timed_calls:
+                aggregate_rate = sum(record["eval_count"] for record in timed_calls) / sum(record["eval_duration_s"] for record in timed_calls)
+                _add_row("Ollama server: generation tokens/s (aggregate)", total=round(aggregate_rate, 2))
+            _add_row("Ollama call: errors", total=sum(1 for record in ollama_calls if record.get("error")))
+
+        for record in records:
+            if record["type"] == "ollama_endpoint":
+                _add_row(f"Ollama endpoint {record['endpoint']}: requests completed", total=record["requests_completed"])
+                _add_row(f"Ollama endpoint {record['endpoint']}: requests/s", total=record["requests_per_second"])
+                _add_row(f"Ollama endpoint {record['endpoint']}: mean latency (s)", total=record["mean_latency_s"])
+
+        timing_names = list(dict.fromkeys(record["name"] for record in records if record["type"] == "timing"))
+        for timing_name in timing_names:
+            _add_row(f"Timing: {timing_name} (s)", _values("timing", "seconds", timing_name))
+
+        for counter_name, counter_value in sorted(counters.items()):
+            _add_row(f"Counter: {counter_name}", total=counter_value)
+        return summary_rows
+
+    def write_jsonl(self, output_filepath):
+        """Writes every record, then a "run_summary" record with the counters, as JSON lines."""
+        os.makedirs(os.path.dirname(os.path.abspath(output_filepath)), exist_ok=True)
+        with self._lock:
+            records = list(self.records)
+            counters = dict(self.counters)
+        with open(output_filepath, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            f.write(json.dumps({
+                "type": "run_summary", "run_label": self.run_label, "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+                "elapsed_s": round(time.time() - self.started_at, 4), "counters": counters
+            }, ensure_ascii=False) + "\n")
+        print(f"[RUN METRICS] {len(records)} records written to {output_filepath}.")
+
+
+_active_run_metrics = RunMetrics()
+
+
+def start_run_metrics(run_label=None):
+    """Starts a new collector for a pipeline run and makes it the one used by get_run_metrics()."""
+    global _active_run_metrics
+    _active_run_metrics = RunMetrics(run_label)
+    return _active_run_metrics
+
+
+def get_run_metrics():
+    return _active_run_metrics
+
+
+def instrument(timing_name):
+    """Decorator recording the duration of every call of a hot-path function in the active run's metrics."""
+    def _decorator(function):
+        @functools.wraps(function)
+        def _wrapper(*args, **kwargs):
+            with get_run_metrics().timed(timing_name):
+                return function(*args, **kwargs)
+        return _wrapper
+    return _decorator
@@ -1,12 +1,31 @@
 # src/schema_parser.py
+import array
+import functools
 import json
 import os
+import re
+import time
+import urllib.parse
+
+import utils
+
+try:
+    import ijson # Opcional: leitura incremental de esquemas muito grandes
+except ImportError:
+    ijson = None
+
+try:
+    import orjson # Opcional: descodificador JSON mais rápido
+    _decode_json_bytes = orjson.loads # orjson.JSONDecodeError é subclasse de json.JSONDecodeError
+except ImportError:
+    orjson = None
+    _decode_json_bytes = json.loads
 
 def load_schema(filepath):
     # ... (como antes) ...
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(filepath, 'rb') as f:
+            return _decode_json_bytes(f.read())
     except FileNotFoundError:
         print(f"[SCHEMA_PARSER ERRO] Ficheiro de esquema não encontrado: {filepath}")
     except json.JSONDecodeError as e:
@@ -16,59 +35,519 @@ def load_schema(filepath):
     return None
 
 
-def _extract_properties_recursive(schema_data, current_path_parts, properties_map, filename_context):
+def _fingerprint_property_fragment(prop_schema):
+    """Hash do fragmento de esquema de uma propriedade, sem a descrição (comparada à parte)."""
+    if isinstance(prop_schema, dict):
+        prop_schema = {key: value for key, value in prop_schema.items() if key != "description"}
+    return utils.compute_content_hash(prop_schema)
+
+
+SCHEMA_COMBINATOR_KEYWORDS = ["allOf", "oneOf", "anyOf"]
+SCHEMA_DEFINITION_KEYWORDS = ["definitions", "$defs"]
+
+
+def _decode_json_pointer_token(token):
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+class SchemaRefResolver:
+    """
+    Resolve '$ref' locais ('#/definitions/X') e para outros ficheiros do diretório de esquemas
+    ('common-schema.json#/...' ou um URL cujo nome de ficheiro exista no diretório).
+    Guarda em memória os documentos carregados e, em extraction_memo, as propriedades já extraídas
+    de cada definição, para que uma definição partilhada seja percorrida uma única vez.
+    """
+
+    def __init__(self, schema_dir=None):
+        self.schema_dir = schema_dir
+        self._documents = {}
+        self.extraction_memo = {}
+
+    def register_document(self, filename, schema_data):
+        self._documents[filename] = schema_data
+
+    def _get_document(self, filename):
+        if filename not in self._documents:
+            schema_data = None
+            candidate_path = os.path.join(self.schema_dir, filename) if self.schema_dir else None
+            if candidate_path and os.path.isfile(candidate_path):
+                schema_data = load_schema(candidate_path)
+            self._documents[filename] = schema_data
+        return self._documents[filename]
+
+    def resolve(self, ref, current_filename):
+        """
+        Retorna (canonical_ref, target_filename, pointer_parts, sub_schema),
+        ou None se a referência não puder ser resolvida localmente.
+        """
+        document_part, _, fragment = ref.partition("#")
+        target_filename = os.path.basename(urllib.parse.urlparse(document_part).path) if document_part else current_filename
+        target_node = self._get_document(target_filename)
+        pointer_parts = [_decode_json_pointer_token(token) for token in fragment.split("/") if token]
+        for token in pointer_parts:
+            if isinstance(target_node, dict) and token in target_node:
+                target_node = target_node[token]
+            elif isinstance(target_node, list) and token.isdigit() and int(token) < len(target_node):
+                target_node = target_node[int(token)]
+            else:
+                return None
+        if not isinstance(target_node, dict):
+            return None
+        return f"{target_filename}#/{'/'.join(pointer_parts)}", target_filename, pointer_parts, target_node
+
+
+_ref_resolvers_by_dir = {}
+
+
+def get_ref_resolver(schema_dir):
+    """Um resolver por diretório e por processo, partilhado por todos os ficheiros desse diretório."""
+    if schema_dir not in _ref_resolvers_by_dir:
+        _ref_resolvers_by_dir[schema_dir] = SchemaRefResolver(schema_dir)
+    return _ref_resolvers_by_dir[schema_dir]
+
+
+def reset_ref_resolvers():
+    """Esquece documentos e definições memorizados (p.ex. quando os ficheiros do diretório mudam)."""
+    _ref_resolvers_by_dir.clear()
+
+
+class _ExtractionContext:
+    """Estado de uma extração: entradas (path_parts, descrição, fragmento, chave canónica ou None)."""
+
+    def __init__(self, document_filename, resolver, active_refs):
+        self.document_filename = document_filename
+        self.resolver = resolver
+        self.active_refs = active_refs
+        self.entries = []
+        self.unresolved_refs = 0
+        self.cycle_cut_refs = set()
+
+
+def _extract_referenced_properties(ref, current_path_parts, context):
+    """Segue um '$ref', reutilizando as entradas memorizadas da definição alvo quando existem."""
+    resolved = context.resolver.resolve(ref, context.document_filename) if context.resolver else None
+    if resolved is None:
+        context.unresolved_refs += 1
+        return
+    canonical_ref, target_filename, pointer_parts, target_schema = resolved
+    if canonical_ref in context.active_refs:
+        context.cycle_cut_refs.add(canonical_ref) # Referência cíclica: a expansão pára aqui
+        return
+
+    ref_entries = context.resolver.extraction_memo.get(canonical_ref)
+    if ref_entries is None:
+        outer_active_refs = set(context.active_refs)
+        ref_context = _ExtractionContext(target_filename, context.resolver, context.active_refs)
+        context.active_refs.add(canonical_ref)
+        try:
+            _extract_properties_recursive(target_schema, [], ref_context)
+        finally:
+            context.active_refs.discard(canonical_ref)
+        ref_entries = ref_context.entries
+        context.unresolved_refs += ref_context.unresolved_refs
+        # Um ciclo fechado numa referência ativa fora desta expansão torna-a dependente do contexto: não é memorizada
+        outer_cycle_cut_refs = ref_context.cycle_cut_refs & outer_active_refs
+        context.cycle_cut_refs |= outer_cycle_cut_refs
+        if not outer_cycle_cut_refs:
+            context.resolver.extraction_memo[canonical_ref] = ref_entries
+
+    for relative_parts, description_text, fragment_hash, canonical_key in ref_entries:
+        if canonical_key is None:
+            canonical_key = f"{target_filename}::{'.'.join(pointer_parts + relative_parts)}"
+        context.entries.append((current_path_parts + relative_parts, description_text, fragment_hash, canonical_key))
+
+
+def _describe_property(prop_schema, context):
+    """
+    Retorna (descrição, chave canónica ou None) de uma propriedade.
+    Uma propriedade com '$ref' sem descrição herda a da definição referenciada; se o '$ref' aponta
+    para outra propriedade ('.../properties/nome'), a chave canónica é a dessa propriedade.
+    """
+    if not isinstance(prop_schema, dict):
+        return "", None
+    resolved = None
+    if isinstance(prop_schema.get("$ref"), str) and context.resolver:
+        resolved = context.resolver.resolve(prop_schema["$ref"], context.document_filename)
+    description_text = prop_schema.get("description", "")
+    if resolved is None:
+        return description_text, None
+    _, target_filename, pointer_parts, target_schema = resolved
+    if "description" not in prop_schema:
+        description_text = target_schema.get("description", "")
+    canonical_key = None
+    if len(pointer_parts) >= 2 and pointer_parts[-2] == "properties":
+        canonical_key = f"{target_filename}::{'.'.join(pointer_parts)}"
+    return description_text, canonical_key
+
+
+def _extract_properties_recursive(schema_data, current_path_parts, context):
     """Função auxiliar recursiva para extract_all_properties_with_descriptions."""
     if not isinstance(schema_data, dict):
         return
 
+    if isinstance(schema_data.get("$ref"), str):
+        _extract_referenced_properties(schema_data["$ref"], current_path_parts, context)
+
     if "properties" in schema_data and isinstance(schema_data["properties"], dict):
         base_path_for_props = current_path_parts + ["properties"]
         for prop_name, prop_schema in schema_data["properties"].items():
             prop_path_parts = base_path_for_props + [prop_name]
-            prop_full_path_str = ".".join(prop_path_parts)
-            unique_key_for_map = f"{filename_context}::{prop_full_path_str}"
-
-            description_text = ""
-            if isinstance(prop_schema, dict) and "description" in prop_schema:
-                description_text = prop_schema["description"]
-            
-            # Adiciona a propriedade ao mapa se tiver descrição (o filtro de relevância é feito depois)
-            properties_map[unique_key_for_map] = description_text
-            
+            description_text, canonical_key = _describe_property(prop_schema, context)
+            # Adiciona a propriedade (o filtro de relevância é feito depois)
+            context.entries.append((prop_path_parts, description_text, _fingerprint_property_fragment(prop_schema), canonical_key))
             if isinstance(prop_schema, dict):
-                _extract_properties_recursive(prop_schema, prop_path_parts, properties_map, filename_context)
-    
-    if "allOf" in schema_data and isinstance(schema_data["allOf"], list):
-        for item_schema in schema_data["allOf"]:
-            _extract_properties_recursive(item_schema, list(current_path_parts), properties_map, filename_context)
-    
+                _extract_properties_recursive(prop_schema, prop_path_parts, context)
+
+    for combinator_keyword in SCHEMA_COMBINATOR_KEYWORDS:
+        if isinstance(schema_data.get(combinator_keyword), list):
+            for item_schema in schema_data[combinator_keyword]:
+                _extract_properties_recursive(item_schema, list(current_path_parts), context)
+
     if "items" in schema_data and isinstance(schema_data["items"], dict):
-        _extract_properties_recursive(schema_data["items"], current_path_parts + ["items"], properties_map, filename_context)
+        _extract_properties_recursive(schema_data["items"], current_path_parts + ["items"], context)
 
+    # As definições locais também são extraídas no seu próprio caminho (que é a chave canónica dos '$ref' para elas)
+    for definitions_keyword in SCHEMA_DEFINITION_KEYWORDS:
+        if isinstance(schema_data.get(definitions_keyword), dict):
+            for definition_name, definition_schema in schema_data[definitions_keyword].items():
+                _extract_properties_recursive(definition_schema, current_path_parts + [definitions_keyword, definition_name], context)
 
-def extract_all_properties_with_descriptions(schema_data, filename_context):
+
+def extract_all_properties_with_descriptions(schema_data, filename_context, fragments_map=None, ref_aliases=None, resolver=None):
     """
-    Extrai todas as propriedades com suas descrições de um esquema JSON.
+    Extrai todas as propriedades com suas descrições de um esquema JSON, seguindo '$ref'
+    (allOf/oneOf/anyOf, definitions/$defs) através de resolver (um SchemaRefResolver).
     A chave do mapa retornado é 'filename::path.to.property'.
+    Se fragments_map for dado, é preenchido com {chave: hash do fragmento de esquema da propriedade}.
+    Se ref_aliases for dado, é preenchido com {chave no local de uso: chave canónica da definição}
+    para as propriedades que vêm de um '$ref'.
     """
+    if resolver is None:
+        resolver = SchemaRefResolver()
+    resolver.register_document(filename_context, schema_data)
+    context = _ExtractionContext(filename_context, resolver, set())
+    _extract_properties_recursive(schema_data, [], context)
+    if context.unresolved_refs:
+        print(f"[SCHEMA_PARSER INFO] {filename_context}: {context.unresolved_refs} '$ref' não resolvidos localmente (ignorados).")
+
     properties_map = {}
-    _extract_properties_recursive(schema_data, [], properties_map, filename_context)
+    for path_parts, description_text, fragment_hash, canonical_key in context.entries:
+        unique_key_for_map = f"{filename_context}::{'.'.join(path_parts)}"
+        properties_map[unique_key_for_map] = description_text
+        if fragments_map is not None:
+            fragments_map[unique_key_for_map] = fragment_hash
+        if ref_aliases is not None and canonical_key is not None and canonical_key != unique_key_for_map:
+            ref_aliases[unique_key_for_map] = canonical_key
     return properties_map
 
 
-def flatten_schema_for_excel(schema_data, current_keys=None, collected_rows=None):
-    # ... (como antes) ...
-    if current_keys is None: current_keys = []
-    if collected_rows is None: collected_rows = []
+@functools.lru_cache(maxsize=65536) # Os nomes repetem-se muito entre ficheiros
+def _normalize_field_name(field_name):
+    """'dateCreated', 'date_created' e 'Date-Created' normalizam para 'datecreated'."""
+    return re.sub(r'[^0-9a-z]', '', field_name.lower())
+
+
+def _normalize_description(description_text):
+    return " ".join(str(description_text or "").split()).lower().rstrip(".")
+
+
+class FieldRecord:
+    """
+    Registo compacto de uma propriedade do FieldRegistry: nome, caminho (tuplo de segmentos internados),
+    descrição (internada), índice do ficheiro, id da propriedade pai (None no topo) e hash do fragmento de esquema.
+    """
+    __slots__ = ("name", "path", "description", "file_index", "parent_id", "fragment_hash")
+
+    def __init__(self, path, description, file_index, parent_id, fragment_hash):
+        self.name = path[-1]
+        self.path = path
+        self.description = description
+        self.file_index = file_index
+        self.parent_id = parent_id
+        self.fragment_hash = fragment_hash
+
 
+class FieldRegistry:
+    """
+    Registo central das propriedades da Fase 1, partilhado pelo parser, pela análise e pelos relatórios.
+    Cada propriedade tem um id inteiro (a ordem de registo: ficheiro a ficheiro, pela ordem de extração) e um
+    FieldRecord; segmentos de caminho, caminhos, descrições e hashes de fragmento são internados, pelo que os
+    textos repetidos entre ficheiros existem uma única vez. As chaves 'filename::path.to.property' não são
+    guardadas: unique_key() reconstrói-as nas fronteiras que as persistem (cache, manifest, índice de semelhança).
+    Os registos só são acrescentados, pelo que podem ser lidos por outras threads enquanto um ficheiro é registado.
+    """
+
+    def __init__(self):
+        self._records = []
+        self._file_names = []
+        self._file_index_by_name = {}
+        self._file_field_ids = [] # por ficheiro: array de ids, pela ordem de extração
+        self._field_id_by_path = [] # por ficheiro: {caminho: id}
+        self._ref_alias_by_field_id = {} # {id: chave canónica da definição '$ref'}
+        self._ref_target_keys = set()
+        self._interned = {}
+
+    def __len__(self):
+        return len(self._records)
+
+    def _intern(self, value):
+        return self._interned.setdefault(value, value)
+
+    def add_file(self, filename, properties_map, fragments_map=None, ref_aliases=None):
+        """
+        Regista as propriedades de um ficheiro (o resultado de extract_all_properties_with_descriptions, com
+        os seus fragments_map e ref_aliases) e devolve o array dos seus ids.
+        """
+        file_index = self._file_index_by_name.setdefault(filename, len(self._file_names))
+        if file_index < len(self._file_names):
+            raise ValueError(f"File '{filename}' is already registered.")
+        self._file_names.append(filename)
+        file_field_ids = array.array('q')
+        field_id_by_path = {}
+        self._file_field_ids.append(file_field_ids)
+        self._field_id_by_path.append(field_id_by_path)
+        key_prefix_length = len(filename) + 2
+        for unique_key, description_text in properties_map.items():
+            path = self._intern(tuple(self._intern(segment) for segment in unique_key[key_prefix_length:].split('.')))
+            parent_id = None
+            for ancestor_length in range(len(path) - 1, 0, -1): # A propriedade mais próxima que contém esta
+                parent_id = field_id_by_path.get(path[:ancestor_length])
+                if parent_id is not None:
+                    break
+            fragment_hash = fragments_map.get(unique_key) if fragments_map else None
+            field_id = len(self._records)
+            description_text = description_text or ""
+            self._records.append(FieldRecord(
+                path, self._intern(description_text) if isinstance(description_text, str) else description_text, file_index, parent_id,
+                self._intern(fragment_hash) if fragment_hash is not None else None
+            ))
+            field_id_by_path[path] = field_id
+            file_field_ids.append(field_id)
+            canonical_key = ref_aliases.get(unique_key) if ref_aliases else None
+            if canonical_key is not None:
+                self._ref_alias_by_field_id[field_id] = canonical_key
+                self._ref_target_keys.add(canonical_key)
+        return file_field_ids
+
+    def field_ids(self, filename=None):
+        """Ids de todas as propriedades (ou só das de filename), pela ordem de registo."""
+        if filename is not None:
+            file_index = self._file_index_by_name.get(filename)
+            return self._file_field_ids[file_index] if file_index is not None else array.array('q')
+        return range(len(self._records))
+
+    def field_id(self, unique_key):
+        """Id da propriedade 'filename::path.to.property' (None se não estiver registada)."""
+        filename, _, path_str = unique_key.partition("::")
+        file_index = self._file_index_by_name.get(filename)
+        if file_index is None or file_index >= len(self._field_id_by_path):
+            return None
+        return self._field_id_by_path[file_index].get(tuple(path_str.split('.')))
+
+    def record(self, field_id):
+        return self._records[field_id]
+
+    def file_name(self, field_id):
+        return self._file_names[self._records[field_id].file_index]
+
+    def path_string(self, field_id):
+        return ".".join(self._records[field_id].path)
+
+    def unique_key(self, field_id):
+        field_record = self._records[field_id]
+        return f"{self._file_names[field_record.file_index]}::{'.'.join(field_record.path)}"
+
+    def ref_alias(self, field_id):
+        """Chave canónica da definição de onde vem a propriedade (via '$ref'), ou None."""
+        return self._ref_alias_by_field_id.get(field_id)
+
+    def canonical_ref_key(self, field_id):
+        """
+        Chave que junta a propriedade às outras da mesma definição '$ref': a chave canónica de um alias, a própria
+        chave se for o alvo de algum alias, ou None.
+        """
+        canonical_key = self._ref_alias_by_field_id.get(field_id)
+        if canonical_key is None and self._ref_target_keys:
+            unique_key = self.unique_key(field_id)
+            if unique_key in self._ref_target_keys:
+                return unique_key
+        return canonical_key
+
+
+def group_equivalent_properties(field_registry, field_ids=None):
+    """
+    Agrupa propriedades equivalentes (nome normalizado + descrição normalizada + fragmento de esquema)
+    para que cada classe seja enviada ao modelo uma única vez.
+    Propriedades que vêm da mesma definição via '$ref' ficam sempre na mesma classe, juntamente com a
+    própria definição quando esta também está registada.
+    Retorna uma lista de classes (listas de ids do field_registry), com o representante em primeiro lugar,
+    pela ordem de registo (field_ids: só estas propriedades; por omissão todas).
+    """
+    classes_by_signature = {}
+    for field_id in (field_registry.field_ids() if field_ids is None else field_ids):
+        canonical_key = field_registry.canonical_ref_key(field_id)
+        if canonical_key is not None:
+            classes_by_signature.setdefault(("$ref", canonical_key), []).append(field_id)
+            continue
+        classes_by_signature.setdefault(_property_signature(field_registry.record(field_id)), []).append(field_id)
+    return list(classes_by_signature.values())
+
+
+def _property_signature(field_record):
+    return (
+        _normalize_field_name(field_record.name),
+        _normalize_description(field_record.description),
+        field_record.fragment_hash
+    )
+
+
+class EquivalenceClassIndex:
+    """
+    Versão incremental de group_equivalent_properties para o modo pipelined, em que as propriedades chegam
+    ficheiro a ficheiro: cada propriedade junta-se a uma classe já conhecida (mesma assinatura ou mesma definição
+    '$ref') ou cria uma nova, com ids sequenciais. Um alias '$ref' cuja definição já foi vista noutro ficheiro
+    junta-se à classe dessa definição.
+    """
+
+    def __init__(self):
+        self._class_id_by_signature = {}
+        self._class_id_by_field_id = {}
+        self._class_sizes = []
+
+    def add_fields(self, field_registry, field_ids):
+        """Devolve [(class_id, [ids novos desta classe])], pela ordem de field_ids."""
+        new_members_by_class = {}
+        for field_id in field_ids:
+            canonical_key = field_registry.canonical_ref_key(field_id)
+            canonical_field_id = field_registry.field_id(canonical_key) if canonical_key is not None else None
+            if canonical_field_id is not None and canonical_field_id != field_id and canonical_field_id in self._class_id_by_field_id:
+                class_id = self._class_id_by_field_id[canonical_field_id]
+            else:
+                signature = ("$ref", canonical_key) if canonical_key is not None else _property_signature(field_registry.record(field_id))
+                class_id = self._class_id_by_signature.setdefault(signature, len(self._class_sizes))
+                if class_id == len(self._class_sizes):
+                    self._class_sizes.append(0)
+            self._class_id_by_field_id[field_id] = class_id
+            self._class_sizes[class_id] += 1
+            new_members_by_class.setdefault(class_id, []).append(field_id)
+        return list(new_members_by_class.items())
+
+    def class_size(self, field_id):
+        class_id = self._class_id_by_field_id.get(field_id)
+        return self._class_sizes[class_id] if class_id is not None else 1
+
+
+def iter_flattened_schema_rows(schema_data, current_keys=()):
+    """
+    Gerador equivalente a flatten_schema_for_excel: produz (keys, value) por folha, sem materializar a lista.
+    keys é um tuplo partilhado: cada chave cria um único tuplo, reutilizado por todas as folhas abaixo dela
+    (e pelos itens de uma lista), pelo que a memória fica limitada pela profundidade do esquema.
+    """
     if isinstance(schema_data, dict):
-        if not schema_data: return collected_rows # Retornar a lista
         for key, value in schema_data.items():
-            flatten_schema_for_excel(value, current_keys + [str(key)], collected_rows)
+            yield from iter_flattened_schema_rows(value, current_keys + (str(key),))
     elif isinstance(schema_data, list):
-        if not schema_data: return collected_rows
         for item in schema_data:
-             flatten_schema_for_excel(item, list(current_keys), collected_rows)
+            yield from iter_flattened_schema_rows(item, current_keys)
+    else:
+        yield current_keys, schema_data
+
+
+def _iter_flattened_rows_from_json_events(json_events):
+    """Converte eventos ijson (prefix, event, value) nas mesmas linhas (keys, value) de iter_flattened_schema_rows."""
+    open_containers = [] # [is_map, container_keys, last_map_key]
+    for _, event, value in json_events:
+        if event == 'map_key':
+            open_containers[-1][2] = str(value)
+            continue
+        if event in ('end_map', 'end_array'):
+            open_containers.pop()
+            continue
+
+        if not open_containers:
+            value_keys = ()
+        elif open_containers[-1][0]:
+            value_keys = open_containers[-1][1] + (open_containers[-1][2],)
+        else:
+            value_keys = open_containers[-1][1]
+
+        if event == 'start_map':
+            open_containers.append([True, value_keys, None])
+        elif event == 'start_array':
+            open_containers.append([False, value_keys, None])
+        else:
+            yield value_keys, value
+
+
+def iter_flattened_schema_rows_from_file(filepath):
+    """
+    Produz as linhas achatadas (keys, value) de um ficheiro de esquema.
+    Com o pacote opcional 'ijson' instalado, o ficheiro é lido incrementalmente (adequado a pacotes de
+    esquemas com centenas de MB); caso contrário é carregado com load_schema.
+    """
+    if ijson is not None:
+        try:
+            with open(filepath, 'rb') as f:
+                yield from _iter_flattened_rows_from_json_events(ijson.parse(f, use_float=True))
+            return
+        except Exception as e:
+            print(f"[SCHEMA_PARSER ERRO] Erro ao ler incrementalmente {filepath}: {e}")
+            return
+    schema_data = load_schema(filepath)
+    if schema_data is not None:
+        yield from iter_flattened_schema_rows(schema_data)
+
+
+def get_flattened_schema_depth(schema_data):
+    """Número máximo de chaves numa linha achatada (sem construir as linhas)."""
+    if isinstance(schema_data, dict):
+        return max((1 + get_flattened_schema_depth(value) for value in schema_data.values()), default=0)
+    if isinstance(schema_data, list):
+        return max((get_flattened_schema_depth(item) for item in schema_data), default=0)
+    return 0
+
+
+def flatten_schema_for_excel(schema_data, current_keys=None, collected_rows=None):
+    """Versão materializada de iter_flattened_schema_rows: lista de {'keys': [...], 'value': ...}."""
+    if collected_rows is None: collected_rows = []
+    for keys, value in iter_flattened_schema_rows(schema_data, tuple(current_keys or ())):
+        collected_rows.append({'keys': list(keys), 'value': value})
+    return collected_rows
+
+
+def ingest_schema_file(filepath, streaming_mode=False):
+    """
+    Fase 1 para um único ficheiro: carrega, achata e extrai as propriedades.
+    Função de topo (serializável) para poder correr num ProcessPoolExecutor.
+    Em streaming_mode o documento continua a ser carregado por inteiro para a extração (a resolução de $ref
+    precisa do documento completo) e para medir a profundidade; apenas as linhas achatadas não são retidas,
+    sendo relidas do ficheiro (incrementalmente com 'ijson') na Fase 3.
+    Retorna (filename, file_data, file_properties_with_desc, parse_seconds).
+    """
+    started_at = time.perf_counter()
+    filename = os.path.basename(filepath)
+    schema_data = load_schema(filepath)
+    if not schema_data:
+        return filename, {'error': "Failed to load schema."}, {}, time.perf_counter() - started_at
+
+    property_fragments = {}
+    ref_aliases = {}
+    file_properties_with_desc = extract_all_properties_with_descriptions(
+        schema_data, filename_context=filename, fragments_map=property_fragments,
+        ref_aliases=ref_aliases, resolver=get_ref_resolver(os.path.dirname(os.path.abspath(filepath)))
+    )
+    if streaming_mode:
+        file_data = {
+            'row_source': functools.partial(iter_flattened_schema_rows_from_file, filepath),
+            'max_row_depth': get_flattened_schema_depth(schema_data),
+            'property_fragments': property_fragments,
+            'ref_aliases': ref_aliases
+        }
     else:
-        collected_rows.append({'keys': list(current_keys), 'value': schema_data})
-    return collected_rows
\ No newline at end of file
+        file_data = {
+            'schema_data': schema_data,
+            'collected_rows_for_excel': flatten_schema_for_excel(schema_data),
+            'property_fragments': property_fragments,
+            'ref_aliases': ref_aliases
+        }
+    return filename, file_data, file_properties_with_desc, time.perf_counter() - started_at
@@ -0,0 +1,244 @@
+# src/similarity_index.py
+import json
+import os
+
+import numpy as np
+
+import pre_classifier
+import run_metrics
+
+SIMILARITY_SEARCH_CHUNK_SIZE = 256 # Query rows per matrix product (bounds the similarity matrix to chunk x index rows)
+_INITIAL_CAPACITY = 1024
+
+
+def build_field_text(field_path, field_description):
+    """Text embedded for a field (field_path: tuple of path segments): its name, its path in the schema and its description."""
+    return f"{field_path[-1]}\n{'.'.join(field_path)}\n{field_description or ''}"
+
+
+def normalize_rows(vectors):
+    """float32 copy of vectors with unit-length rows (zero rows are left at zero), so dot products are cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    row_norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(row_norms > 0, row_norms, 1.0)
+
+
+class EmbeddingIndex:
+    """
+    Exact nearest-neighbour index of unit-length embeddings: one float32 matrix (grown by doubling) searched with
+    chunked matrix products, so a lookup against 100k+ fields is a single BLAS call per chunk of queries.
+    Each row carries a payload (the analyzed field's key and verdict). With index_path the rows are loaded from and
+    saved to a .npz file (vectors, keys and JSON payloads), so the index persists between runs.
+    """
+
+    def __init__(self, index_path=None):
+        self.index_path = index_path
+        self._vectors = None
+        self._keys = []
+        self._payloads = []
+        self.dirty = False
+        if index_path and os.path.exists(index_path):
+            self._load()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _load(self):
+        try:
+            with np.load(self.index_path, allow_pickle=False) as index_file:
+                vectors = index_file["vectors"]
+                self._keys = index_file["keys"].tolist()
+                self._payloads = [json.loads(payload) for payload in index_file["payloads"].tolist()]
+        except Exception as e:
+            print(f"[SIMILARITY WARNING] Could not load the similarity index {self.index_path}: {e}. Starting an empty index.")
+            self._keys, self._payloads = [], []
+            return
+        self._vectors = np.array(vectors, dtype=np.float32)
+        print(f"[SIMILARITY INFO] {len(self._keys)} analyzed fields loaded from {self.index_path}.")
+
+    @run_metrics.instrument("save_similarity_index")
+    def save(self):
+        """Writes the index to index_path (atomically, through a temporary file) if rows were added."""
+        if not self.index_path or not self.dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        temporary_path = f"{self.index_path}.tmp.npz"
+        np.savez(
+            temporary_path,
+            vectors=self._vectors[:len(self._keys)] if self._vectors is not None else np.zeros((0, 0), dtype=np.float32),
+            keys=np.array(self._keys, dtype=str),
+            payloads=np.array([json.dumps(payload, ensure_ascii=False) for payload in self._payloads], dtype=str)
+        )
+        os.replace(temporary_path, self.index_path)
+        self.dirty = False
+        print(f"[SIMILARITY INFO] Similarity index saved ({len(self._keys)} fields) to {self.index_path}.")
+
+    def add(self, vector, key, payload):
+        """Adds one unit-length vector with its key and payload; returns its row number."""
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        row_count = len(self._keys)
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            if row_count:
+                raise ValueError(f"Embedding dimension {vector.shape[0]} does not match the index ({self._vectors.shape[1]}).")
+            self._vectors = np.zeros((_INITIAL_CAPACITY, vector.shape[0]), dtype=np.float32)
+        elif row_count == self._vectors.shape[0]:
+            grown_vectors = np.zeros((row_count * 2, self._vectors.shape[1]), dtype=np.float32)
+            grown_vectors[:row_count] = self._vectors
+            self._vectors = grown_vectors
+        self._vectors[row_count] = vector
+        self._keys.append(key)
+        self._payloads.append(payload)
+        self.dirty = True
+        return row_count
+
+    def entry(self, row):
+        """(key, payload) of a row."""
+        return self._keys[row], self._payloads[row]
+
+    def search(self, query_vectors):
+        """
+        Best match of every unit-length query row: (rows, similarities) arrays, with row -1 and similarity -inf
+        when the index is empty or has another dimension.
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        best_rows = np.full(len(query_vectors), -1, dtype=np.int64)
+        best_similarities = np.full(len(query_vectors), -np.inf, dtype=np.float32)
+        row_count = len(self._keys)
+        if not row_count or not len(query_vectors) or self._vectors.shape[1] != query_vectors.shape[1]:
+            return best_rows, best_similarities
+        index_vectors = self._vectors[:row_count]
+        for chunk_start in range(0, len(query_vectors), SIMILARITY_SEARCH_CHUNK_SIZE):
+            chunk_similarities = query_vectors[chunk_start:chunk_start + SIMILARITY_SEARCH_CHUNK_SIZE] @ index_vectors.T
+            chunk_best_rows = chunk_similarities.argmax(axis=1)
+            best_rows[chunk_start:chunk_start + len(chunk_best_rows)] = chunk_best_rows
+            best_similarities[chunk_start:chunk_start + len(chunk_best_rows)] = chunk_similarities[np.arange(len(chunk_best_rows)), chunk_best_rows]
+        return best_rows, best_similarities
+
+    def match_or_add(self, query_vectors, keys, threshold):
+        """
+        Greedy grouping of query rows, in order: a query within threshold of a row already in the index (or of an
+        earlier query of the same call) is matched to the most similar one; otherwise it is added with payload None.
+        Returns one (row, similarity) per query; similarity is None for the queries that were added.
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        matches = []
+        for chunk_start in range(0, len(query_vectors), SIMILARITY_SEARCH_CHUNK_SIZE):
+            chunk_vectors = query_vectors[chunk_start:chunk_start + SIMILARITY_SEARCH_CHUNK_SIZE]
+            indexed_rows, indexed_similarities = self.search(chunk_vectors)
+            chunk_similarities = chunk_vectors @ chunk_vectors.T # Against the queries of this chunk added before
+            added_positions, added_rows = [], []
+            for position, query_vector in enumerate(chunk_vectors):
+                best_row, best_similarity = int(indexed_rows[position]), float(indexed_similarities[position])
+                if added_positions:
+                    added_similarities = chunk_similarities[position, added_positions]
+                    best_added = int(added_similarities.argmax())
+                    if added_similarities[best_added] > best_similarity:
+                        best_row, best_similarity = added_rows[best_added], float(added_similarities[best_added])
+                if best_row >= 0 and best_similarity >= threshold:
+                    matches.append((best_row, best_similarity))
+                    continue
+                added_positions.append(position)
+                added_rows.append(self.add(query_vector, keys[chunk_start + position], None))
+                matches.append((added_rows[-1], None))
+        return matches
+
+
+def build_similar_verdict(source_unique_key, source_result, similarity):
+    """Verdict reused from a similar analyzed field (source_unique_key), tagged with the similarity tier."""
+    return {
+        "pii_sensitivity_assessment": source_result.get("pii_sensitivity_assessment"),
+        "gdpr_justification": source_result.get("gdpr_justification"),
+        "analysis_tier": pre_classifier.TIER_SIMILARITY,
+        "similar_to": source_unique_key,
+        "confidence": round(float(similarity), 4)
+    }
+
+
+class SimilarityTier:
+    """
+    Phase 2 similarity tier: fields close enough (threshold) to a field analyzed by an earlier run (verdict_index, the
+    persisted EmbeddingIndex; None disables the tier) take its verdict, and near-duplicates of a field sent in this
+    run wait for its verdict instead of being sent too.
+    It works on the Phase 2 pending entries ({"field_ids": [...], ...} by representative cache key): a decided entry
+    gets its "result", "cache_new_members" = False (reused verdicts follow the current threshold, so they are never
+    cached) and set_results(field_ids, result) is called. embed_texts(texts) returns one vector per text, or None.
+    reuse_indexed_verdicts: False (force refresh) only groups this run's near-duplicates.
+    """
+
+    def __init__(self, verdict_index, threshold, embed_texts, set_results, reuse_indexed_verdicts=True):
+        self.verdict_index = verdict_index
+        self.threshold = threshold
+        self.embed_texts = embed_texts
+        self.set_results = set_results
+        self.reuse_indexed_verdicts = reuse_indexed_verdicts
+        self.active = verdict_index is not None
+        self.run_index = EmbeddingIndex()
+        self.reused_count = 0
+        self.follower_count = 0
+
+    def embed_fields(self, field_records):
+        """Unit-length embeddings of the field records (None when the tier is off or the embeddings failed)."""
+        if not self.active or not field_records:
+            return None
+        embeddings = self.embed_texts([build_field_text(field_record.path, field_record.description) for field_record in field_records])
+        if embeddings is None:
+            print("  [Phase 2 SIMILARITY] Embeddings unavailable: similarity tier disabled for the rest of this run.")
+            self.active = False
+            return None
+        return normalize_rows(embeddings)
+
+    def apply(self, fields_to_send, field_vectors, pending_by_cache_key):
+        """
+        Decides the fields (with a "cache_key") similar to an indexed field and makes near-duplicates of this run
+        "similar_followers" of the pending entry of the first one. Returns the fields still to send, each with its
+        "embedding" (added to the index by add_verdict once its verdict arrives).
+        """
+        if field_vectors is None:
+            return fields_to_send
+        indexed_matches = zip(*self.verdict_index.search(field_vectors)) if self.reuse_indexed_verdicts else [(-1, None)] * len(fields_to_send)
+        unmatched_fields = []
+        for field_to_analyze, field_vector, (row, similarity) in zip(fields_to_send, field_vectors, indexed_matches):
+            if row < 0 or similarity < self.threshold:
+                unmatched_fields.append((field_to_analyze, field_vector))
+                continue
+            source_unique_key, source_result = self.verdict_index.entry(row)
+            self._decide(pending_by_cache_key[field_to_analyze["cache_key"]], build_similar_verdict(source_unique_key, source_result, similarity))
+            self.reused_count += 1
+
+        fields_left = []
+        run_matches = self.run_index.match_or_add(
+            [field_vector for _, field_vector in unmatched_fields], [field_to_analyze["cache_key"] for field_to_analyze, _ in unmatched_fields], self.threshold
+        )
+        for (field_to_analyze, field_vector), (row, similarity) in zip(unmatched_fields, run_matches):
+            source_pending = pending_by_cache_key[self.run_index.entry(row)[0]] if similarity is not None else None
+            if source_pending is None or "result" in source_pending: # New source, or a source that failed (pipelined mode)
+                field_to_analyze["embedding"] = field_vector
+                fields_left.append(field_to_analyze)
+                continue
+            source_pending.setdefault("similar_followers", []).append((pending_by_cache_key[field_to_analyze["cache_key"]], similarity))
+            self.follower_count += 1
+        return fields_left
+
+    def add_verdict(self, field_to_analyze, source_unique_key, analysis_result):
+        """Indexes the verdict of an analyzed field sent with an "embedding", for later runs and fields."""
+        if "embedding" in field_to_analyze:
+            self.verdict_index.add(field_to_analyze["embedding"], source_unique_key, {
+                "pii_sensitivity_assessment": analysis_result.get("pii_sensitivity_assessment"),
+                "gdpr_justification": analysis_result.get("gdpr_justification")
+            })
+
+    def resolve_followers(self, pending, source_unique_key, analysis_result, reuse_verdict):
+        """Near-duplicates waiting for pending take its verdict (tagged with the source field), or its failure as is."""
+        for follower_pending, similarity in pending.pop("similar_followers", []):
+            self._decide(follower_pending, build_similar_verdict(source_unique_key, analysis_result, similarity) if reuse_verdict else analysis_result)
+
+    def save(self):
+        if self.verdict_index is not None:
+            self.verdict_index.save()
+
+    def _decide(self, pending, analysis_result):
+        pending["result"] = analysis_result
+        pending["cache_new_members"] = False
+        self.set_results(pending["field_ids"], analysis_result)
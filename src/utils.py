@@ -1,9 +1,13 @@
 # src/utils.py
+import hashlib
 import json
 import os
 import requests
 
+import run_metrics
+
 OLLAMA_ANALYSIS_CACHE_FILE = "ollama_analysis_cache.json" 
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # src -> project_root
 
 def load_prompt_template(prompt_filename):
     script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) 
@@ -20,6 +24,11 @@ def load_prompt_template(prompt_filename):
         print(f"[UTILS ERRO] Erro ao carregar prompt de {filepath}: {e}")
         return None
 
+def compute_content_hash(*parts):
+    """SHA-256 hex digest of the given parts (JSON-encoded, so part boundaries are unambiguous)."""
+    serialized_parts = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(serialized_parts.encode('utf-8')).hexdigest()
+
 def load_ollama_cache():
     # O cache é relativo à raiz do projeto onde main.py é executado
     project_root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # src -> project_root
@@ -34,6 +43,7 @@ def load_ollama_cache():
             print(f"[CACHE ERRO] Erro ao carregar cache Ollama de {cache_path}: {e}. Um novo cache será usado.")
     return {}
 
+@run_metrics.instrument("save_ollama_cache")
 def save_ollama_cache(cache_data):
     project_root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     cache_path = os.path.join(project_root_dir, OLLAMA_ANALYSIS_CACHE_FILE)
@@ -70,8 +80,10 @@ def _handle_ollama_request_exception(exception, log_prefix, response_text_on_err
 
     if isinstance(exception, requests.exceptions.HTTPError):
         error_key = "ERROR_OLLAMA_HTTP"
-        details = f"Status {exception.response.status_code if exception.response else 'N/A'}, Response: {response_text_on_error[:300]}..."
-        additional_info["status_code"] = exception.response.status_code if exception.response else 'N/A'
+        # Response.__bool__ is False for 4xx/5xx, so compare against None explicitly
+        status_code = exception.response.status_code if exception.response is not None else 'N/A'
+        details = f"Status {status_code}, Response: {response_text_on_error[:300]}..."
+        additional_info["status_code"] = status_code
     elif isinstance(exception, requests.exceptions.Timeout):
         error_key = "ERROR_OLLAMA_TIMEOUT"
         # details = f"Timeout of {OLLAMA_REQUEST_TIMEOUT}s" # OLLAMA_REQUEST_TIMEOUT não está definido aqui, passar como arg ou usar string fixa